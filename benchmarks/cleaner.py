@@ -0,0 +1,79 @@
+"""
+Compare the speed of scrapeghost's Cleaner with lxml.html.clean.Cleaner,
+checking that they produce the same output.
+
+Uses the pages from tests/test_pagination.py and a large synthetic page.
+
+    python benchmarks/cleaner.py
+"""
+
+import sys
+import copy
+import time
+import pathlib
+import lxml.html
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "tests"))
+
+from scrapeghost.cleaner import Cleaner  # noqa: E402
+from scrapeghost.utils import _tostr  # noqa: E402
+import test_pagination  # noqa: E402
+
+try:
+    from lxml.html.clean import Cleaner as LxmlCleaner
+except ImportError:  # pragma: no cover
+    # newer versions of lxml need the lxml_html_clean package
+    LxmlCleaner = None
+
+ROW = (
+    '<tr class="row" onclick="select({i})"><td style="color: red">'
+    '<a href="/people/{i}">Person {i}</a><!-- id {i} --></td>'
+    '<td><script>track({i});</script><form><input name="q{i}"></form>'
+    "Notes about person {i}</td></tr>\n"
+)
+PAGES = {
+    "fixtures": [test_pagination.page1, test_pagination.page2, test_pagination.page3],
+    "large": [
+        "<html><head><title>People</title><style>td { color: blue; }</style>"
+        "</head><body><table>"
+        + "".join(ROW.format(i=i) for i in range(20000))
+        + "</table></body></html>"
+    ],
+}
+REPEAT = 5
+
+
+def timed(clean, docs: list) -> tuple[float, list[str]]:
+    """
+    Return the best time to clean copies of docs, and the output.
+    """
+    best = float("inf")
+    for _ in range(REPEAT):
+        copies = [copy.deepcopy(doc) for doc in docs]
+        start = time.perf_counter()
+        for doc in copies:
+            clean(doc)
+        best = min(best, time.perf_counter() - start)
+    return best, [_tostr(doc) for doc in copies]
+
+
+def main() -> None:
+    if LxmlCleaner is None:
+        sys.exit("lxml.html.clean is needed for comparison, install lxml_html_clean")
+    ours = Cleaner()
+    theirs = LxmlCleaner(remove_unknown_tags=False)
+    print(f"{'pages':<10}{'lxml ms':>10}{'ours ms':>10}{'speedup':>9}")
+    for name, pages in PAGES.items():
+        docs = [lxml.html.fromstring(page) for page in pages]
+        lxml_time, expected = timed(theirs, docs)
+        our_time, output = timed(ours, docs)
+        if output != expected:
+            sys.exit(f"{name}: output differs from lxml.html.clean.Cleaner")
+        print(
+            f"{name:<10}{lxml_time * 1000:>10.1f}{our_time * 1000:>10.1f}"
+            f"{lxml_time / our_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Measure peak memory of each stage of a scrape on large synthetic pages.
+
+The API is mocked, so this is free to run.  Peaks are measured with
+tracemalloc, which sees memory allocated by Python but not memory held
+by libxml2 for lxml trees, so the growth in maximum resident set size
+is reported alongside as a rough guide.
+
+    python benchmarks/memory.py                    # 1, 10 and 50MB pages
+    python benchmarks/memory.py --sizes 0.5,5      # chosen sizes, in MB
+    python benchmarks/memory.py --update-baseline  # record new baseline
+
+Exits with an error if any stage's peak exceeds the recorded baseline
+by more than TOLERANCE.  Sizes without a baseline are only reported.
+tests/test_memory.py runs the 0.5MB check as part of the test suite.
+"""
+
+import sys
+import json
+import pathlib
+import logging
+import resource
+import structlog
+import tracemalloc
+from unittest.mock import patch
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "tests"))
+
+from scrapeghost import SchemaScraper, CSS  # noqa: E402
+from scrapeghost.preprocessors import CleanHTML  # noqa: E402
+from scrapeghost.document import Document  # noqa: E402
+from scrapeghost.scrapers import _parse_url_or_html, _tag_chunks  # noqa: E402
+from scrapeghost.utils import _tostr  # noqa: E402
+from testutils import _mock_response  # noqa: E402
+
+BASELINE_PATH = pathlib.Path(__file__).parent / "memory_baseline.json"
+# peaks may grow this much (fraction) over the baseline before failing
+TOLERANCE = 0.5
+# and always by this much, so small stages aren't noisy
+SLACK = 256 * 1024
+MODEL = "gpt-3.5-turbo"
+CHUNK_TOKENS = 2000
+STAGES = ("parse", "clean", "tostr", "chunk_tags", "scrape", "api_responses")
+
+ROW = (
+    '<tr class="row"><td class="name"><a href="/people/{i}">Person {i}</a></td>'
+    '<td style="color: red">{i}@example.com</td><td>555-{i:04d}</td>'
+    "<td><script>track({i});</script>Notes about person {i}</td></tr>\n"
+)
+
+
+def synthetic_page(size: int) -> str:
+    """
+    A page of approximately size bytes, mostly one large table.
+    """
+    head = (
+        "<html><head><style>td { color: blue; }</style>"
+        "<script>var x = 1;</script></head><body><nav>Menu</nav>"
+        '<table id="people">\n'
+    )
+    rows = []
+    length = len(head)
+    i = 0
+    while length < size:
+        row = ROW.format(i=i)
+        rows.append(row)
+        length += len(row)
+        i += 1
+    return head + "".join(rows) + "</table></body></html>"
+
+
+def _max_rss() -> int:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Stage:
+    """
+    Context manager recording the peak Python memory allocated during
+    a stage, above what was allocated when it started.
+    """
+
+    def __init__(self, results: dict, name: str):
+        self.results = results
+        self.name = name
+
+    def __enter__(self) -> None:
+        tracemalloc.reset_peak()
+        self.start, _ = tracemalloc.get_traced_memory()
+        self.rss = _max_rss()
+
+    def __exit__(self, *exc: object) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        self.results[self.name] = {
+            "peak": peak - self.start,
+            "rss_growth": _max_rss() - self.rss,
+        }
+
+
+def profile(size: int) -> dict[str, dict[str, int]]:
+    """
+    Return {stage: {"peak": bytes, "rss_growth": bytes}} for a page of
+    size bytes.
+    """
+    html = synthetic_page(size)
+    results: dict = {}
+    # per-request logging would dominate the time taken
+    log_config = structlog.get_config()
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+    tracemalloc.start()
+    try:
+        with _Stage(results, "parse"):
+            doc = _parse_url_or_html(html)
+        with _Stage(results, "clean"):
+            (doc,) = CleanHTML()(doc)
+        with _Stage(results, "tostr"):
+            serialized = _tostr(doc)
+        del serialized
+        tags = doc.xpath("//tr")
+        with _Stage(results, "chunk_tags"):
+            page = Document(tags)
+            chunks = _tag_chunks(page, page.nodes, CHUNK_TOKENS, MODEL)
+        del chunks, page, tags, doc
+
+        scraper = SchemaScraper(
+            {"name": "str", "email": "str"},
+            [CSS("tr")],
+            models=[MODEL],
+            auto_split_length=CHUNK_TOKENS,
+            max_cost=1000,
+        )
+        with patch("scrapeghost.apicall.client.chat.completions.create") as create:
+            create.side_effect = lambda **kwargs: _mock_response(
+                content='[{"name": "Person", "email": "person@example.com"}]'
+            )
+            with _Stage(results, "scrape"):
+                response = scraper.scrape(html)
+        # memory held by the response's API responses once the scrape is done
+        before, _ = tracemalloc.get_traced_memory()
+        response.api_responses.clear()
+        after, _ = tracemalloc.get_traced_memory()
+        results["api_responses"] = {"peak": before - after, "rss_growth": 0}
+    finally:
+        tracemalloc.stop()
+        structlog.configure(**log_config)
+    return results
+
+
+def regressions(size_mb: float, results: dict, baseline: dict) -> list[str]:
+    """
+    Return a description of each stage whose peak exceeds the baseline.
+    """
+    problems = []
+    for stage, recorded in baseline.get(f"{size_mb:g}", {}).items():
+        limit = recorded * (1 + TOLERANCE) + SLACK
+        peak = results[stage]["peak"]
+        if peak > limit:
+            problems.append(
+                f"{size_mb:g}MB {stage}: {peak / 2**20:.1f}MB peak, "
+                f"baseline {recorded / 2**20:.1f}MB"
+            )
+    return problems
+
+
+def main() -> None:
+    sizes: list[float] = [1, 10, 50]
+    if "--sizes" in sys.argv:
+        sizes = [float(s) for s in sys.argv[sys.argv.index("--sizes") + 1].split(",")]
+    update = "--update-baseline" in sys.argv
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+
+    print(f"{'size':>5} {'stage':<14}{'peak MB':>9}{'rss MB':>9}")
+    problems = []
+    for size_mb in sizes:
+        results = profile(int(size_mb * 2**20))
+        for stage in STAGES:
+            r = results[stage]
+            print(
+                f"{size_mb:>4g}M {stage:<14}"
+                f"{r['peak'] / 2**20:>9.1f}{r['rss_growth'] / 2**20:>9.1f}"
+            )
+        if update:
+            baseline[f"{size_mb:g}"] = {s: results[s]["peak"] for s in STAGES}
+        else:
+            problems.extend(regressions(size_mb, results, baseline))
+
+    if update:
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"baseline written to {BASELINE_PATH}")
+    if problems:
+        print("\n".join(["memory regressions:"] + problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare serializers by prompt tokens, and optionally by extraction accuracy.
+
+Uses the pages and expected results from tests/test_pagination.py.
+
+    python benchmarks/serializers.py          # token counts only
+    python benchmarks/serializers.py --live   # also scrape (needs OPENAI_API_KEY)
+"""
+
+import sys
+import json
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "tests"))
+
+from scrapeghost import SchemaScraper  # noqa: E402
+from scrapeghost.scrapers import _parse_url_or_html  # noqa: E402
+from scrapeghost.serializers import SERIALIZERS  # noqa: E402
+from scrapeghost.utils import _tokens  # noqa: E402
+import test_pagination  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+FIXTURES = [
+    (page, json.loads(resp.choices[0].message.content)["results"])
+    for page, resp in [
+        (test_pagination.page1, test_pagination.resp1),
+        (test_pagination.page2, test_pagination.resp2),
+        (test_pagination.page3, test_pagination.resp3),
+    ]
+]
+
+
+def token_counts() -> dict[str, int]:
+    counts = {}
+    for name, serialize in SERIALIZERS.items():
+        scraper = SchemaScraper({}, serializer=name)
+        counts[name] = sum(
+            _tokens(MODEL, serialize(node))
+            for page, _ in FIXTURES
+            for node in scraper._apply_preprocessors(_parse_url_or_html(page), [])
+        )
+    return counts
+
+
+def accuracy(serializer: str) -> float:
+    scraper = SchemaScraper(
+        [{"name": "str", "url": "url"}], models=[MODEL], serializer=serializer
+    )
+    found = expected = 0
+    for page, results in FIXTURES:
+        data = scraper(page).data
+        got = {(item["name"], item["url"]) for item in data}
+        want = {(item["name"], item["url"]) for item in results}
+        found += len(got & want)
+        expected += len(want)
+    return found / expected
+
+
+def main() -> None:
+    live = "--live" in sys.argv
+    counts = token_counts()
+    print(
+        f"{'serializer':<12}{'tokens':>8}{'vs html':>9}"
+        + ("  accuracy" if live else "")
+    )
+    for name, count in counts.items():
+        line = f"{name:<12}{count:>8}{count / counts['html']:>9.0%}"
+        if live:
+            line += f"{accuracy(name):>10.0%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,6 @@ from .scrapers import (
     PaginatedSchemaScraper,
 )
 from .utils import cost_estimate
-from .preprocessors import CSS, XPath
+from .cassette import Cassette
+from .rowcache import RowCache
+from .preprocessors import CSS, XPath, RelevancePruner
@@ -1,12 +1,16 @@
 """
 Module for making OpenAI API calls.
 """
+
 import os
 import time
+import threading
 import openai
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dataclasses import dataclass
 from openai import OpenAI
-from typing import Callable
+from typing import Any, Callable
 
 from .errors import (
     ScrapeghostError,
@@ -14,12 +18,16 @@ from .errors import (
     MaxCostExceeded,
     BadStop,
 )
-from .responses import Response
+from .responses import Response, ApiUsage
 from .utils import (
     logger,
-    _tokens,
+    _encoding,
+    _count_tokens,
+    TokenEstimator,
 )
 from .models import _model_dict
+from .stats import StatsCollector
+from .cassette import Cassette
 
 Postprocessor = Callable[[Response, "OpenAiCall"], Response]
 
@@ -41,6 +49,42 @@ class RetryRule:
     retry_errors: tuple = RETRY_ERRORS
 
 
+@dataclass
+class HedgeRule:
+    """
+    If a request takes longer than the given percentile of recent
+    response times, send a duplicate request and use whichever
+    finishes first.
+
+    * percentile - percentile of recent response times to wait for
+    * min_samples - number of response times needed before hedging
+    * window - number of recent response times to consider
+    * model - model to send the duplicate request to, defaults to the
+      same model
+    """
+
+    percentile: float = 95
+    min_samples: int = 20
+    window: int = 200
+    model: str | None = None
+
+
+# how much of each API response to keep on Response.api_responses
+API_RESPONSE_RETENTION = ("full", "usage", "none")
+
+
+def _attach_failed(e: BaseException, responses: list[Response]) -> None:
+    """
+    Record responses paid for before e was raised on e.failed_responses,
+    so that callers that retry can still account for their cost.
+    """
+    e.failed_responses = responses + getattr(e, "failed_responses", [])  # type: ignore
+
+
+# approximate prompt tokens used by each message's formatting
+MESSAGE_TOKENS = 4
+
+
 class OpenAiCall:
     _default_postprocessors: list[Postprocessor] = []
 
@@ -56,28 +100,50 @@ class OpenAiCall:
         postprocessors: list | None = None,
         # retry rules
         retry: RetryRule = RetryRule(1, 30),
+        # memory
+        keep_api_responses: str = "full",
+        # record/replay
+        cassette: Cassette | None = None,
+        # tail latency
+        hedge: HedgeRule | None = None,
     ):
-        self.total_prompt_tokens = 0
-        self.total_completion_tokens = 0
-        self.total_cost: float = 0
+        if keep_api_responses not in API_RESPONSE_RETENTION:
+            raise ValueError(
+                f"keep_api_responses must be one of {API_RESPONSE_RETENTION}, "
+                f"got {keep_api_responses!r}"
+            )
+        self.keep_api_responses = keep_api_responses
+        self.cassette = cassette
+        self.stats_collector = StatsCollector()
         self.max_cost = max_cost
-        self.models = models
+        # copied so that changes to the caller's list don't affect the scraper
+        self.models = list(models)
         self.retry = retry
-        if model_params is None:
-            model_params = {}
-        self.model_params = model_params
+        if hedge and hedge.model and hedge.model not in models:
+            raise ValueError(f"hedge model {hedge.model} must be one of {models}")
+        self.hedge = hedge
+        # recent response times, used to decide when to hedge
+        self._api_times: deque[float] = deque(maxlen=hedge.window if hedge else 0)
+        # guards per-scraper state, a scraper may be shared between threads
+        self._stats_lock = threading.Lock()
+        # encoding name -> estimator calibrated from this scraper's requests
+        self._token_estimators: dict[str, TokenEstimator] = {}
         # default temperature to 0, deterministic
-        if "temperature" not in model_params:
-            model_params["temperature"] = 0
+        # (copied so that the caller's dict isn't modified)
+        self.model_params = {"temperature": 0, **(model_params or {})}
+
+        # strict JSON schema sent to models that support structured outputs
+        self.response_schema: dict | None = None
 
         self.system_messages = []
         if extra_instructions:
             self.system_messages.extend(extra_instructions)
 
+        # copied so that instances never share a list
         if postprocessors is None:
-            self.postprocessors = self._default_postprocessors
+            self.postprocessors = list(self._default_postprocessors)
         else:
-            self.postprocessors = postprocessors
+            self.postprocessors = list(postprocessors)
 
     def _raw_api_request(
         self,
@@ -99,25 +165,18 @@ class OpenAiCall:
             raise MaxCostExceeded(
                 f"Total cost {self.total_cost:.2f} exceeds max cost {self.max_cost:.2f}"
             )
-        json_mode = (
-            {"response_format": "json_object"} if _model_dict[model].json_mode else {}
-        )
         start_t = time.time()
-        completion = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            **self.model_params,
-            **json_mode,  # type: ignore
-        )
+        completion, model = self._hedged_create(model, messages, response)
         elapsed = time.time() - start_t
-        if completion.usage:
-            p_tokens = completion.usage.prompt_tokens
-            c_tokens = completion.usage.completion_tokens
-        else:
-            raise ScrapeghostError("no usage data returned")
-        cost = _model_dict[model].cost(c_tokens, p_tokens)
+        p_tokens, c_tokens, cost = self._usage(model, completion)
+        self.token_estimator(model).calibrate(
+            sum(len(msg["content"]) for msg in messages),
+            # each message adds a few tokens of formatting
+            p_tokens - MESSAGE_TOKENS * len(messages),
+        )
         logger.info(
             "API response",
+            model=model,
             duration=elapsed,
             prompt_tokens=p_tokens,
             completion_tokens=c_tokens,
@@ -127,15 +186,24 @@ class OpenAiCall:
 
         # Note: All modifications to response should be additive, so that
         #       this method can be called multiple times to build a response.
-        response.api_responses.append(completion)
-        response.total_prompt_tokens += p_tokens
-        response.total_completion_tokens += c_tokens
-        response.total_cost += cost
+        if self.keep_api_responses == "full":
+            response.api_responses.append(completion)
+        elif self.keep_api_responses == "usage":
+            response.api_responses.append(
+                ApiUsage(
+                    model=model,
+                    prompt_tokens=p_tokens,
+                    completion_tokens=c_tokens,
+                    cost=cost,
+                    api_time=elapsed,
+                    finish_reason=completion.choices[0].finish_reason,
+                )
+            )
         response.api_time += elapsed
-        self.total_prompt_tokens += p_tokens
-        self.total_completion_tokens += c_tokens
-        self.total_cost += cost
         choice = completion.choices[0]
+        self._add_usage(
+            response, model, p_tokens, c_tokens, cost, elapsed, choice.finish_reason
+        )
         if choice.finish_reason != "stop":
             raise BadStop(
                 f"OpenAI did not stop: {choice.finish_reason} "
@@ -143,17 +211,194 @@ class OpenAiCall:
                 f"completion_tokens={c_tokens})"
             )
         response.data = choice.message.content  # type: ignore
+        response.model = model
         return response
 
-    def _api_request(self, html: str) -> Response:
+    def _request_params(self, model: str, messages: list[dict[str, str]]) -> dict:
+        if self.response_schema and _model_dict[model].structured_outputs:
+            response_format = {
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "scrape",
+                        "strict": True,
+                        "schema": self.response_schema,
+                    },
+                }
+            }
+        elif _model_dict[model].json_mode:
+            response_format = {"response_format": {"type": "json_object"}}
+        else:
+            response_format = {}
+        return dict(
+            model=model,
+            messages=messages,
+            **self.model_params,
+            **response_format,
+        )
+
+    def _create(self, params: dict) -> Any:
+        start_t = time.time()
+        if self.cassette:
+            completion = self.cassette.request(client.chat.completions.create, **params)
+        else:
+            completion = client.chat.completions.create(**params)
+        with self._stats_lock:
+            self._api_times.append(time.time() - start_t)
+        return completion
+
+    def _hedge_delay(self) -> float | None:
+        """
+        Seconds to wait before hedging, or None if not hedging.
+        """
+        with self._stats_lock:
+            times = sorted(self._api_times)
+        if not self.hedge or len(times) < self.hedge.min_samples:
+            return None
+        index = min(len(times) - 1, int(len(times) * self.hedge.percentile / 100))
+        return times[index]
+
+    def _hedged_create(
+        self, model: str, messages: list[dict[str, str]], response: Response
+    ) -> tuple[Any, str]:
+        """
+        Make the API request, hedging it if it is slow.
+
+        Returns the completion and the model that produced it.
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._create(self._request_params(model, messages)), model
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            futures = {
+                executor.submit(
+                    self._create, self._request_params(model, messages)
+                ): model
+            }
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                hedge_model = self.hedge.model or model  # type: ignore
+                self.stats_collector.record_hedge()
+                logger.info("hedging request", model=hedge_model, delay=delay)
+                futures[
+                    executor.submit(
+                        self._create, self._request_params(hedge_model, messages)
+                    )
+                ] = hedge_model
+            pending = set(futures)
+            error: BaseException | None = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # the sync client can't abort a request in flight,
+                        # so a slower one is accounted when it finishes
+                        for loser in pending:
+                            loser.cancel()
+                            response.pending.append(
+                                self._account_loser(loser, futures[loser])
+                            )
+                        return future.result(), futures[future]
+                    error = error or future.exception()
+            raise error  # type: ignore
+        finally:
+            executor.shutdown(wait=False)
+
+    def _account_loser(self, loser: Future, model: str) -> Future:
+        """
+        Return a future resolving to the usage of a hedged request that
+        lost, recorded in the scraper's stats when it finishes.
+        """
+        usage: Future = Future()
+
+        def record(future: Future) -> None:
+            if future.cancelled() or future.exception() is not None:
+                usage.set_result(None)
+                return
+            completion = future.result()
+            try:
+                p_tokens, c_tokens, cost = self._usage(model, completion)
+            except ScrapeghostError:
+                usage.set_result(None)
+                return
+            logger.info("hedged request finished", model=model, cost=cost)
+            self.stats_collector.record_request(
+                model,
+                p_tokens,
+                c_tokens,
+                cost,
+                None,
+                completion.choices[0].finish_reason,
+            )
+            usage.set_result((p_tokens, c_tokens, cost))
+
+        loser.add_done_callback(record)
+        return usage
+
+    def token_estimator(self, model: str) -> TokenEstimator:
+        """
+        Return the token estimator for the model's encoding.
+        """
+        name = _encoding(model).name
+        with self._stats_lock:
+            if name not in self._token_estimators:
+                self._token_estimators[name] = TokenEstimator()
+            return self._token_estimators[name]
+
+    def _usage(self, model: str, completion: Any) -> tuple[int, int, float]:
+        if completion.usage:
+            p_tokens = completion.usage.prompt_tokens
+            c_tokens = completion.usage.completion_tokens
+        else:
+            raise ScrapeghostError("no usage data returned")
+        return p_tokens, c_tokens, _model_dict[model].cost(c_tokens, p_tokens)
+
+    def _add_usage(
+        self,
+        response: Response,
+        model: str,
+        p_tokens: int,
+        c_tokens: int,
+        cost: float,
+        api_time: float | None,
+        finish_reason: str | None,
+    ) -> None:
+        with self._stats_lock:
+            response.total_prompt_tokens += p_tokens
+            response.total_completion_tokens += c_tokens
+            response.total_cost += cost
+        self.stats_collector.record_request(
+            model, p_tokens, c_tokens, cost, api_time, finish_reason
+        )
+
+    def _api_request(
+        self,
+        html: str,
+        retry_bad_stop: bool = True,
+        models: list[str] | None = None,
+        system_messages: list[str] | None = None,
+        tokens: dict[str, int] | None = None,
+    ) -> Response:
         """
         Make an OpenAPI request, with retries and model upgrades.
 
         * html - the HTML to send to the API
-        * response - the Response object to augment
+        * retry_bad_stop - if False, BadStop is raised immediately instead
+          of retrying or upgrading the model (used when the caller can
+          split the HTML instead)
+        * models - models to use instead of self.models
+        * system_messages - system messages to use instead of
+          self.system_messages
+        * tokens - {encoding: tokens} for html, if already known from
+          its parts (e.g. the nodes of an auto-split chunk), used like
+          an estimate instead of estimating from its length
         """
         attempts = 0
         model_index = 0
+        models = models or self.models
+        system_messages = system_messages or self.system_messages
 
         response = Response()
 
@@ -165,14 +410,20 @@ class OpenAiCall:
                 # check this within retries, but before API call
                 # so that we don't waste an API call but can still
                 # upgrade models
-                model = self.models[model_index]
+                model = models[model_index]
                 model_data = _model_dict[model]
                 # this call is redundant for now since all models have the same
                 # tokenizer, but it's here for future-proofing
-                tokens = _tokens(model, html)
-                if tokens > model_data.max_tokens:
+                html_tokens = _count_tokens(
+                    model,
+                    html,
+                    model_data.max_tokens,
+                    self.token_estimator(model),
+                    (tokens or {}).get(_encoding(model).name),
+                )
+                if html_tokens > model_data.max_tokens:
                     raise TooManyTokens(
-                        f"HTML is {tokens} tokens, max for {model} is "
+                        f"HTML is {html_tokens} tokens, max for {model} is "
                         f"{model_data.max_tokens}"
                     )
 
@@ -180,13 +431,12 @@ class OpenAiCall:
                 logger.info(
                     "API request",
                     model=model,
-                    html_tokens=tokens,
+                    html_tokens=html_tokens,
                 )
                 self._raw_api_request(
                     model=model,
                     messages=[
-                        {"role": "system", "content": msg}
-                        for msg in self.system_messages
+                        {"role": "system", "content": msg} for msg in system_messages
                     ]
                     + [
                         {"role": "user", "content": html},
@@ -204,24 +454,30 @@ class OpenAiCall:
                     model=model,
                     attempts=attempts,
                 )
+                if isinstance(e, BadStop) and not retry_bad_stop:
+                    _attach_failed(e, [response])
+                    raise
                 if attempts < self.retry.max_retries + 1:
                     if isinstance(e, self.retry.retry_errors):
                         logger.warning("retry", wait=self.retry.retry_wait, model=model)
                         # try again with same model
+                        self.stats_collector.record_retry()
                         time.sleep(self.retry.retry_wait)
                         continue
-                    elif model_index < len(self.models) - 1:
+                    elif model_index < len(models) - 1:
                         # try next model
                         model_index += 1
-                        model = self.models[model_index]
+                        model = models[model_index]
                         logger.warning(
                             "retry",
                             wait=self.retry.retry_wait,
                             model=model,
                         )
+                        self.stats_collector.record_retry()
                         time.sleep(self.retry.retry_wait)
                         continue
                 # could not retry for whatever reason
+                _attach_failed(e, [response])
                 raise
 
     def _apply_postprocessors(self, response: Response) -> Response:
@@ -240,14 +496,32 @@ class OpenAiCall:
         Make an OpenAPI request, with retries and model upgrades, and
         postprocessing.
         """
-        return self._apply_postprocessors(self._api_request(html))
+        response = self._apply_postprocessors(self._api_request(html))
+        response._add_finished()
+        return response
+
+    @property
+    def total_cost(self) -> float:
+        return self.stats_collector.cost
+
+    @property
+    def total_prompt_tokens(self) -> int:
+        return self.stats_collector.prompt_tokens
+
+    @property
+    def total_completion_tokens(self) -> int:
+        return self.stats_collector.completion_tokens
+
+    @property
+    def hedged_requests(self) -> int:
+        return self.stats_collector.hedged_requests
 
     def stats(self) -> dict:
         """
         Return stats about the scraper.
+
+        Includes token and cost totals (overall, per model and per
+        finish reason), latency percentiles, tokens per second, and
+        retry, nudge, hedge and cache counts.
         """
-        return {
-            "total_prompt_tokens": self.total_prompt_tokens,
-            "total_completion_tokens": self.total_completion_tokens,
-            "total_cost": self.total_cost,
-        }
+        return self.stats_collector.snapshot()
@@ -0,0 +1,106 @@
+"""
+Record and replay API traffic.
+
+A cassette is a JSON lines file with one API request per line: the
+request parameters, the response, and how long the response took.
+Replaying a cassette makes runs deterministic and free, which is useful
+for tests, for profiling everything but the network, and for load
+testing concurrency settings.
+"""
+import json
+import time
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable
+
+from openai.types.chat import ChatCompletion
+
+from .errors import CassetteMiss
+
+CASSETTE_MODES = ("record", "replay")
+
+
+def _request_key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class Cassette:
+    """
+    Records API requests to, or replays them from, a file.
+
+    * path - the cassette file
+    * mode - "record" appends every request and response to the file,
+      "replay" serves responses from it without making API calls
+    * latency - when replaying, sleep for this multiple of the recorded
+      response time (1 simulates the original latency, 0 does not wait)
+
+    When replaying, identical requests are served in the order they were
+    recorded, and the last recorded response is repeated once they run out.
+    Requests that were never recorded raise CassetteMiss.
+    """
+
+    def __init__(self, path: str | Path, mode: str = "replay", latency: float = 0):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"mode must be one of {CASSETTE_MODES}, got {mode!r}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._recorded: dict[str, deque] = {}
+        if mode == "replay":
+            self._load()
+
+    def __str__(self) -> str:
+        return f"Cassette({self.path}, mode={self.mode})"
+
+    def _load(self) -> None:
+        with self.path.open() as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._recorded.setdefault(
+                    _request_key(entry["request"]), deque()
+                ).append(entry)
+
+    def request(self, create: Callable[..., Any], **params: Any) -> Any:
+        """
+        Make a request with create (recording it), or replay it.
+        """
+        if self.mode == "record":
+            return self._record(create, params)
+        return self._replay(params)
+
+    def _record(self, create: Callable[..., Any], params: dict) -> Any:
+        start_t = time.time()
+        completion = create(**params)
+        elapsed = time.time() - start_t
+        line = json.dumps(
+            {
+                "request": params,
+                "response": completion.model_dump(),
+                "elapsed": elapsed,
+            },
+            default=str,
+        )
+        # requests may be made from several threads
+        with self._lock:
+            with self.path.open("a") as f:
+                f.write(line + "\n")
+        return completion
+
+    def _replay(self, params: dict) -> ChatCompletion:
+        key = _request_key(params)
+        with self._lock:
+            entries = self._recorded.get(key)
+            if not entries:
+                raise CassetteMiss(
+                    f"no recorded response for {params.get('model')} request "
+                    f"in {self.path}"
+                )
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.latency:
+            time.sleep(entry["elapsed"] * self.latency)
+        # built without validation, so responses are returned as recorded
+        return ChatCompletion.construct(**entry["response"])
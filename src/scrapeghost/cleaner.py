@@ -0,0 +1,335 @@
+"""
+A single-pass HTML cleaner.
+
+Produces the same output as lxml.html.clean.Cleaner with the same
+options (though unknown tags are kept by default), but walks the tree
+once, visiting each element a single time, including the contents of
+removed elements.  It doesn't depend on lxml's clean module, which
+newer versions of lxml ship as a separate package.
+"""
+import re
+from urllib.parse import unquote_plus, urlsplit
+
+import lxml.etree
+import lxml.html
+from lxml.html import defs
+
+XHTML_PREFIX = "{http://www.w3.org/1999/xhtml}"
+# attributes that lxml checks for links (see HtmlElement.iterlinks)
+LINK_ATTRS = defs.link_attrs
+OBJECT_LINK_ATTRS = frozenset(("codebase", "classid", "data"))
+# tags that are only sometimes removed, depending on their attributes
+SPECIAL_TAGS = frozenset(("style", "link"))
+# attributes holding the URLs of embedded content, checked against host_whitelist
+EMBED_LINK_ATTRS = {
+    "script": ("src",),
+    "link": ("href",),
+    "applet": ("code", "object"),
+    "iframe": ("src",),
+    "embed": ("src",),
+    "layer": ("src",),
+    "a": ("href",),
+}
+
+_substitute_whitespace = re.compile(r"[\s\x00-\x08\x0B\x0C\x0E-\x19]+").sub
+_find_image_dataurls = re.compile(r"data:image/(.+?);base64,", re.I).findall
+_possibly_malicious_schemes = re.compile(
+    r"(javascript|jscript|livescript|vbscript|data|about|mocha):", re.I
+).findall
+_is_unsafe_image_type = re.compile(r"(xml|svg)", re.I).search
+_replace_css_javascript = re.compile(r"expression\s*\(.*?\)", re.S | re.I).sub
+_replace_css_import = re.compile(r"@\s*import", re.I).sub
+_substitute_comments = re.compile(r"/\*.*?\*/", re.S).sub
+_looks_like_tag_content = re.compile(r"</?[a-zA-Z]+|\son[a-zA-Z]+\s*=", re.A).search
+_css_urls = re.compile(r"""url\(("[^"]*"|'[^']*'|[^)]*)\)""", re.I)
+_css_imports = re.compile(r'@import "(.*?)"')
+_conditional_comment = re.compile(r"\[if[\s\n\r]+.*?][\s\n\r]*>", re.I | re.S).search
+
+
+def _has_javascript_scheme(s: str) -> bool:
+    safe_image_urls = 0
+    for image_type in _find_image_dataurls(s):
+        if _is_unsafe_image_type(image_type):
+            return True
+        safe_image_urls += 1
+    return len(_possibly_malicious_schemes(s)) > safe_image_urls
+
+
+def _is_javascript_link(link: str) -> bool:
+    # links like "j a v a s c r i p t:" might be interpreted by browsers
+    return _has_javascript_scheme(_substitute_whitespace("", unquote_plus(link)))
+
+
+def _has_sneaky_javascript(style: str) -> bool:
+    style = _substitute_comments("", style)
+    style = _substitute_whitespace("", style.replace("\\", "")).lower()
+    return (
+        _has_javascript_scheme(style)
+        or "expression(" in style
+        or "@import" in style
+        or "</noscript" in style
+        or bool(_looks_like_tag_content(style))
+    )
+
+
+def _blank_css_link(match: re.Match) -> str:
+    link = match.group(1)
+    quote = link[:1] if link[:1] in ("'", '"') else ""
+    if not _is_javascript_link(link[1:-1] if quote else link):
+        return match.group(0)
+    whole = match.group(0)
+    start, end = match.start(1) - match.start(), match.end(1) - match.start()
+    return whole[:start] + quote * 2 + whole[end:]
+
+
+def _clean_css(css: str, imports: bool = True) -> str | None:
+    """
+    Return css without javascript, or None if it can't be made safe.
+
+    Links with javascript are blanked first, as lxml's Cleaner does
+    when it rewrites links, then anything else suspicious is removed.
+    """
+    css = _css_urls.sub(_blank_css_link, css)
+    if imports:
+        css = _css_imports.sub(_blank_css_link, css)
+    css = _replace_css_import("", _replace_css_javascript("", css))
+    return None if _has_sneaky_javascript(css) else css
+
+
+class Cleaner:
+    """
+    Remove scripts, styles, comments, forms and other unwanted tags.
+
+    Options have the same names and defaults as lxml.html.clean.Cleaner:
+
+    * scripts - remove <script> elements
+    * javascript - remove javascript: links and javascript in CSS
+    * comments, processing_instructions - remove them
+    * style - remove <style> elements and style attributes
+    * inline_style - remove style attributes (defaults to style)
+    * links - remove <link> elements
+    * meta - remove <meta> elements
+    * page_structure - unwrap <html>, <head> and <title>
+    * embedded - remove plugins (<applet>), unwrapping <object>, <embed>,
+      <iframe>, <layer> and <param>
+    * frames - remove frames
+    * forms - unwrap <form>, removing its fields
+    * annoying_tags - unwrap <blink> and <marquee>
+    * kill_tags - other tags to remove along with their content
+    * remove_tags - other tags to unwrap, keeping their content
+    * safe_attrs_only, safe_attrs - remove attributes not in safe_attrs
+    * allow_tags - unwrap all tags but these
+    * remove_unknown_tags - unwrap tags that aren't known HTML tags
+    * add_nofollow - add rel="nofollow" to links
+    * host_whitelist, whitelist_tags - keep embedded content (by default
+      <iframe> and <embed>) from these hosts
+
+    Unlike lxml's Cleaner, remove_unknown_tags defaults to False, since
+    lxml's list of tags is outdated, and links are never rewritten except
+    to blank out javascript.
+    """
+
+    def __init__(
+        self,
+        *,
+        scripts: bool = True,
+        javascript: bool = True,
+        comments: bool = True,
+        style: bool = False,
+        inline_style: bool | None = None,
+        links: bool = True,
+        meta: bool = True,
+        page_structure: bool = True,
+        processing_instructions: bool = True,
+        embedded: bool = True,
+        frames: bool = True,
+        forms: bool = True,
+        annoying_tags: bool = True,
+        kill_tags: set[str] | None = None,
+        remove_tags: set[str] | None = None,
+        safe_attrs_only: bool = True,
+        safe_attrs: set[str] | frozenset[str] = defs.safe_attrs,
+        allow_tags: set[str] | None = None,
+        remove_unknown_tags: bool = False,
+        add_nofollow: bool = False,
+        host_whitelist: tuple[str, ...] | set[str] = (),
+        whitelist_tags: set[str]
+        | frozenset[str]
+        | None = frozenset(("iframe", "embed")),
+    ):
+        if allow_tags and remove_unknown_tags:
+            raise ValueError(
+                "It does not make sense to pass in both "
+                "allow_tags and remove_unknown_tags"
+            )
+        self.javascript = javascript
+        self.comments = comments
+        self.processing_instructions = processing_instructions
+        self.style = style
+        self.inline_style = style if inline_style is None else inline_style
+        # only stylesheets are removed if links are kept
+        self.stylesheets = not links and (style or javascript)
+        self.safe_attrs = frozenset(safe_attrs) if safe_attrs_only else None
+        # the default safe attributes never include event handlers
+        self.event_attrs = self.safe_attrs != defs.safe_attrs
+        self.allow_tags = (
+            frozenset(defs.tags) if remove_unknown_tags else frozenset(allow_tags or ())
+        )
+        self.add_nofollow = add_nofollow
+        self.host_whitelist = frozenset(host_whitelist)
+        self.whitelist_tags = whitelist_tags
+
+        self.kill_tags = set(kill_tags or ())
+        self.remove_tags = set(remove_tags or ())
+        for enabled, kill, remove in (
+            (scripts, {"script"}, ()),
+            (style, {"style"}, ()),
+            (links, {"link"}, ()),
+            (meta, {"meta"}, ()),
+            (page_structure, (), {"head", "html", "title"}),
+            (embedded, {"applet"}, {"iframe", "embed", "layer", "object", "param"}),
+            (frames, defs.frame_tags, ()),
+            (forms, {"button", "input", "select", "textarea"}, {"form"}),
+            (annoying_tags, (), {"blink", "marquee"}),
+        ):
+            if enabled:
+                self.kill_tags.update(kill)
+                self.remove_tags.update(remove)
+
+    def __call__(self, doc: lxml.html.HtmlElement) -> None:
+        """
+        Clean doc in place.
+        """
+        kill = []
+        remove = []
+        kill_tags = self.kill_tags
+        remove_tags = self.remove_tags
+        allow_tags = self.allow_tags
+        for el in doc.iter():
+            tag = el.tag
+            if tag.__class__ is not str:
+                if tag is lxml.etree.Comment:
+                    if self.comments or _conditional_comment(el.text or ""):
+                        kill.append(el)
+                elif tag is lxml.etree.ProcessingInstruction:
+                    if self.processing_instructions:
+                        kill.append(el)
+                continue
+
+            if tag.startswith(XHTML_PREFIX):
+                tag = el.tag = tag[len(XHTML_PREFIX) :]
+            elif tag == "image":
+                tag = el.tag = "img"
+
+            if (
+                tag in kill_tags
+                or (tag in SPECIAL_TAGS and self._kill_element(el, tag))
+            ) and not self._allow_element(el, tag):
+                kill.append(el)
+                continue
+            if (tag in remove_tags and not self._allow_element(el, tag)) or (
+                allow_tags and tag not in allow_tags
+            ):
+                remove.append(el)
+            names = el.keys()
+            if names:
+                self._clean_attributes(el, tag, names)
+            if self.add_nofollow and tag == "a":
+                self._add_nofollow(el)
+            if tag == "style" and self.javascript and el.text:
+                css = _clean_css(el.text)
+                if css is None:
+                    el.text = "/* deleted */"
+                elif css != el.text:
+                    el.text = css
+
+        if remove and remove[0] is doc:
+            # the root can't be unwrapped, so it is renamed instead
+            remove.pop(0)
+            doc.tag = "div"
+            doc.attrib.clear()
+        elif kill and kill[0] is doc:
+            # or removed, so it is emptied, along with everything in it
+            if doc.tag != "html":
+                doc.tag = "div"
+            doc.clear()
+            kill = remove = []
+
+        # innermost first, elements inside removed ones are visited too
+        for el in reversed(kill):
+            el.drop_tree()
+        for el in remove:
+            el.drop_tag()
+
+    def _kill_element(self, el: lxml.html.HtmlElement, tag: str) -> bool:
+        if tag == "style" and self.javascript and not self.style:
+            return el.get("type", "").lower().strip() == "text/javascript"
+        if tag == "link" and self.stylesheets:
+            return "stylesheet" in el.get("rel", "").lower()
+        return False
+
+    def _allow_element(self, el: lxml.html.HtmlElement, tag: str) -> bool:
+        """
+        Return True if el is embedded content from a whitelisted host.
+        """
+        if not self.host_whitelist or tag not in EMBED_LINK_ATTRS:
+            return False
+        if self.whitelist_tags is not None and tag not in self.whitelist_tags:
+            return False
+        for name in EMBED_LINK_ATTRS[tag]:
+            url = el.get(name)
+            if not url:
+                return False
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                return False
+            if parts.hostname not in self.host_whitelist:
+                return False
+        return True
+
+    def _add_nofollow(self, el: lxml.html.HtmlElement) -> None:
+        # only links elsewhere, not to fragments of the page
+        href = (el.get("href") or "").strip(" \t\r\n")
+        if not href or href[0] == "#":
+            return
+        rel = el.get("rel")
+        if not rel:
+            el.set("rel", "nofollow")
+        elif " nofollow " not in f" {rel} ":
+            el.set("rel", f"{rel} nofollow")
+
+    def _clean_attributes(
+        self, el: lxml.html.HtmlElement, tag: str, names: list[str]
+    ) -> None:
+        safe_attrs = self.safe_attrs
+        if safe_attrs is not None and not safe_attrs.issuperset(names):
+            attrib = el.attrib
+            for name in names:
+                if name not in safe_attrs:
+                    del attrib[name]
+            names = el.keys()
+        if not self.javascript:
+            if self.inline_style and "style" in names:
+                del el.attrib["style"]
+            return
+        if self.event_attrs:
+            for name in names:
+                if name.startswith("on"):
+                    del el.attrib[name]
+        link_attrs = OBJECT_LINK_ATTRS if tag == "object" else LINK_ATTRS
+        for name in names:
+            if name in link_attrs:
+                link = el.get(name)
+                # a scheme needs a colon, which may be escaped
+                if ("%" in link or ":" in link) and _is_javascript_link(link):
+                    el.set(name, "")
+        if "style" in names and el.get("style") is not None:
+            if self.inline_style:
+                del el.attrib["style"]
+            else:
+                old = el.get("style")
+                css = _clean_css(old, imports=False)
+                if css is None:
+                    del el.attrib["style"]
+                elif css != old:
+                    el.set("style", css)
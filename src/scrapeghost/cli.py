@@ -1,19 +1,36 @@
+import sys
 import json
+import hashlib
 import pathlib
 import logging
 import structlog
 import typer
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator
 from .scrapers import SchemaScraper
 from .preprocessors import CSS, XPath
 
 
 def scrape(
-    url: str,
+    url: list[str] = typer.Argument(
+        None, help="URL(s) to scrape, or - to read URLs from stdin"
+    ),
+    url_file: pathlib.Path = typer.Option(
+        None, help="File with one URL per line to scrape"
+    ),
     xpath: str = typer.Option(None, help="XPath selector to narrow the scrape"),
     css: str = typer.Option(None, help="CSS selector to narrow the scrape"),
     schema: str = typer.Option(None, help="Schema to use for scraping"),
     schema_file: pathlib.Path = typer.Option(None, help="Path to schema.json file"),
     gpt4: bool = typer.Option(False, help="Use GPT-4 instead of GPT-3.5-turbo"),
+    auto_split: int = typer.Option(
+        0, help="Split pages into chunks of this many tokens"
+    ),
+    concurrency: int = typer.Option(1, help="Number of pages to scrape at once"),
+    cache_dir: pathlib.Path = typer.Option(
+        None, help="Directory of cached results, cached pages are not scraped again"
+    ),
+    max_cost: float = typer.Option(1, help="Maximum total cost in dollars"),
     verbosity: int = typer.Option(
         0, "-v", "--verbose", count=True, help="Verbosity level 0-2"
     ),
@@ -23,19 +40,133 @@ def scrape(
             schema = f.read()
     if not schema:
         raise typer.BadParameter("You must provide a schema or schema_file.")
+    url = url or []
+    if not url and not url_file:
+        raise typer.BadParameter("You must provide a URL or url_file.")
 
     log_level = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}[verbosity]
     structlog.configure(
         wrapper_class=structlog.make_filtering_bound_logger(log_level),
     )
 
-    scraper = SchemaScraper(schema, models=["gpt-4"] if gpt4 else ["gpt-3.5-turbo"])
+    extra_preprocessors: list = []
     if xpath:
-        scraper.preprocessors.append(XPath(xpath))
+        extra_preprocessors.append(XPath(xpath))
     if css:
-        scraper.preprocessors.append(CSS(css))
-    result = scraper(url)
-    typer.echo(json.dumps(result.data))
+        extra_preprocessors.append(CSS(css))
+    scraper = SchemaScraper(
+        schema,
+        extra_preprocessors,
+        models=["gpt-4"] if gpt4 else ["gpt-3.5-turbo"],
+        auto_split_length=auto_split,
+        max_cost=max_cost,
+    )
+    cache_key = [schema, xpath, css, gpt4, auto_split]
+
+    if len(url) == 1 and url != ["-"] and not url_file:
+        # a single page, print its data
+        result = _cached(scraper, cache_dir, cache_key, url[0])
+        typer.echo(json.dumps(result["data"]))
+        return
+
+    # batch mode, print a JSON line for each page as it finishes
+    for record in _scrape_many(
+        scraper, _read_urls(url, url_file), concurrency, cache_dir, cache_key
+    ):
+        typer.echo(json.dumps(record))
+
+
+def _read_urls(urls: list[str], url_file: pathlib.Path | None) -> Iterator[str]:
+    for url in urls:
+        if url == "-":
+            yield from _lines(sys.stdin)
+        else:
+            yield url
+    if url_file:
+        with open(url_file) as f:
+            yield from _lines(f)
+
+
+def _lines(f: Iterable[str]) -> Iterator[str]:
+    for line in f:
+        if line.strip():
+            yield line.strip()
+
+
+def _record(scraper: SchemaScraper, url: str) -> dict:
+    result = scraper.scrape(url)
+    return {
+        "url": url,
+        "data": result.data,
+        "cost": result.total_cost,
+        "prompt_tokens": result.total_prompt_tokens,
+        "completion_tokens": result.total_completion_tokens,
+    }
+
+
+def _cached(
+    scraper: SchemaScraper, cache_dir: pathlib.Path | None, key: list, url: str
+) -> dict:
+    if not cache_dir:
+        return _record(scraper, url)
+    digest = hashlib.sha256(json.dumps(key + [url]).encode()).hexdigest()
+    path = cache_dir / f"{digest}.json"
+    scraper.stats_collector.record_cache(path.exists())
+    if path.exists():
+        record = json.loads(path.read_text())
+        record["cached"] = True
+        return record
+    record = _record(scraper, url)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(record))
+    return record
+
+
+def _scrape_many(
+    scraper: SchemaScraper,
+    urls: Iterable[str],
+    concurrency: int,
+    cache_dir: pathlib.Path | None,
+    cache_key: list,
+) -> Iterator[dict]:
+    """
+    Scrape URLs with a shared scraper, yielding a record for each page
+    as soon as it is done.  Failed pages are reported and skipped.
+    """
+
+    def scrape_one(url: str) -> dict:
+        try:
+            return _cached(scraper, cache_dir, cache_key, url)
+        except Exception as e:
+            return {"url": url, "error": f"{type(e).__name__}: {e}"}
+
+    urls = iter(urls)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, ThreadPoolExecutor(
+        max_workers=1
+    ) as reader:
+        pending: set = set()
+        # URLs are read in the background, so pages that finish while
+        # waiting for the next URL (e.g. on stdin) are written straight away
+        next_url: Future | None = reader.submit(next, urls, None)
+        while next_url or pending:
+            waiting = set(pending)
+            # only read ahead a little, so long inputs can be streamed
+            if next_url and len(pending) < concurrency:
+                waiting.add(next_url)
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done - {next_url}:
+                pending.remove(future)
+                yield future.result()
+            if next_url in done:
+                url = next_url.result()
+                next_url = None
+                if url is None:
+                    continue
+                if scraper.total_cost > scraper.max_cost:
+                    # max_cost reached, don't start any more pages
+                    continue
+                pending.add(executor.submit(scrape_one, url))
+                next_url = reader.submit(next, urls, None)
 
 
 def main() -> None:  # pragma: no cover
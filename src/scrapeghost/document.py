@@ -0,0 +1,94 @@
+"""
+Preprocessed nodes of a page, serialized once.
+
+Chunking, prompting and row caching all need the serialized text of
+the same nodes.  A Document serializes each node when it is created,
+and keeps each node's text and exact token count once it's needed, so
+nodes are never serialized or counted again when chunks are split or
+retried.
+
+Nodes are referred to by their index in the document, and chunks are
+sequences of indexes (ranges, when the nodes are contiguous), so a node
+takes little more memory than its text.
+"""
+from array import array
+from typing import Sequence
+
+import lxml.html
+
+from .serializers import Serializer
+from .utils import _encoding, _tokens, _tostr
+
+# token count of a node that hasn't been counted
+UNCOUNTED = -1
+
+
+class Document:
+    """
+    The preprocessed nodes of a page, serialized once.
+
+    Nodes are separated by newlines in the document's text.
+    """
+
+    def __init__(
+        self, elements: list[lxml.html.HtmlElement], serialize: Serializer = _tostr
+    ):
+        self.html = [serialize(el) for el in elements]
+        # exact token counts, in self.encoding, set when first counted
+        self.encoding: str | None = None
+        self._tokens = array("l", [UNCOUNTED]) * len(self.html)
+
+    def __len__(self) -> int:
+        return len(self.html)
+
+    @property
+    def nodes(self) -> range:
+        """
+        The indexes of all nodes.
+        """
+        return range(len(self.html))
+
+    @property
+    def text(self) -> str:
+        """
+        The whole document, joined when needed so it isn't kept twice.
+        """
+        return "\n".join(self.html)
+
+    def join(self, nodes: Sequence[int]) -> str:
+        html = self.html
+        return "\n".join([html[i] for i in nodes])
+
+    def tokens(self, node: int, model: str) -> int:
+        """
+        Return the exact number of tokens in node.
+
+        Counts are kept for the first model's encoding (all models
+        currently share one), and not kept for other encodings.
+        """
+        name = _encoding(model).name
+        if self.encoding is None:
+            self.encoding = name
+        elif name != self.encoding:
+            return _tokens(model, self.html[node])
+        if self._tokens[node] == UNCOUNTED:
+            self._tokens[node] = _tokens(model, self.html[node])
+        return self._tokens[node]
+
+    def known_tokens(self, nodes: Sequence[int]) -> dict[str, int]:
+        """
+        Return {encoding: tokens} for the text of nodes, from their
+        counts (and one token per newline), if they've all been counted.
+
+        Tokens can merge across the joins, so this is close to the
+        exact count rather than equal to it.
+        """
+        if self.encoding is None or not nodes:
+            return {}
+        counts = self._tokens
+        total = len(nodes) - 1
+        for i in nodes:
+            if counts[i] == UNCOUNTED:
+                return {}
+            total += counts[i]
+        return {self.encoding: total}
@@ -24,3 +24,7 @@ class InvalidJSON(ScrapeghostError):
 
 class PostprocessingError(ScrapeghostError):
     pass
+
+
+class CassetteMiss(ScrapeghostError):
+    pass
@@ -0,0 +1,401 @@
+"""
+Queues of scrape jobs, and workers that run them.
+
+A queue holds URLs to scrape along with the SchemaScraper configuration
+to use for each.  Any number of workers, in separate processes or on
+separate machines sharing the queue, claim jobs, scrape them, and write
+the results and their cost back to the queue.  Since the queue knows
+the cost of every finished job, and reserves a budget for every running
+job, workers can enforce a max_cost across all of them.
+"""
+import os
+import abc
+import json
+import math
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+
+from .scrapers import SchemaScraper
+from .utils import logger
+
+# seconds a job may run before it is assumed its worker died,
+# and it can be claimed again
+DEFAULT_LEASE = 3600
+# seconds to wait before claiming again when the rest of max_cost is
+# reserved by running jobs
+CLAIM_WAIT = 1.0
+
+
+@dataclass(slots=True)
+class Job:
+    """
+    A URL to scrape and the SchemaScraper keyword arguments to scrape it with.
+
+    config must be JSON serializable, so schemas must be given as a
+    dict or string rather than a pydantic model.
+    """
+
+    id: int
+    url: str
+    config: dict
+    # pending, running, done or failed
+    status: str = "pending"
+    worker: str | None = None
+    data: dict | list | str | None = None
+    error: str | None = None
+    cost: float = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # cost reserved from max_cost while the job is running
+    budget: float = 0
+    # when the job was claimed or finished
+    updated_at: float | None = None
+
+
+class JobQueue(abc.ABC):
+    """
+    Interface for job queues.
+
+    Subclasses must implement each method atomically, since they are
+    called concurrently by many workers.  A store such as Redis can be
+    supported by implementing these methods.
+
+    * lease - seconds after which a running job is assumed to be
+      abandoned (e.g. its worker died) and can be claimed again
+    """
+
+    lease: float = DEFAULT_LEASE
+
+    @abc.abstractmethod
+    def push(self, url: str, config: dict) -> int:
+        """Add a job, returning its id."""
+
+    @abc.abstractmethod
+    def claim(
+        self, worker: str, budget: float = math.inf, max_cost: float = math.inf
+    ) -> Job | None:
+        """
+        Mark the oldest pending (or abandoned) job as running and return it.
+
+        The job's budget is set to budget, or what is left of max_cost
+        after the cost of all jobs and the budgets of running jobs, if
+        that is less.  Returns None if there are no jobs or nothing is
+        left of max_cost.
+        """
+
+    @abc.abstractmethod
+    def finish(self, job: Job) -> None:
+        """Store a job's status, result, error and usage."""
+
+    @abc.abstractmethod
+    def total_cost(self) -> float:
+        """Cost of all finished jobs."""
+
+    @abc.abstractmethod
+    def jobs(self, status: str | None = None) -> list[Job]:
+        """All jobs, optionally only those with the given status."""
+
+
+class MemoryQueue(JobQueue):
+    """
+    In-process queue, shared by worker threads.  Useful for testing.
+    """
+
+    def __init__(self, lease: float = DEFAULT_LEASE) -> None:
+        self.lease = lease
+        self._jobs: list[Job] = []
+        self._lock = threading.Lock()
+
+    def push(self, url: str, config: dict) -> int:
+        with self._lock:
+            # round trip through JSON to catch the same errors as other queues
+            job = Job(len(self._jobs) + 1, url, json.loads(json.dumps(config)))
+            self._jobs.append(job)
+            return job.id
+
+    def claim(
+        self, worker: str, budget: float = math.inf, max_cost: float = math.inf
+    ) -> Job | None:
+        with self._lock:
+            now = time.time()
+            expired = now - self.lease
+            running = [
+                job
+                for job in self._jobs
+                if job.status == "running" and job.updated_at > expired  # type: ignore
+            ]
+            remaining = (
+                max_cost
+                - sum(job.cost for job in self._jobs)
+                - sum(job.budget for job in running)
+            )
+            if remaining <= 0:
+                return None
+            for job in self._jobs:
+                if job.status == "pending" or (
+                    job.status == "running" and job not in running
+                ):
+                    job.status = "running"
+                    job.worker = worker
+                    job.budget = min(budget, remaining)
+                    job.updated_at = now
+                    return Job(
+                        job.id,
+                        job.url,
+                        job.config,
+                        job.status,
+                        worker,
+                        budget=job.budget,
+                        updated_at=now,
+                    )
+        return None
+
+    def finish(self, job: Job) -> None:
+        with self._lock:
+            job.updated_at = time.time()
+            self._jobs[job.id - 1] = job
+
+    def total_cost(self) -> float:
+        with self._lock:
+            return sum(job.cost for job in self._jobs)
+
+    def jobs(self, status: str | None = None) -> list[Job]:
+        with self._lock:
+            return [job for job in self._jobs if status in (None, job.status)]
+
+
+class SQLiteQueue(JobQueue):
+    """
+    Queue stored in a SQLite database file, which can be shared by
+    worker processes on the same machine (or a shared filesystem
+    that supports SQLite's locking).
+    """
+
+    def __init__(
+        self, path: str | os.PathLike, timeout: float = 30, lease: float = DEFAULT_LEASE
+    ):
+        self.path = path
+        self.timeout = timeout
+        self.lease = lease
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    data TEXT,
+                    error TEXT,
+                    cost REAL NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    budget REAL NOT NULL DEFAULT 0,
+                    updated_at REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections are short-lived so the queue can be used from any thread,
+        # isolation_level=None leaves transactions to explicit BEGIN statements
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def push(self, url: str, config: dict) -> int:
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (url, config, updated_at) VALUES (?, ?, ?)",
+                (url, json.dumps(config), time.time()),
+            )
+            return cur.lastrowid  # type: ignore
+
+    def claim(
+        self, worker: str, budget: float = math.inf, max_cost: float = math.inf
+    ) -> Job | None:
+        now = time.time()
+        expired = now - self.lease
+        conn = self._connect()
+        try:
+            # take the write lock before reading, so two workers can't
+            # claim the same job or the same part of max_cost
+            conn.execute("BEGIN IMMEDIATE")
+            spent, reserved = conn.execute(
+                "SELECT TOTAL(cost), TOTAL(CASE WHEN status = 'running' "
+                "AND updated_at > ? THEN budget END) FROM jobs",
+                (expired,),
+            ).fetchone()
+            remaining = max_cost - spent - reserved
+            row = None
+            if remaining > 0:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'pending' OR "
+                    "(status = 'running' AND updated_at <= ?) ORDER BY id LIMIT 1",
+                    (expired,),
+                ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            budget = min(budget, remaining)
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, budget = ?, "
+                "updated_at = ? WHERE id = ?",
+                (worker, budget, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        job = self._row_to_job(row)
+        job.status = "running"
+        job.worker = worker
+        job.budget = budget
+        job.updated_at = now
+        return job
+
+    def finish(self, job: Job) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, data = ?, error = ?, cost = ?, "
+                "prompt_tokens = ?, completion_tokens = ?, updated_at = ? "
+                "WHERE id = ?",
+                (
+                    job.status,
+                    json.dumps(job.data),
+                    job.error,
+                    job.cost,
+                    job.prompt_tokens,
+                    job.completion_tokens,
+                    time.time(),
+                    job.id,
+                ),
+            )
+
+    def total_cost(self) -> float:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT TOTAL(cost) FROM jobs").fetchone()[0]
+
+    def jobs(self, status: str | None = None) -> list[Job]:
+        with closing(self._connect()) as conn:
+            if status is None:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id")
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)
+                )
+            return [self._row_to_job(row) for row in rows]
+
+    def _row_to_job(self, row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            url=row["url"],
+            config=json.loads(row["config"]),
+            status=row["status"],
+            worker=row["worker"],
+            data=json.loads(row["data"]) if row["data"] else None,
+            error=row["error"],
+            cost=row["cost"],
+            prompt_tokens=row["prompt_tokens"],
+            completion_tokens=row["completion_tokens"],
+            budget=row["budget"],
+            updated_at=row["updated_at"],
+        )
+
+
+class Worker:
+    """
+    Claims jobs from a queue and scrapes them until the queue is empty
+    or the total cost of all jobs in the queue reaches max_cost.
+
+    * job_budget - the most a single job may cost, reserved from max_cost
+      while it runs so that concurrent workers can't overspend together.
+      Defaults to a tenth of max_cost.  Like max_cost, it is checked
+      before each request, so a job may exceed it by one request.  A job
+      that runs out of budget fails, and the worker moves on.
+
+    Scrapers are reused between jobs with the same configuration.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        max_cost: float = 1,
+        name: str = "",
+        job_budget: float | None = None,
+    ):
+        self.queue = queue
+        self.max_cost = max_cost
+        self.job_budget = max_cost / 10 if job_budget is None else job_budget
+        self.claim_wait = CLAIM_WAIT
+        self.name = (
+            name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        )
+        self._scrapers: dict[str, SchemaScraper] = {}
+
+    def __str__(self) -> str:
+        return f"Worker({self.name})"
+
+    def run(self, limit: int | None = None) -> int:
+        """
+        Run jobs, returning the number run.
+
+        * limit - stop after this many jobs
+        """
+        count = 0
+        while limit is None or count < limit:
+            job = self.queue.claim(self.name, self.job_budget, self.max_cost)
+            if job is None:
+                if self.queue.total_cost() >= self.max_cost:
+                    logger.warning("max cost reached", worker=self.name)
+                    break
+                if not self.queue.jobs("pending"):
+                    break
+                # the rest of max_cost is reserved by running jobs,
+                # some of which may not need all of it
+                time.sleep(self.claim_wait)
+                continue
+            count += 1
+            self.run_job(job, job.budget)
+        return count
+
+    def run_job(self, job: Job, max_cost: float) -> None:
+        """
+        Scrape a claimed job and store the result in the queue.
+
+        A job that exceeds max_cost fails like any other.
+        """
+        scraper = self._scraper(job.config)
+        before = scraper.stats()
+        # each scraper's max_cost applies to its own running total
+        scraper.max_cost = before["total_cost"] + max_cost
+        logger.info("job started", job=job.id, url=job.url, worker=self.name)
+        try:
+            job.data = scraper.scrape(job.url).data
+            job.status = "done"
+        except Exception as e:
+            # one bad page shouldn't stop the worker
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        # includes the cost of failed attempts
+        after = scraper.stats()
+        job.cost = after["total_cost"] - before["total_cost"]
+        job.prompt_tokens = after["total_prompt_tokens"] - before["total_prompt_tokens"]
+        job.completion_tokens = (
+            after["total_completion_tokens"] - before["total_completion_tokens"]
+        )
+        logger.info("job finished", job=job.id, status=job.status, cost=job.cost)
+        self.queue.finish(job)
+
+    def _scraper(self, config: dict) -> SchemaScraper:
+        key = json.dumps(config, sort_keys=True)
+        if key not in self._scrapers:
+            config = dict(config)
+            self._scrapers[key] = SchemaScraper(config.pop("schema"), **config)
+        return self._scrapers[key]
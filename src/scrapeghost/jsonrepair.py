@@ -0,0 +1,195 @@
+"""
+Local repair of almost-JSON returned by the API.
+
+Handles the common failure modes seen in practice without another
+API call: markdown fences or prose around the JSON, single quotes,
+trailing commas, Python literals, and output that was cut off
+part way through a list (complete items are kept).
+"""
+import json
+import re
+
+from .errors import InvalidJSON
+
+_ESCAPES = {
+    '"': '"',
+    "'": "'",
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+_LITERALS = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "True": True,
+    "False": False,
+    "None": None,
+}
+_number_re = re.compile(r"-?\d+(\.\d+)?([eE][-+]?\d+)?")
+_word_re = re.compile(r"[A-Za-z]+")
+
+
+class _Truncated(Exception):
+    """Reached the end of the text in the middle of a value."""
+
+
+class _TolerantParser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        # values nested in a list are dropped if truncated, others are kept
+        self.list_depth = 0
+        self.salvaged = False
+
+    def _peek(self) -> str:
+        while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n":
+            self.pos += 1
+        if self.pos >= len(self.text):
+            raise _Truncated()
+        return self.text[self.pos]
+
+    def _at_end(self) -> bool:
+        try:
+            self._peek()
+        except _Truncated:
+            return True
+        return False
+
+    def value(self) -> dict | list | str | float | int | bool | None:
+        c = self._peek()
+        if c == "{":
+            return self._object()
+        elif c == "[":
+            return self._array()
+        elif c in "\"'":
+            return self._string()
+        return self._literal()
+
+    def _object(self) -> dict:
+        self.pos += 1
+        obj: dict = {}
+        while True:
+            c = self._peek()
+            if c == "}":
+                self.pos += 1
+                return obj
+            elif c == ",":
+                # tolerates trailing and doubled commas
+                self.pos += 1
+                continue
+            elif c not in "\"'":
+                raise ValueError(f"expected key at {self.pos}")
+            key = self._string()
+            if self._peek() != ":":
+                raise ValueError(f"expected ':' at {self.pos}")
+            self.pos += 1
+            obj[key] = self.value()
+            if self.list_depth == 0 and self._at_end():
+                self.salvaged = True
+                return obj
+
+    def _array(self) -> list:
+        self.pos += 1
+        items: list = []
+        self.list_depth += 1
+        try:
+            while True:
+                try:
+                    c = self._peek()
+                    if c == "]":
+                        self.pos += 1
+                        return items
+                    elif c == ",":
+                        self.pos += 1
+                        continue
+                    items.append(self.value())
+                except _Truncated:
+                    if self.list_depth > 1:
+                        # this list is itself an incomplete item of another
+                        raise
+                    # keep the items that were complete
+                    self.salvaged = True
+                    return items
+        finally:
+            self.list_depth -= 1
+
+    def _string(self) -> str:
+        quote = self.text[self.pos]
+        self.pos += 1
+        buf: list[str] = []
+        while True:
+            if self.pos >= len(self.text):
+                raise _Truncated()
+            c = self.text[self.pos]
+            if c == quote:
+                self.pos += 1
+                return "".join(buf)
+            elif c == "\\":
+                esc = self.text[self.pos + 1 : self.pos + 2]
+                if not esc:
+                    raise _Truncated()
+                if esc == "u":
+                    code = self.text[self.pos + 2 : self.pos + 6]
+                    if len(code) < 4:
+                        raise _Truncated()
+                    buf.append(chr(int(code, 16)))
+                    self.pos += 6
+                else:
+                    buf.append(_ESCAPES.get(esc, esc))
+                    self.pos += 2
+            else:
+                buf.append(c)
+                self.pos += 1
+
+    def _literal(self) -> float | int | bool | None:
+        match = _number_re.match(self.text, self.pos) or _word_re.match(
+            self.text, self.pos
+        )
+        if not match:
+            raise ValueError(f"unexpected character at {self.pos}")
+        token = match.group()
+        self.pos = match.end()
+        if self.pos >= len(self.text):
+            # a number or word that runs to the end may be cut off
+            raise _Truncated()
+        if token in _LITERALS:
+            return _LITERALS[token]
+        elif match.re is _number_re:
+            return json.loads(token)
+        raise ValueError(f"unexpected literal {token}")
+
+
+def repair_json(text: str) -> tuple[dict | list, bool]:
+    """
+    Attempt to parse almost-JSON, returning (data, salvaged).
+
+    salvaged is True if the text was truncated and incomplete items
+    were dropped.
+
+    Raises InvalidJSON if the text cannot be repaired.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise InvalidJSON(text)
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+
+    # cheap path: valid JSON surrounded by fences or explanatory text
+    try:
+        return json.loads(text[start : end + 1]), False
+    except json.JSONDecodeError:
+        pass
+
+    parser = _TolerantParser(text[start:])
+    try:
+        data = parser.value()
+    except (_Truncated, ValueError, IndexError):
+        raise InvalidJSON(text)
+    if not isinstance(data, (dict, list)):  # pragma: no cover
+        raise InvalidJSON(text)
+    return data, parser.salvaged
@@ -8,6 +8,8 @@ class Model:
     completion_token_cost: float  # $ per 1k output tokens, see https://openai.com/api/pricing
     max_tokens: int  # max output tokens
     json_mode: bool  # see https://platform.openai.com/docs/guides/json-mode
+    # see https://platform.openai.com/docs/guides/structured-outputs
+    structured_outputs: bool = False
 
     def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
         return (
@@ -22,8 +24,8 @@ models = [
     Model("gpt-4-1106-preview", 0.01, 0.03, 128000, True),
     Model("gpt-4-turbo", 0.01, 0.03, 4096, True),
     Model("gpt-4-turbo-preview", 0.01, 0.03, 4096, True),
-    Model("gpt-4o", 0.005, 0.015, 4096, True),
-    Model("gpt-4o-mini", 0.00015, 0.0006, 16384, True),
+    Model("gpt-4o", 0.005, 0.015, 4096, True, True),
+    Model("gpt-4o-mini", 0.00015, 0.0006, 16384, True, True),
     Model("gpt-3.5-turbo", 0.001, 0.002, 16384, False),
     Model("gpt-3.5-turbo-1106", 0.001, 0.002, 16384, True),
 ]
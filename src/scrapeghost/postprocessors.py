@@ -1,10 +1,16 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
+import re
 import json
-from pydantic import ValidationError
+import weakref
+import threading
+import functools
+import lxml.html
+from pydantic import TypeAdapter, ValidationError
 
-from .utils import logger, _tostr
+from .utils import logger
+from .jsonrepair import repair_json
 from .errors import InvalidJSON, PostprocessingError
 from .responses import Response, ScrapeResponse
 
@@ -14,11 +20,25 @@ if TYPE_CHECKING:  # pragma: no cover
 
 
 class JSONPostprocessor:
-    def __init__(self, nudge: bool = True):
+    """
+    Parse the response data as JSON.
+
+    * nudge - if the JSON is invalid, ask the API to fix it
+    * repair - before nudging, try to repair the JSON locally
+      (fences, quotes, trailing commas, truncated lists)
+
+    The repaired and nudged attributes count how often each was needed.
+    """
+
+    def __init__(self, nudge: bool = True, repair: bool = True):
         self.nudge = nudge
+        self.repair = repair
+        self.repaired = 0
+        self.nudged = 0
+        self._lock = threading.Lock()
 
     def __str__(self) -> str:
-        return f"JSONPostprocessor(nudge={self.nudge}))"
+        return f"JSONPostprocessor(nudge={self.nudge}, repair={self.repair})"
 
     def __call__(self, response: Response, scraper: OpenAiCall) -> Response:
         if not isinstance(response.data, str):
@@ -26,21 +46,37 @@ class JSONPostprocessor:
 
         try:
             response.data = json.loads(response.data)
+            return response
         except json.JSONDecodeError:
-            if hasattr(scraper, "scrape") and self.nudge:
-                # call nudge and try again
-                response = self.nudge_json(scraper, response)  # type: ignore
-                if not isinstance(response.data, str):  # pragma: no cover
-                    raise PostprocessingError(
-                        f"Response data is not a string: {response.data}"
-                    )
-                try:
-                    response.data = json.loads(response.data)
-                except json.JSONDecodeError:
-                    # if still invalid, raise error
-                    raise InvalidJSON(response.data)
-            else:
+            pass
+
+        if self.repair:
+            try:
+                response.data, salvaged = repair_json(response.data)  # type: ignore
+                with self._lock:
+                    self.repaired += 1
+                logger.info("repaired JSON", salvaged=salvaged)
+                return response
+            except InvalidJSON:
+                pass
+
+        if hasattr(scraper, "scrape") and self.nudge:
+            # call nudge and try again
+            with self._lock:
+                self.nudged += 1
+            scraper.stats_collector.record_nudge()
+            response = self.nudge_json(scraper, response)  # type: ignore
+            if not isinstance(response.data, str):  # pragma: no cover
+                raise PostprocessingError(
+                    f"Response data is not a string: {response.data}"
+                )
+            try:
+                response.data = json.loads(response.data)
+            except json.JSONDecodeError:
+                # if still invalid, raise error
                 raise InvalidJSON(response.data)
+        else:
+            raise InvalidJSON(response.data)
         return response
 
     def nudge_json(self, scraper: SchemaScraper, response: Response) -> Response:
@@ -67,21 +103,59 @@ class JSONPostprocessor:
         )
 
 
+@functools.lru_cache(maxsize=None)
+def _type_adapter(tp: Any) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+
 class PydanticPostprocessor:
-    def __init__(self, model: type):
+    """
+    Validate the response data with a Pydantic model.
+
+    * many - expect a list of objects (as with auto_split_length)
+    * from_json - validate the raw JSON string directly, without a
+      JSONPostprocessor first
+    * json_fallback - with from_json, a JSONPostprocessor used to
+      repair or nudge the string if it is not valid JSON
+    """
+
+    def __init__(
+        self,
+        model: type,
+        from_json: bool = False,
+        many: bool = False,
+        json_fallback: JSONPostprocessor | None = None,
+    ):
         self.pydantic_model = model
+        self.from_json = from_json
+        self.many = many
+        self.json_fallback = json_fallback
+        self.adapter = _type_adapter(list[model] if many else model)  # type: ignore
 
     def __str__(self) -> str:  # pragma: no cover
         return f"PydanticPostprocessor({self.pydantic_model})"
 
     def __call__(self, response: Response, scraper: OpenAiCall) -> Response:
-        if not isinstance(response.data, dict):
+        if self.from_json and isinstance(response.data, str):
+            try:
+                response.data = self.adapter.validate_json(response.data)
+                return response
+            except ValidationError as e:
+                if not self.json_fallback or not _is_invalid_json(e):
+                    logger.error(
+                        "pydantic validation error", error=e, data=response.data
+                    )
+                    raise
+            response = self.json_fallback(response, scraper)
+
+        expected = list if self.many else dict
+        if not isinstance(response.data, expected):
             raise PostprocessingError(
-                "PydanticPostprocessor expecting a dict, "
+                f"PydanticPostprocessor expecting a {expected.__name__}, "
                 "ensure JSONPostprocessor or equivalent is used first."
             )
         try:
-            response.data = self.pydantic_model(**response.data)
+            response.data = self.adapter.validate_python(response.data)
         except ValidationError as e:
             logger.error("pydantic validation error", error=e, data=response.data)
             raise
@@ -89,43 +163,121 @@ class PydanticPostprocessor:
         return response
 
 
+def _is_invalid_json(e: ValidationError) -> bool:
+    return any(err["type"] == "json_invalid" for err in e.errors())
+
+
 class HallucinationChecker:
     """
     Check for data that is in the response that was not
     present on the page.
 
-    Default behavior is to check all top-level strings.
+    Default behavior is to check all strings in the response against
+    the page's visible text and attribute values, with whitespace
+    normalized.
+
+    * min_similarity - if set, a string that is not found verbatim is
+      still accepted if at least this fraction of its words appear on
+      the page (case-insensitive).
 
     If you desire more control, subclass this class and
     register it as a postprocessor.
     """
 
+    def __init__(self, min_similarity: float | None = None):
+        self.min_similarity = min_similarity
+        # index of each document being checked, so that auto_split_length
+        # chunks from the same page share one index, even when scrapes of
+        # other pages run at the same time; dropped with the document
+        self._indexes: weakref.WeakKeyDictionary[
+            lxml.html.HtmlElement, _TextIndex
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
     def __str__(self) -> str:  # pragma: no cover
         return "HallucinationChecker"
 
     def __call__(self, response: Response, scraper: OpenAiCall) -> Response:
-        if not isinstance(response, ScrapeResponse):  # pragma: no cover
+        if not isinstance(response, ScrapeResponse) or response.parsed_html is None:
             raise PostprocessingError(
-                "HallucinationChecker expects ScrapeResponse, "
-                "Incompatible with auto_split_length"
+                "HallucinationChecker expects ScrapeResponse with parsed_html"
             )
-        html = _tostr(response.parsed_html)
+        index = self._get_index(response.parsed_html)
 
-        _check_data_in_html(html, response.data)
+        _check_data_in_index(index, response.data, self.min_similarity)
 
         return response
 
+    def _get_index(self, doc: lxml.html.HtmlElement) -> _TextIndex:
+        with self._lock:
+            index = self._indexes.get(doc)
+        if index is None:
+            # built outside the lock, so other pages aren't held up
+            index = _TextIndex(doc)
+            with self._lock:
+                index = self._indexes.setdefault(doc, index)
+        return index
+
+
+_whitespace_re = re.compile(r"\s+")
+_word_re = re.compile(r"\w+")
+
+
+def _normalize(text: str) -> str:
+    return _whitespace_re.sub(" ", text).strip()
+
+
+def _words(text: str) -> list[str]:
+    # punctuation isn't part of a word, so "Zorak," matches "Zorak"
+    return _word_re.findall(text.lower())
+
+
+class _TextIndex:
+    """
+    Normalized text of a document, built once and queried many times.
+
+    Contains the document's text content (so that strings spanning
+    inline tags match) and all attribute values (so that URLs match).
+    """
+
+    def __init__(self, doc: lxml.html.HtmlElement):
+        parts = [_normalize(doc.text_content())]
+        for el in doc.iter():
+            parts.extend(_normalize(v) for v in el.attrib.values())
+        self.text = "\n".join(parts)
+        self.words = set(_words(self.text))
+
+    def __contains__(self, value: str) -> bool:
+        return _normalize(value) in self.text
+
+    def similarity(self, value: str) -> float:
+        """
+        Return the fraction of words in value that appear in the document.
+        """
+        words = _words(value)
+        if not words:
+            return 1.0
+        return sum(1 for w in words if w in self.words) / len(words)
+
 
-def _check_data_in_html(html: str, d: dict | list | str, parent: str = "") -> None:
+def _check_data_in_index(
+    index: _TextIndex,
+    d: dict | list | str,
+    min_similarity: float | None = None,
+    parent: str = "",
+) -> None:
     """
-    Recursively check response for data that is not in the html.
+    Recursively check response for data that is not in the index.
     """
     if isinstance(d, dict):
         for k, v in d.items():
-            _check_data_in_html(html, v, parent + f".{k}")
+            _check_data_in_index(index, v, min_similarity, parent + f".{k}")
     elif isinstance(d, list):
         for i, v in enumerate(d):
-            _check_data_in_html(html, v, parent + f"[{i}]")
+            _check_data_in_index(index, v, min_similarity, parent + f"[{i}]")
     elif isinstance(d, str):
-        if d not in html:
-            raise PostprocessingError(f"Data not found in html: {d} ({parent})")
+        if d in index:
+            return
+        if min_similarity is not None and index.similarity(d) >= min_similarity:
+            return
+        raise PostprocessingError(f"Data not found in html: {d} ({parent})")
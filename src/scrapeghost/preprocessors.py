@@ -1,22 +1,33 @@
+from __future__ import annotations
+
+import re
+import copy
+import math
+import cssselect
+import lxml.etree
 import lxml.html
-import lxml.html.clean
-from typing import Callable
+import lxml.cssselect
+from typing import Any, Callable, Iterable
 
+from .utils import _tostr
+from .cleaner import Cleaner
 
 Preprocessor = Callable[[lxml.html.HtmlElement], list[lxml.html.HtmlElement]]
 
+# same translator lxml uses for HtmlElement.cssselect
+_css_translator = lxml.cssselect.LxmlHTMLTranslator()
+
 
 class CleanHTML:
     """
     Given HTML, return a cleaned HTML string.
 
-    Uses lxml.html.clean.Cleaner.
+    Uses scrapeghost.cleaner.Cleaner, which takes the same options as
+    lxml.html.clean.Cleaner (but keeps unknown tags by default).
     """
 
-    def __init__(self, **kwargs: dict) -> None:
-        # need to set remove_unknown_tags to False since lxml.html seems to
-        # have an outdated list of tags
-        self.cleaner = lxml.html.clean.Cleaner(**kwargs, remove_unknown_tags=False)
+    def __init__(self, **kwargs: Any) -> None:
+        self.cleaner = Cleaner(**kwargs)
 
     def __str__(self) -> str:
         return "CleanHTML"
@@ -29,28 +40,273 @@ class CleanHTML:
 class XPath:
     """
     Given an XPath selector, return a list of nodes.
+
+    The expression is compiled once, when the preprocessor is created.
     """
 
     def __init__(self, xpath: str):
         self.xpath = xpath
+        self._compiled = lxml.etree.XPath(xpath)
 
     def __str__(self) -> str:
         return f"XPath({self.xpath})"
 
     def __call__(self, node: lxml.html.HtmlElement) -> list[lxml.html.HtmlElement]:
-        return node.xpath(self.xpath)
+        return self._compiled(node)
 
 
 class CSS:
     """
     Given a CSS selector, return a list of nodes.
+
+    The selector is translated to XPath and compiled once, when the
+    preprocessor is created.
     """
 
     def __init__(self, css: str):
         self.css = css
+        # one path per comma-separated selector, so that selectors can be fused
+        self._paths = [
+            _css_translator.selector_to_xpath(sel, prefix="descendant-or-self::")
+            for sel in cssselect.parse(css)
+        ]
+        self._compiled = lxml.etree.XPath(" | ".join(self._paths))
 
     def __str__(self) -> str:
         return f"CSS({self.css})"
 
     def __call__(self, node: lxml.html.HtmlElement) -> list[lxml.html.HtmlElement]:
-        return node.cssselect(self.css)
+        return self._compiled(node)
+
+    def fuse(self, other: CSS) -> CSS:
+        """
+        Return a single preprocessor equivalent to applying this selector
+        and then other to each of the results.
+
+        Unlike applying them in sequence, nodes matched more than once
+        (e.g. via nested matches) are only returned once.
+        """
+        fused = copy.copy(self)
+        fused.css = f"{self.css} >> {other.css}"
+        fused._paths = [f"{a}/{b}" for a in self._paths for b in other._paths]
+        fused._compiled = lxml.etree.XPath(" | ".join(fused._paths))
+        return fused
+
+
+class RelevancePruner:
+    """
+    Given a document, return only the regions most relevant to the schema,
+    within a token budget.
+
+    Container elements are scored by how often the schema's field names
+    appear in their text and class/id attributes, how much text they have,
+    how little of it is link text, and (if repeated=True, for list
+    schemas) how many similar children they have.  Navigation, headers,
+    footers and similar boilerplate are penalized.  The highest scoring
+    non-overlapping regions that fit are kept, in document order, skipping
+    any that score far below the best region.
+    """
+
+    def __init__(
+        self, keywords: Iterable[str], max_tokens: int, repeated: bool = False
+    ):
+        self.keywords = _keyword_set(keywords)
+        self.max_tokens = max_tokens
+        self.repeated = repeated
+
+    def __str__(self) -> str:
+        return f"RelevancePruner({self.max_tokens})"
+
+    def __call__(self, node: lxml.html.HtmlElement) -> list[lxml.html.HtmlElement]:
+        if _estimate_tokens(node) <= self.max_tokens:
+            return [node]
+
+        stats = self._subtree_stats(node)
+        scored = sorted(
+            (
+                (score, el)
+                for el, score in ((el, self._score(el, stats[el])) for el in stats)
+                if score > 0
+            ),
+            key=lambda pair: pair[0],
+            reverse=True,
+        )
+
+        picked: set = set()
+        # ancestors of picked elements, which would duplicate them
+        containing: set = set()
+        budget = self.max_tokens
+        for score, el in scored:
+            if score < scored[0][0] * MIN_RELATIVE_SCORE:
+                break
+            if el in containing or any(a in picked for a in el.iterancestors()):
+                continue
+            # cheap estimate from the stats first, serializing only if it may fit
+            text_len, _, _, elements = stats[el]
+            if (text_len + 25 * elements) // 4 > budget * 2:
+                continue
+            tokens = _estimate_tokens(el)
+            if tokens <= budget:
+                picked.add(el)
+                containing.update(el.iterancestors())
+                budget -= tokens
+
+        if not picked:
+            return [node]
+        # return in document order
+        return [el for el in node.iter() if el in picked]
+
+    def _subtree_stats(
+        self, node: lxml.html.HtmlElement
+    ) -> dict[lxml.html.HtmlElement, list]:
+        """
+        Single bottom-up pass collecting, for each container element,
+        [text length, link text length, keyword hits, element count].
+        """
+        totals: dict = {}
+        for el in reversed(list(node.iter())):
+            if not isinstance(el.tag, str):
+                continue
+            text = el.text or ""
+            own = [len(text), 0, self._hits(text), 1]
+            attrs = f"{el.get('class', '')} {el.get('id', '')}"
+            own[2] += self._hits(attrs)
+            for child in el:
+                child_stats = totals.get(child)
+                if child_stats:
+                    for i in range(4):
+                        own[i] += child_stats[i]
+                tail = child.tail or ""
+                own[0] += len(tail)
+                own[2] += self._hits(tail)
+            if el.tag == "a":
+                own[1] = own[0]
+            totals[el] = own
+        return {el: s for el, s in totals.items() if el.tag in _CONTAINER_TAGS}
+
+    def _hits(self, text: str) -> int:
+        if not text or not self.keywords:
+            return 0
+        return sum(1 for word in _words(text) if word in self.keywords)
+
+    def _score(self, el: lxml.html.HtmlElement, stats: list) -> float:
+        text_len, link_len, hits, _ = stats
+        if text_len < MIN_REGION_TEXT:
+            return 0
+        score = (1 + hits) * math.sqrt(text_len) * (1 - link_len / text_len)
+        if self.repeated:
+            signatures: dict[tuple, int] = {}
+            for child in el:
+                sig = (child.tag, child.get("class"))
+                signatures[sig] = signatures.get(sig, 0) + 1
+            repeats = max(signatures.values(), default=0)
+            if repeats >= 3:
+                score *= 1 + repeats / 3
+        if el.tag in _BOILERPLATE_TAGS or _boilerplate_re.search(
+            f"{el.get('class', '')} {el.get('id', '')}"
+        ):
+            score *= 0.1
+        return score
+
+
+# regions with less text than this are never kept on their own
+MIN_REGION_TEXT = 20
+# regions scoring less than this fraction of the best region are dropped
+MIN_RELATIVE_SCORE = 0.1
+_CONTAINER_TAGS = {
+    "article",
+    "div",
+    "dl",
+    "form",
+    "main",
+    "ol",
+    "section",
+    "table",
+    "tbody",
+    "ul",
+}
+_BOILERPLATE_TAGS = {"nav", "header", "footer", "aside"}
+_boilerplate_re = re.compile(
+    r"nav|menu|footer|header|sidebar|cookie|banner|breadcrumb|social|share", re.I
+)
+_word_re = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def _words(text: str) -> list[str]:
+    return [w.lower() for w in _word_re.findall(text)]
+
+
+def _keyword_set(keywords: Iterable[str]) -> set[str]:
+    """
+    Split field names like "home_planet" or "homePlanet" into words.
+    """
+    return {w for keyword in keywords for w in _words(keyword) if len(w) > 1}
+
+
+def _estimate_tokens(node: lxml.html.HtmlElement) -> int:
+    # roughly four characters per token for HTML
+    return len(_tostr(node)) // 4
+
+
+# pseudo-classes that depend on an element's siblings or content
+_sibling_or_content_re = re.compile(r"(first|last|only|nth)-|(empty|contains|has)$")
+
+
+def _selector_parts(tree: Any) -> Iterable[Any]:
+    """
+    Yield every part of a parsed cssselect selector, including the
+    arguments of :not() and :is().
+    """
+    if isinstance(tree, (list, tuple)):
+        for item in tree:
+            yield from _selector_parts(item)
+    elif type(tree).__module__ == cssselect.parser.__name__:
+        yield tree
+        for value in vars(tree).values():
+            yield from _selector_parts(value)
+
+
+def _compile_element_selector(css: str) -> lxml.etree.XPath:
+    """
+    Compile a CSS selector that tests a single element (e.g. "table.results")
+    rather than searching beneath it.
+
+    Only selectors without combinators or pseudo-classes depending on
+    siblings or content (e.g. :nth-child, :empty) are supported, since
+    the element is tested when it starts, before its descendants are
+    parsed, and earlier siblings may already have been discarded.
+    """
+    paths = []
+    for sel in cssselect.parse(css):
+        for part in _selector_parts(sel.parsed_tree):
+            if isinstance(part, cssselect.parser.CombinedSelector):
+                raise ValueError(f"streaming selectors cannot use combinators: {css}")
+            if isinstance(part, cssselect.parser.Pseudo):
+                name = part.ident
+            elif isinstance(part, cssselect.parser.Function):
+                name = part.name
+            elif isinstance(part, cssselect.parser.Relation):
+                name = "has"
+            else:
+                continue
+            if _sibling_or_content_re.match(name.lower()):
+                raise ValueError(
+                    f"streaming selectors cannot use :{name}, "
+                    f"which depends on siblings or content: {css}"
+                )
+        paths.append(_css_translator.selector_to_xpath(sel, prefix="self::"))
+    return lxml.etree.XPath(" | ".join(paths))
+
+
+def _fuse_selectors(preprocessors: list) -> list:
+    """
+    Combine consecutive CSS preprocessors so each run of them is a
+    single XPath evaluation.
+    """
+    fused: list = []
+    for p in preprocessors:
+        if isinstance(p, CSS) and fused and isinstance(fused[-1], CSS):
+            fused[-1] = fused[-1].fuse(p)
+        else:
+            fused.append(p)
+    return fused
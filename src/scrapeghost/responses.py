@@ -1,8 +1,34 @@
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 import lxml.html
 
 
-@dataclass
+@dataclass(slots=True)
+class ApiUsage:
+    """
+    Compact record of a single API call, kept in place of the full
+    API response when a scraper uses keep_api_responses="usage".
+    """
+
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+    api_time: float
+    finish_reason: str | None = None
+
+
+@dataclass(slots=True)
+class ChunkError:
+    """
+    An auto-split chunk that could not be scraped.
+    """
+
+    chunk: int
+    error: Exception
+
+
+@dataclass(slots=True)
 class Response:
     api_responses: list = field(default_factory=list)
     total_cost: float = 0
@@ -10,10 +36,45 @@ class Response:
     total_completion_tokens: int = 0
     api_time: float = 0
     data: dict | list | str = ""
+    # the model that produced data, if it came from a single request
+    model: str | None = None
+    # futures for hedged requests that lost and hadn't finished, which
+    # resolve to (prompt tokens, completion tokens, cost) or None
+    pending: list[Future] = field(default_factory=list)
+
+    def settle(self, timeout: float | None = None) -> None:
+        """
+        Wait for hedged requests that lost but were still running when
+        this response was returned, and add their tokens and cost.
+        """
+        pending, self.pending = self.pending, []
+        for future in pending:
+            self._add_pending(future.result(timeout))
+
+    def _add_finished(self) -> None:
+        """
+        Add the tokens and cost of pending requests that have finished.
+        """
+        pending, self.pending = self.pending, []
+        for future in pending:
+            if future.done():
+                self._add_pending(future.result())
+            else:
+                self.pending.append(future)
+
+    def _add_pending(self, usage: tuple[int, int, float] | None) -> None:
+        if usage:
+            self.total_prompt_tokens += usage[0]
+            self.total_completion_tokens += usage[1]
+            self.total_cost += usage[2]
 
 
-@dataclass
+@dataclass(slots=True)
 class ScrapeResponse(Response):
     url: str | None = None
     parsed_html: lxml.html.HtmlElement | None = None
     auto_split_length: int | None = None
+    errors: list[ChunkError] = field(default_factory=list)
+    # with row_cache, the number of the row (within the chunk) that each
+    # item came from, or None if the items couldn't all be attributed
+    _item_rows: list[int] | None = field(default=None, repr=False)
@@ -0,0 +1,65 @@
+"""
+Cache items extracted from individual rows of a page.
+
+When a list page is scraped again, rows that haven't changed can be
+filled in from the cache, and only new or changed rows are sent to the
+API.  The cache is keyed by a hash of each row's serialized HTML and
+the scraper's instructions, so changing the schema never reuses items.
+"""
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+
+def row_key(salt: str, html: str) -> str:
+    return hashlib.sha256((salt + "\0" + html).encode()).hexdigest()
+
+
+class RowCache:
+    """
+    A store of row hash -> items extracted from that row.
+
+    * path - an optional JSON lines file, loaded when the cache is
+      created and appended to as items are added, so the cache can be
+      shared between runs
+
+    Without a path, items are only kept in memory.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._items: dict[str, list] = {}
+        if self.path and self.path.exists():
+            self._load()
+
+    def __str__(self) -> str:
+        return f"RowCache({self.path})"
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _load(self) -> None:
+        with self.path.open() as f:  # type: ignore
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    # later entries replace earlier ones
+                    self._items[entry["key"]] = entry["items"]
+
+    def get(self, key: str) -> list | None:
+        """
+        Return the items extracted from a row, or None if it isn't cached.
+        """
+        return self._items.get(key)
+
+    def set(self, key: str, items: list) -> None:
+        """
+        Store the (JSON serializable) items extracted from a row.
+        """
+        with self._lock:
+            self._items[key] = items
+            if self.path:
+                with self.path.open("a") as f:
+                    f.write(json.dumps({"key": key, "items": items}) + "\n")
@@ -2,20 +2,54 @@ import re
 import json
 import typing
 import requests
+import contextlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import lxml.etree
 import lxml.html
 
 from typing import Any, Sequence, Type
-from pydantic import BaseModel
-from .errors import PreprocessorError
-from .responses import Response, ScrapeResponse
-from .apicall import OpenAiCall, Postprocessor, RetryRule
-from .utils import logger, _tokens, _tostr
-from .preprocessors import Preprocessor, CleanHTML
+from pydantic import BaseModel, ValidationError
+from .errors import (
+    PreprocessorError,
+    PostprocessingError,
+    ScrapeghostError,
+    InvalidJSON,
+    MaxCostExceeded,
+    BadStop,
+)
+from .responses import Response, ScrapeResponse, ChunkError
+from .apicall import OpenAiCall, Postprocessor, RetryRule, HedgeRule, _attach_failed
+from .models import _model_dict
+from .cassette import Cassette
+from .document import Document
+from .rowcache import RowCache, row_key
+from .utils import logger, _tostr, TokenEstimator
+from .serializers import Serializer, SERIALIZERS
+from .preprocessors import (
+    Preprocessor,
+    CleanHTML,
+    _fuse_selectors,
+    _compile_element_selector,
+    RelevancePruner,
+)
+from .jsonrepair import repair_json
 from .postprocessors import (
     JSONPostprocessor,
     PydanticPostprocessor,
 )
 
+# bytes (or characters) fed to the parser at a time when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# errors that only affect a single auto-split chunk
+CHUNK_ERRORS: tuple = (ScrapeghostError, ValidationError)
+
+# postprocessing errors that mean a model's output wasn't good enough
+QUALITY_ERRORS: tuple = (InvalidJSON, PostprocessingError, ValidationError)
+
+# key the model adds to each item with row_cache, for the row it came from
+ROW_KEY = "_row"
+
 
 class SchemaScraper(OpenAiCall):
     _default_preprocessors: list[Preprocessor] = [
@@ -28,6 +62,16 @@ class SchemaScraper(OpenAiCall):
         extra_preprocessors: list | None = None,
         *,
         auto_split_length: int = 0,
+        chunk_retries: int = 0,
+        split_failed_chunks: bool = False,
+        allow_partial: bool = False,
+        adaptive_split: bool = False,
+        chunk_concurrency: int = 4,
+        fuse_selectors: bool = False,
+        streaming: bool = False,
+        stream_selector: str | None = None,
+        serializer: str | Serializer = "html",
+        prune_tokens: int = 0,
         # inherited from OpenAiCall
         models: list[str] = ["gpt-3.5-turbo", "gpt-4"],
         model_params: dict | None = None,
@@ -35,11 +79,26 @@ class SchemaScraper(OpenAiCall):
         retry: RetryRule = RetryRule(1, 30),
         extra_instructions: list[str] | None = None,
         postprocessors: list | None = None,
+        keep_api_responses: str = "full",
+        keep_parsed_html: bool = True,
+        structured_output: bool = False,
+        cassette: Cassette | None = None,
+        hedge: HedgeRule | None = None,
+        cascade: bool = False,
+        schema_groups: int = 0,
+        columnar: bool | dict[str, str] = False,
+        row_cache: RowCache | None = None,
     ):
         # extra_instructions & postprocessors handled
         # differently in SchemaScraper so not passed to super()
         super().__init__(
-            models=models, model_params=model_params, max_cost=max_cost, retry=retry
+            models=models,
+            model_params=model_params,
+            max_cost=max_cost,
+            retry=retry,
+            keep_api_responses=keep_api_responses,
+            cassette=cassette,
+            hedge=hedge,
         )
         use_pydantic = False
         if isinstance(schema, (list, dict)):
@@ -52,54 +111,220 @@ class SchemaScraper(OpenAiCall):
         else:  # pragma: no cover
             raise ValueError(f"Invalid schema: {schema}")
 
+        if use_pydantic:
+            # check if schema is a pydantic model
+            if not isinstance(schema, type) or not issubclass(schema, BaseModel):
+                raise ValueError("Schema must be a Pydantic model.")
+
+        if structured_output:
+            if auto_split_length or not (use_pydantic or isinstance(schema, dict)):
+                raise ValueError(
+                    "structured_output requires a dict or Pydantic schema "
+                    "and cannot be combined with auto_split_length"
+                )
+            self.response_schema = _strict_json_schema(
+                schema.model_json_schema()  # type: ignore
+                if use_pydantic
+                else _simple_to_json_schema(schema)
+            )
+            if not any(_model_dict[model].structured_outputs for model in self.models):
+                raise ValueError(
+                    "structured_output requires a model that supports structured "
+                    f"outputs (such as gpt-4o-mini), got {self.models}"
+                )
+        # if every model enforces the schema, the output is always valid JSON
+        structured = self.response_schema is not None and all(
+            _model_dict[model].structured_outputs for model in self.models
+        )
+
+        json_type = "list of JSON objects" if auto_split_length else "JSON object"
+        if isinstance(serializer, str):
+            if serializer not in SERIALIZERS:
+                raise ValueError(
+                    f"serializer must be one of {list(SERIALIZERS)} or a callable, "
+                    f"got {serializer!r}"
+                )
+            content = "text" if serializer in ("text", "markdown") else "HTML"
+            self.serialize = SERIALIZERS[serializer]
+        else:
+            content = "HTML"
+            self.serialize = serializer
+        nudge = not auto_split_length and not structured
         _default_postprocessors: list[Postprocessor]
-        if auto_split_length:
-            json_type = "list of JSON objects"
+        if use_pydantic:
+            # validate straight from the JSON string,
+            # only parsing separately if the JSON is invalid
             _default_postprocessors = [
-                JSONPostprocessor(nudge=False),
+                PydanticPostprocessor(
+                    schema,  # type: ignore
+                    from_json=True,
+                    many=bool(auto_split_length),
+                    json_fallback=JSONPostprocessor(nudge=nudge),
+                ),
             ]
         else:
-            json_type = "JSON object"
             _default_postprocessors = [
-                JSONPostprocessor(nudge=True),
+                JSONPostprocessor(nudge=nudge),
             ]
 
         if postprocessors is None:
             self.postprocessors = _default_postprocessors
         else:
-            self.postprocessors = postprocessors
+            # copied since a PydanticPostprocessor may be appended below
+            self.postprocessors = list(postprocessors)
 
         self.system_messages = [
-            f"For the given HTML, convert to a {json_type} matching this schema: "
+            f"For the given {content}, convert to a {json_type} matching this schema: "
             f"{self.json_schema}",
             "Limit responses to valid JSON, with no explanatory text. "
             "Never truncate the JSON with an ellipsis. "
             "Always use double quotes for strings and escape quotes with \\. "
             "Always omit trailing commas. ",
         ]
+
+        # the schema as a dict or list, if it can be parsed
+        simple_schema: Any = self.json_schema if use_pydantic else schema
+        if isinstance(simple_schema, str):
+            try:
+                simple_schema = json.loads(simple_schema)
+            except json.JSONDecodeError:
+                pass
+
+        # header name -> field, for expanding columnar output
+        self._columns: dict[str, str] = {}
+        if columnar:
+            if isinstance(simple_schema, list) and len(simple_schema) == 1:
+                row_schema = simple_schema[0]
+            else:
+                row_schema = simple_schema if auto_split_length else None
+            if not isinstance(row_schema, dict) or structured_output:
+                raise ValueError(
+                    "columnar requires a list of objects (or auto_split_length) "
+                    "and cannot be combined with structured_output"
+                )
+            aliases: dict[str, str] = columnar if isinstance(columnar, dict) else {}
+            fields: list[str] = list(row_schema)
+            if row_cache is not None:
+                fields.append(ROW_KEY)
+            self._columns = {aliases.get(field, field): field for field in fields}
+            if len(self._columns) != len(fields):
+                raise ValueError(f"columnar aliases are not unique: {aliases}")
+            header = json.dumps(list(self._columns))
+            instruction = (
+                "Instead of a list of objects, respond with a JSON array of arrays. "
+                f"The first array is the header {header}, and each following "
+                "array holds one object's values in the same order. "
+            )
+            if aliases:
+                instruction += "The header uses short names for fields: " + ", ".join(
+                    f"{alias}={field}" for alias, field in self._columns.items()
+                )
+            self.system_messages.append(instruction)
+
+        if row_cache is not None:
+            # so that items from a chunk of several rows can be cached by row
+            self.system_messages.append(
+                "Each row of the input follows a line like [row 1]. "
+                f'Add a "{ROW_KEY}" key to each object with the number of the row '
+                "it came from."
+            )
+
         if extra_instructions:
             self.system_messages.extend(extra_instructions)
 
-        if extra_preprocessors is None:
-            self.preprocessors = self._default_preprocessors
-        else:
-            self.preprocessors = self._default_preprocessors + extra_preprocessors
+        # system messages for each group of fields, with schema_groups
+        self._group_messages: list[list[str]] = []
+        # field order of the schema, used when merging groups
+        self._group_order: list[str] = []
+        if schema_groups > 1:
+            if (
+                not isinstance(simple_schema, dict)
+                or auto_split_length
+                or structured_output
+            ):
+                raise ValueError(
+                    "schema_groups requires a dict or Pydantic schema and cannot "
+                    "be combined with auto_split_length or structured_output"
+                )
+            self._group_order = list(simple_schema)
+            for group in _partition_schema(simple_schema, schema_groups):
+                self._group_messages.append(
+                    [
+                        f"For the given {content}, convert to a {json_type} "
+                        f"matching this schema: {json.dumps(group)}"
+                    ]
+                    + self.system_messages[1:]
+                )
 
-        if use_pydantic:
-            # check if schema is a pydantic model
-            if not isinstance(schema, type) or not issubclass(schema, BaseModel):
-                raise ValueError("Schema must be a Pydantic model.")
-            self.postprocessors.append(PydanticPostprocessor(schema))
+        # always a new list, so the defaults are never modified
+        self.preprocessors = self._default_preprocessors + (extra_preprocessors or [])
+        if prune_tokens:
+            self.preprocessors = self.preprocessors + [
+                RelevancePruner(
+                    _schema_keywords(simple_schema),
+                    prune_tokens,
+                    repeated=bool(auto_split_length) or _schema_has_list(simple_schema),
+                )
+            ]
+
+        if use_pydantic and not isinstance(
+            self.postprocessors[-1], PydanticPostprocessor
+        ):
+            self.postprocessors.append(
+                PydanticPostprocessor(
+                    schema, many=bool(auto_split_length)  # type: ignore
+                )
+            )
 
         self.auto_split_length = auto_split_length
+        self.cascade = cascade
+        self.chunk_retries = chunk_retries
+        self.split_failed_chunks = split_failed_chunks
+        self.allow_partial = allow_partial
+        self.adaptive_split = adaptive_split
+        if chunk_concurrency < 1:
+            raise ValueError("chunk_concurrency must be at least 1")
+        self.chunk_concurrency = chunk_concurrency
+        # completion tokens per prompt token, learned with adaptive_split
+        self.output_ratio: float | None = None
+        self.keep_parsed_html = keep_parsed_html
+        self.fuse_selectors = fuse_selectors
+        self.streaming = streaming or stream_selector is not None
+        self.stream_selector = stream_selector
+        if stream_selector:
+            # fail early on unsupported selectors
+            _compile_element_selector(stream_selector)
+        # (preprocessors, fused preprocessors), replaced as a whole
+        # so that concurrent scrapes never see a mismatched pair
+        self._fused: tuple[tuple, list] | None = None
+
+        if row_cache is not None and not auto_split_length:
+            raise ValueError("row_cache requires auto_split_length")
+        self.row_cache = row_cache
+        # rows are only reused with identical instructions
+        self._row_salt = json.dumps(self.system_messages)
+        # cached items are stored as JSON and validated again when reused
+        self._item_model = schema if use_pydantic else None
 
     def _apply_preprocessors(
         self, doc: lxml.html.Element, extra_preprocessors: list
     ) -> list:
         nodes = [doc]
 
+        preprocessors = self.preprocessors + extra_preprocessors
+        if self.fuse_selectors:
+            if extra_preprocessors:
+                preprocessors = _fuse_selectors(preprocessors)
+            else:
+                # cache the fused list, in case self.preprocessors changes
+                key = tuple(self.preprocessors)
+                fused = self._fused
+                if fused is None or fused[0] != key:
+                    fused = self._fused = (key, _fuse_selectors(preprocessors))
+                preprocessors = fused[1]
+
         # apply preprocessors one at a time
-        for p in self.preprocessors + extra_preprocessors:
+        for p in preprocessors:
             new_nodes = []
             for node in nodes:
                 new_nodes.extend(p(node))
@@ -133,27 +358,383 @@ class SchemaScraper(OpenAiCall):
 
         sr.url = url_or_html if url_or_html.startswith("http") else None
         # obtain an HTML document from the URL or HTML string
-        sr.parsed_html = _parse_url_or_html(url_or_html)
+        if self.streaming:
+            sr.parsed_html = _stream_url_or_html(url_or_html, self.stream_selector)
+        else:
+            sr.parsed_html = _parse_url_or_html(url_or_html)
 
         # apply preprocessors, returning a list of tags
         tags = self._apply_preprocessors(sr.parsed_html, extra_preprocessors or [])
+        # serialized once, and shared by everything below
+        doc = Document(tags, self.serialize)
 
         sr.auto_split_length = self.auto_split_length
-        if self.auto_split_length:
+        if self.row_cache is not None:
+            # only scrape rows that aren't in the cache
+            sr = self._scrape_rows(sr, doc)
+        elif self.auto_split_length:
             # if auto_split_length is set, split the tags into chunks and then recombine
-            chunks = _chunk_tags(tags, self.auto_split_length, model=self.models[0])
-            # Note: this will not work when the postprocessor is expecting
-            # ScrapedResponse (like HallucinationChecker)
-            all_responses = [self.request(chunk) for chunk in chunks]
-            return _combine_responses(sr, all_responses)
+            chunks = _tag_chunks(
+                doc,
+                doc.nodes,
+                self._chunk_length(),
+                self.models[0],
+                self.token_estimator(self.models[0]),
+            )
+            sr = self._scrape_chunks(sr, doc, chunks)
         else:
             # otherwise, scrape the whole document as one chunk
-            html = "\n".join(_tostr(t) for t in tags)
-            # apply postprocessors to the ScrapeResponse
-            # so that they can access the parsed HTML if needed
-            return self._apply_postprocessors(  # type: ignore
-                _combine_responses(sr, [self._api_request(html)])
+            sr = self._scrape_chunk(sr, doc.text)
+
+        if not self.keep_parsed_html:
+            # postprocessors have run, release the tree
+            sr.parsed_html = None
+        sr._add_finished()
+        return sr
+
+    def _scrape_chunk(
+        self,
+        sr: ScrapeResponse,
+        html: str,
+        retry_bad_stop: bool = True,
+        tokens: dict[str, int] | None = None,
+    ) -> ScrapeResponse:
+        """
+        Scrape the page, or a single auto-split chunk, whose token
+        count may already be known from its nodes (see _api_request).
+
+        Each chunk is postprocessed as a ScrapeResponse sharing the
+        parsed document, so postprocessors like HallucinationChecker work.
+
+        With cascade, postprocessing is a quality gate: if it fails, the
+        chunk is scraped again with the next model.  The cost of failed
+        attempts is included in the returned response, or attached to the
+        exception as failed_responses if the chunk fails.
+        """
+        models = self.models
+        failed: list[Response] = []
+        while True:
+            try:
+                if self._group_messages:
+                    response = self._grouped_request(
+                        html, retry_bad_stop, models, tokens
+                    )
+                else:
+                    response = self._api_request(
+                        html,
+                        retry_bad_stop=retry_bad_stop,
+                        models=models,
+                        tokens=tokens,
+                    )
+            except Exception as e:
+                _attach_failed(e, failed)
+                raise
+            self._learn_output_ratio(response)
+            chunk_sr = _combine_responses(
+                ScrapeResponse(
+                    url=sr.url,
+                    parsed_html=sr.parsed_html,
+                    auto_split_length=self.auto_split_length,
+                ),
+                [response],
+            )
+            try:
+                if self._columns:
+                    chunk_sr.data = _expand_columns(
+                        chunk_sr.data, self._columns  # type: ignore
+                    )
+                if self._group_messages:
+                    chunk_sr.data = _merge_groups(
+                        chunk_sr.data, self._group_order  # type: ignore
+                    )
+                if self.row_cache is not None:
+                    chunk_sr.data, chunk_sr._item_rows = _take_rows(
+                        chunk_sr.data  # type: ignore
+                    )
+                chunk_sr = self._apply_postprocessors(chunk_sr)  # type: ignore
+            except QUALITY_ERRORS as e:
+                # models after the one that was actually used
+                models = models[models.index(response.model) + 1 :]  # type: ignore
+                if not self.cascade or not models:
+                    _attach_failed(e, failed + [chunk_sr])
+                    raise
+                logger.warning(
+                    "quality gate failed",
+                    model=response.model,
+                    next_model=models[0],
+                    exception=str(e),
+                )
+                self.stats_collector.record_escalation()
+                # postprocessors may have added nudge requests
+                failed.append(chunk_sr)
+                continue
+            except Exception as e:
+                # e.g. a nudge request that failed
+                _attach_failed(e, failed + [chunk_sr])
+                raise
+            return _add_failed_attempts(chunk_sr, failed)
+
+    def _grouped_request(
+        self,
+        html: str,
+        retry_bad_stop: bool,
+        models: list[str],
+        tokens: dict[str, int] | None = None,
+    ) -> Response:
+        """
+        Request each group of fields concurrently, with schema_groups.
+
+        Returns a single Response with the costs of all requests, whose
+        data is the list of each group's raw output.
+        """
+        with ThreadPoolExecutor(max_workers=len(self._group_messages)) as executor:
+            futures = [
+                executor.submit(
+                    self._api_request,
+                    html,
+                    retry_bad_stop=retry_bad_stop,
+                    models=models,
+                    system_messages=messages,
+                    tokens=tokens,
+                )
+                for messages in self._group_messages
+            ]
+        responses = []
+        errors = []
+        for future in futures:
+            try:
+                responses.append(future.result())
+            except Exception as error:
+                errors.append(error)
+        if errors:
+            # the other groups' requests were still paid for
+            for failure in errors[1:]:
+                responses.extend(getattr(failure, "failed_responses", []))
+            _attach_failed(errors[0], responses)
+            raise errors[0]
+        return Response(
+            data=[resp.data for resp in responses],  # type: ignore
+            api_responses=[r for resp in responses for r in resp.api_responses],
+            total_cost=sum(resp.total_cost for resp in responses),
+            total_prompt_tokens=sum(resp.total_prompt_tokens for resp in responses),
+            total_completion_tokens=sum(
+                resp.total_completion_tokens for resp in responses
+            ),
+            api_time=sum(resp.api_time for resp in responses),
+            pending=[future for resp in responses for future in resp.pending],
+            # the most capable model any group needed
+            model=max(
+                (resp.model for resp in responses), key=models.index  # type: ignore
+            ),
+        )
+
+    def _scrape_rows(self, sr: ScrapeResponse, doc: Document) -> ScrapeResponse:
+        """
+        Scrape the nodes not found in row_cache, in auto-split chunks, and
+        combine their items with cached items in document order.
+
+        Rows are numbered in the prompt, and the model gives the number
+        of the row each item came from, so each row's items are cached
+        separately.  If any item of a chunk of several rows has no valid
+        row number, or the output was truncated, the chunk's items are
+        used without being cached.
+        """
+        cache: RowCache = self.row_cache  # type: ignore
+        keys = [row_key(self._row_salt, html) for html in doc.html]
+        items: list[list | None] = [cache.get(key) for key in keys]
+        new = [i for i, row_items in enumerate(items) if row_items is None]
+        for row_items in items:
+            self.stats_collector.record_cache(row_items is not None)
+        logger.info("row cache", rows=len(doc), new_rows=len(new))
+        for i, row_items in enumerate(items):
+            if row_items is not None and self._item_model:
+                items[i] = [
+                    self._item_model.model_validate(item)  # type: ignore
+                    for item in row_items
+                ]
+
+        responses = []
+        failed: list[Response] = []
+        if new:
+            chunks = _tag_chunks(
+                doc,
+                new,
+                self._chunk_length(),
+                self.models[0],
+                self.token_estimator(self.models[0]),
             )
+            scraped, failed = self._scrape_tagged_chunks(sr, doc, chunks)
+            for chunk_nodes, response in scraped:
+                responses.append(response)
+                rows = chunk_nodes
+                # a single object is one item, not a list of its keys
+                data = response.data if isinstance(response.data, list) else None
+                numbers = getattr(response, "_item_rows", None)
+                if numbers is None and data is not None and len(rows) == 1:
+                    numbers = [1] * len(data)
+                if (
+                    data is None
+                    or numbers is None
+                    or len(numbers) != len(data)
+                    or not all(1 <= n <= len(rows) for n in numbers)
+                ):
+                    logger.debug("rows not cached", rows=len(rows))
+                    items[rows[0]] = [response.data] if data is None else data
+                    for i in rows[1:]:
+                        items[i] = []
+                    continue
+                by_row: list[list] = [[] for _ in rows]
+                for n, item in zip(numbers, data):
+                    by_row[n - 1].append(item)
+                for i, row_items in zip(rows, by_row):
+                    items[i] = row_items
+                    cache.set(keys[i], [_jsonable(item) for item in row_items])
+
+        sr = _add_failed_attempts(_combine_responses(sr, responses), failed)
+        # rows of chunks that failed with allow_partial are left out
+        sr.data = [item for row_items in items for item in row_items or []]
+        return sr
+
+    def _learn_output_ratio(self, response: Response) -> None:
+        """
+        Track the ratio of completion tokens to prompt tokens,
+        used by adaptive_split to size chunks.
+        """
+        if not self.adaptive_split or not response.total_prompt_tokens:
+            return
+        ratio = response.total_completion_tokens / response.total_prompt_tokens
+        with self._stats_lock:
+            if self.output_ratio is None:
+                self.output_ratio = ratio
+            else:
+                self.output_ratio = 0.7 * self.output_ratio + 0.3 * ratio
+
+    def _chunk_length(self) -> int:
+        """
+        Return the chunk length to use for auto-splitting.
+
+        With adaptive_split, this is reduced so the expected output
+        fits within the model's output limit.
+        """
+        if not self.adaptive_split or not self.output_ratio:
+            return self.auto_split_length
+        model = _model_dict[self.models[0]]
+        output_limit = self.model_params.get("max_tokens", model.max_tokens)
+        # leave headroom since the ratio varies from chunk to chunk
+        learned = int(output_limit * 0.75 / self.output_ratio)
+        length = max(1, min(self.auto_split_length, learned))
+        logger.debug("chunk length", length=length, output_ratio=self.output_ratio)
+        return length
+
+    def _scrape_chunks(
+        self, sr: ScrapeResponse, doc: Document, chunks: list[Sequence[int]]
+    ) -> ScrapeResponse:
+        """
+        Scrape each chunk, combining successful responses in document order
+        with the cost of failed attempts.
+
+        See _scrape_tagged_chunks.
+        """
+        scraped, failed = self._scrape_tagged_chunks(sr, doc, chunks)
+        sr = _combine_responses(sr, [resp for _, resp in scraped])
+        return _add_failed_attempts(sr, failed)
+
+    def _scrape_tagged_chunks(
+        self, sr: ScrapeResponse, doc: Document, chunks: list[Sequence[int]]
+    ) -> tuple[list[tuple[Sequence[int], Response]], list[Response]]:
+        """
+        Scrape each chunk independently, so that one failing chunk does not
+        discard the others.
+
+        Failed chunks are retried up to chunk_retries times (split in half
+        if split_failed_chunks is set). With adaptive_split, chunks that
+        are truncated (BadStop) are split in half without counting as a
+        retry. Chunks that still fail are recorded in sr.errors if
+        allow_partial is set, otherwise the error is raised.
+
+        Returns (nodes, response) pairs for successful chunks in document
+        order, where nodes are the nodes of doc that were actually sent,
+        and the responses of failed attempts, which were still paid for.
+        """
+        # (position, nodes, attempts), position sorts in document order
+        pending: list[tuple[tuple[int, ...], Sequence[int], int]] = [
+            ((i,), nodes, 0) for i, nodes in enumerate(chunks)
+        ]
+        done: list[tuple[tuple[int, ...], Sequence[int], Response]] = []
+        failed: list[Response] = []
+        errors: list[tuple[tuple[int, ...], ChunkError]] = []
+        # future -> (position, nodes, attempts)
+        running: dict[Future, tuple[tuple[int, ...], Sequence[int], int]] = {}
+
+        with ThreadPoolExecutor(max_workers=self.chunk_concurrency) as executor:
+            while pending or running:
+                # only chunk_concurrency chunks are started at once, so
+                # none are left to be paid for once one fails for good
+                while pending and len(running) < self.chunk_concurrency:
+                    position, nodes, attempts = pending.pop(0)
+                    future = executor.submit(
+                        self._scrape_chunk,
+                        sr,
+                        self._chunk_text(doc, nodes),
+                        retry_bad_stop=not (self.adaptive_split and len(nodes) > 1),
+                        # row numbers aren't included in the nodes' counts
+                        tokens=None if self.row_cache else doc.known_tokens(nodes),
+                    )
+                    running[future] = (position, nodes, attempts)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    position, nodes, attempts = running.pop(future)
+                    try:
+                        done.append((position, nodes, future.result()))
+                        continue
+                    except Exception as e:
+                        error = e
+                    retryable = isinstance(
+                        error, CHUNK_ERRORS + self.retry.retry_errors
+                    ) and not isinstance(error, MaxCostExceeded)
+                    bisect = self.adaptive_split and len(nodes) > 1
+                    if retryable:
+                        logger.warning(
+                            "chunk failed",
+                            chunk=position,
+                            attempts=attempts + 1,
+                            exception=str(error),
+                        )
+                    if retryable and bisect and isinstance(error, BadStop):
+                        pending.extend(_bisect_chunk(position, nodes, attempts))
+                    elif retryable and attempts < self.chunk_retries:
+                        if self.split_failed_chunks and len(nodes) > 1:
+                            pending.extend(_bisect_chunk(position, nodes, attempts + 1))
+                        else:
+                            pending.append((position, nodes, attempts + 1))
+                    elif retryable and self.allow_partial:
+                        errors.append(
+                            (position, ChunkError(chunk=position[0], error=error))
+                        )
+                    else:
+                        # chunks that succeeded or are still running were paid for
+                        _attach_failed(
+                            error,
+                            [resp for _, _, resp in done]
+                            + failed
+                            + _finish_chunks(running),
+                        )
+                        raise error
+                    failed.extend(getattr(error, "failed_responses", []))
+
+        done.sort(key=lambda entry: entry[0])
+        errors.sort(key=lambda entry: entry[0])
+        sr.errors.extend(error for _, error in errors)
+        return [(nodes, resp) for _, nodes, resp in done], failed
+
+    def _chunk_text(self, doc: Document, nodes: Sequence[int]) -> str:
+        """
+        Return the text sent for a chunk, with numbered rows for row_cache.
+        """
+        if self.row_cache is None:
+            return doc.join(nodes)
+        html = doc.html
+        return "\n".join(f"[row {n}]\n{html[i]}" for n, i in enumerate(nodes, 1))
 
     # allow the class to be called like a function
     __call__ = scrape
@@ -174,13 +755,130 @@ def _combine_responses(
         [resp.total_completion_tokens for resp in responses]
     )
     sr.api_time = sum([resp.api_time for resp in responses])
-    if len(responses) > 1:
-        sr.data = [item for resp in responses for item in resp.data]
-    else:
+    sr.pending = [future for resp in responses for future in resp.pending]
+    sr._add_finished()
+    if len(responses) == 1:
         sr.data = responses[0].data
+        sr.model = responses[0].model
+    else:
+        sr.data = [item for resp in responses for item in resp.data]
+    return sr
+
+
+def _add_failed_attempts(
+    sr: ScrapeResponse, failed: Sequence[Response]
+) -> ScrapeResponse:
+    """
+    Add the cost, tokens and API responses of failed attempts to sr.
+    """
+    sr.api_responses[:0] = [r for resp in failed for r in resp.api_responses]
+    for resp in failed:
+        sr.total_cost += resp.total_cost
+        sr.total_prompt_tokens += resp.total_prompt_tokens
+        sr.total_completion_tokens += resp.total_completion_tokens
+        sr.api_time += resp.api_time
+        sr.pending.extend(resp.pending)
+    sr._add_finished()
     return sr
 
 
+def _jsonable(item: Any) -> Any:
+    if isinstance(item, BaseModel):
+        return item.model_dump(mode="json")
+    return item
+
+
+def _partition_schema(schema: dict, groups: int) -> list[dict]:
+    """
+    Split a schema's top-level fields into at most this many groups,
+    balanced by the size of each field's schema.
+
+    Fields keep their order within each group.
+    """
+    order = list(schema)
+    buckets: list[list[str]] = [[] for _ in range(min(groups, len(order)))]
+    sizes = [0] * len(buckets)
+    # largest first, each to the smallest group so far
+    for key in sorted(order, key=lambda k: -len(json.dumps(schema[k]))):
+        i = sizes.index(min(sizes))
+        buckets[i].append(key)
+        sizes[i] += len(json.dumps({key: schema[key]}))
+    return [{key: schema[key] for key in sorted(b, key=order.index)} for b in buckets]
+
+
+def _merge_groups(outputs: list[str], order: list[str]) -> str:
+    """
+    Merge the JSON objects output for each group of fields into
+    a single JSON object string, repairing invalid JSON if possible.
+
+    Fields are ordered as in the schema, followed by any others.
+    """
+    merged: dict = {}
+    for output in outputs:
+        try:
+            data = json.loads(output)
+        except json.JSONDecodeError:
+            data, _ = repair_json(output)
+        if not isinstance(data, dict):
+            raise PostprocessingError(f"Expected a JSON object, got: {output}")
+        merged.update(data)
+    ordered = {key: merged.pop(key) for key in order if key in merged}
+    return json.dumps({**ordered, **merged})
+
+
+def _expand_columns(output: str, columns: dict[str, str]) -> str:
+    """
+    Expand columnar output (a header array followed by arrays of values)
+    into a JSON string of a list of objects.
+
+    columns maps header names to field names.  Output that is already
+    a list of objects is returned unchanged.  Rows with a different
+    number of values than the header are rejected, rather than guessing
+    which fields they're missing.
+    """
+    try:
+        data = json.loads(output)
+    except json.JSONDecodeError:
+        data, _ = repair_json(output)
+    if not data or not isinstance(data, list) or not isinstance(data[0], list):
+        return json.dumps(data)
+    header, *rows = data
+    unknown = [name for name in header if name not in columns]
+    if unknown:
+        raise PostprocessingError(f"Unknown columns {unknown} in header {header}")
+    fields = [columns[name] for name in header]
+    for row in rows:
+        if not isinstance(row, list) or len(row) != len(fields):
+            raise PostprocessingError(f"Row {row} doesn't match header {header}")
+    return json.dumps([dict(zip(fields, row)) for row in rows])
+
+
+def _take_rows(output: str) -> tuple[str, list[int] | None]:
+    """
+    Remove the row number (ROW_KEY) from each item of output, a JSON
+    string, returning the output and the number of each item's row.
+
+    The row numbers are None if any item has no whole-number row, or
+    the output is not a list or had to be truncated, since then the
+    items can't all be attributed to rows.  Output that can't be parsed
+    is returned unchanged for the postprocessors to handle.
+    """
+    try:
+        data, salvaged = json.loads(output), False
+    except json.JSONDecodeError:
+        try:
+            data, salvaged = repair_json(output)
+        except InvalidJSON:
+            return output, None
+    if not isinstance(data, list):
+        return output, None
+    rows = [
+        item.pop(ROW_KEY, None) if isinstance(item, dict) else None for item in data
+    ]
+    numbered = all(type(row) is int for row in rows)
+    return json.dumps(data), rows if numbered and not salvaged else None  # type: ignore
+
+
 def _parse_url_or_html(url_or_html: str) -> lxml.html.Element:
     """
     Given URL or HTML, return lxml.html.Element
@@ -199,28 +897,147 @@ def _parse_url_or_html(url_or_html: str) -> lxml.html.Element:
     return doc
 
 
-def _chunk_tags(tags: list, max_tokens: int, model: str) -> list[str]:
+_collapse_re = re.compile("[ \t]+")
+
+
+def _stream_url_or_html(
+    url_or_html: str, selector: str | None = None
+) -> lxml.html.HtmlElement:
+    """
+    Given URL or HTML, return lxml.html.Element, parsing incrementally.
+
+    Unlike _parse_url_or_html, the body is fed to the parser in pieces
+    as it is downloaded, whitespace is collapsed per text node, and if
+    selector is given, subtrees that do not match and do not contain a
+    match are discarded as soon as they have been parsed.
+    """
+    matches = _compile_element_selector(selector) if selector else None
+    orig_url = None
+    pieces: typing.Iterable[bytes | str]
+    # closes the streamed response, if there is one
+    stack = contextlib.ExitStack()
+    if url_or_html.startswith("http"):
+        orig_url = url_or_html
+        resp = stack.enter_context(requests.get(url_or_html, stream=True))
+        pieces = resp.iter_content(STREAM_CHUNK_SIZE)
+        # only trust an explicit charset, otherwise let lxml detect it
+        encoding = (
+            resp.encoding if "charset" in resp.headers.get("content-type", "") else None
+        )
+    else:
+        pieces = (
+            url_or_html[i : i + STREAM_CHUNK_SIZE]
+            for i in range(0, len(url_or_html), STREAM_CHUNK_SIZE)
+        )
+        encoding = None
+
+    parser = lxml.etree.HTMLPullParser(events=("start", "end"), encoding=encoding)
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    # whether each open element matched, and how many open elements matched
+    matched_stack: list[bool] = []
+    open_matches = 0
+    found = False
+    # elements containing a match, which must be kept
+    containers: set = set()
+
+    def handle_events() -> None:
+        nonlocal open_matches, found
+        for event, el in parser.read_events():
+            if event == "start":
+                matched = bool(matches and matches(el))
+                matched_stack.append(matched)
+                open_matches += matched
+                found = found or matched
+                continue
+
+            # end: el and its children (including their tails) are complete
+            if el.text:
+                el.text = _collapse_re.sub(" ", el.text)
+            for child in el:
+                if child.tail:
+                    child.tail = _collapse_re.sub(" ", child.tail)
+
+            matched = matched_stack.pop()
+            open_matches -= matched
+            parent = el.getparent()
+            if matched:
+                for ancestor in el.iterancestors():
+                    if ancestor in containers:
+                        break
+                    containers.add(ancestor)
+            elif (
+                matches
+                and not open_matches
+                and parent is not None
+                and el not in containers
+            ):
+                parent.remove(el)
+            containers.discard(el)
+
+    length = 0
+    with stack:
+        for piece in pieces:
+            length += len(piece)
+            parser.feed(piece)
+            handle_events()
+    doc = parser.close()
+    handle_events()
+
+    logger.debug("streamed HTML", length=length, url=orig_url)
+    if matches and not found:
+        raise PreprocessorError(f"Stream selector {selector} matched nothing")
+    if orig_url:
+        doc.make_links_absolute(orig_url)
+    return doc
+
+
+def _chunk_tags(
+    tags: list, max_tokens: int, model: str, serialize: Serializer = _tostr
+) -> list[str]:
     """
     Given a list of all matching HTML tags, recombine into HTML chunks
     that can be passed to API.
     """
+    doc = Document(tags, serialize)
+    return [doc.join(nodes) for nodes in _tag_chunks(doc, doc.nodes, max_tokens, model)]
+
+
+def _tag_chunks(
+    doc: Document,
+    nodes: Sequence[int],
+    max_tokens: int,
+    model: str,
+    estimator: TokenEstimator | None = None,
+) -> list[Sequence[int]]:
+    """
+    Like _chunk_tags, but chunks nodes of a Document, returning slices
+    of nodes so that chunks can be split further.  Chunks are only
+    joined into HTML when they're sent.
+
+    With an estimator, node tokens are estimated, and only counted
+    exactly once the chunk's estimate is within the estimator's margin
+    of max_tokens (or over it), as in utils._count_tokens.
+    """
     chunks = []
     chunk_sizes = []
-    chunk = ""
+    start = 0
     chunk_tokens = 0
-    for tag in tags:
-        tag_html = _tostr(tag)
-        tag_tokens = _tokens(model, tag_html)
-        # if adding tag would exceed max_tokens, start new chunk (unless chunk is empty)
-        if chunk_tokens + tag_tokens > max_tokens and chunk_tokens > 0:
-            chunks.append(chunk)
+    for i, node in enumerate(nodes):
+        if estimator is None:
+            node_tokens = doc.tokens(node, model)
+        else:
+            node_tokens = estimator.estimate_length(len(doc.html[node]))
+            if chunk_tokens + node_tokens > max_tokens * (1 - estimator.margin):
+                node_tokens = doc.tokens(node, model)
+        # start a new chunk if node would exceed max_tokens, unless it's empty
+        if chunk_tokens + node_tokens > max_tokens and chunk_tokens > 0:
+            chunks.append(nodes[start:i])
             chunk_sizes.append(chunk_tokens)
-            chunk = ""
+            start = i
             chunk_tokens = 0
-        chunk += tag_html
-        chunk_tokens += tag_tokens
+        chunk_tokens += node_tokens
 
-    chunks.append(chunk)
+    chunks.append(nodes[start:])
     chunk_sizes.append(chunk_tokens)
     logger.debug(
         "chunked tags",
@@ -230,6 +1047,36 @@ def _chunk_tags(tags: list, max_tokens: int, model: str) -> list[str]:
     return chunks
 
 
+def _finish_chunks(running: dict[Future, Any]) -> list[Response]:
+    """
+    Wait for chunks that are still running, returning the responses
+    they paid for (whether they succeeded or failed).
+    """
+    wait(running)
+    paid: list[Response] = []
+    for future in running:
+        error = future.exception()
+        if error is None:
+            paid.append(future.result())
+        else:
+            paid.extend(getattr(error, "failed_responses", []))
+    return paid
+
+
+def _bisect_chunk(
+    position: tuple[int, ...], nodes: Sequence[int], attempts: int
+) -> list[tuple[tuple[int, ...], Sequence[int], int]]:
+    """
+    Split a chunk's nodes in half, returning pending entries for
+    SchemaScraper._scrape_tagged_chunks.
+    """
+    half = len(nodes) // 2
+    return [
+        (position + (i,), part, attempts)
+        for i, part in enumerate((nodes[:half], nodes[half:]))
+    ]
+
+
 def _pydantic_to_simple_schema(pydantic_model: Type[BaseModel]) -> dict:
     """
     Given a Pydantic model, return a simple schema that can be used
@@ -261,6 +1108,106 @@ def _pydantic_to_simple_schema(pydantic_model: Type[BaseModel]) -> dict:
     return schema
 
 
+def _schema_keywords(schema: dict | list | str) -> list[str]:
+    """
+    Return the field names in a simple schema, or the words in a
+    free-form string schema.
+    """
+    if isinstance(schema, dict):
+        keywords = []
+        for key, value in schema.items():
+            keywords.append(key)
+            keywords.extend(_schema_keywords(value))
+        return keywords
+    elif isinstance(schema, list):
+        return [k for item in schema for k in _schema_keywords(item)]
+    elif isinstance(schema, str) and " " in schema:
+        # free-form schema description
+        return schema.split()
+    return []
+
+
+def _schema_has_list(schema: dict | list | str) -> bool:
+    if isinstance(schema, list):
+        return True
+    elif isinstance(schema, dict):
+        return any(_schema_has_list(v) for v in schema.values())
+    return False
+
+
+_SIMPLE_JSON_TYPES = {
+    "str": "string",
+    "string": "string",
+    "int": "integer",
+    "integer": "integer",
+    "float": "number",
+    "number": "number",
+    "bool": "boolean",
+    "boolean": "boolean",
+}
+
+
+def _simple_to_json_schema(schema: dict | list | str) -> dict:
+    """
+    Given a simple schema like {"name": "str", "tags": ["str"]}, return
+    the equivalent JSON Schema.
+
+    Unknown type names (e.g. "url") are treated as strings, and all
+    scalar values are nullable since pages may omit them.
+    """
+    if isinstance(schema, dict):
+        return {
+            "type": "object",
+            "properties": {k: _simple_to_json_schema(v) for k, v in schema.items()},
+        }
+    elif isinstance(schema, list):
+        return {
+            "type": "array",
+            "items": _simple_to_json_schema(schema[0] if schema else "str"),
+        }
+    return {"type": [_SIMPLE_JSON_TYPES.get(str(schema).lower(), "string"), "null"]}
+
+
+def _strict_json_schema(schema: dict) -> dict:
+    """
+    Given a JSON Schema, return a copy that meets the requirements of
+    OpenAI's strict structured outputs: every property is required,
+    no additional properties are allowed, and defaults are removed.
+
+    Raises ValueError for objects with arbitrary keys (e.g. dict[str, X]
+    fields), which strict mode can't express.
+    """
+    types = schema.get("type")
+    if (types == "object" or isinstance(types, list) and "object" in types) and (
+        not schema.get("properties") or schema.get("additionalProperties", False)
+    ):
+        raise ValueError(
+            "structured_output requires objects with fixed properties, "
+            f"not arbitrary keys: {schema}"
+        )
+    strict: dict = {}
+    for key, value in schema.items():
+        if key in ("default", "title"):
+            continue
+        elif key in ("properties", "$defs"):
+            # mappings of names to schemas
+            strict[key] = {
+                name: _strict_json_schema(sub) for name, sub in value.items()
+            }
+        elif isinstance(value, dict):
+            strict[key] = _strict_json_schema(value)
+        elif isinstance(value, list):
+            strict[key] = [
+                _strict_json_schema(v) if isinstance(v, dict) else v for v in value
+            ]
+        else:
+            strict[key] = value
+    if "properties" in strict:
+        strict["additionalProperties"] = False
+        strict["required"] = list(strict["properties"])
+    return strict
+
+
 class PaginatedSchemaScraper(SchemaScraper):
     def __init__(self, schema: list | str | dict, **kwargs: Any):
         # modify schema to include next_page_link
@@ -287,6 +1234,7 @@ class PaginatedSchemaScraper(SchemaScraper):
             else:  # pragma: no cover
                 raise ValueError("PaginatedSchemaScraper requires object response")
             responses.append(resp)
+            sr.errors.extend(resp.errors)
             logger.debug(
                 "page results",
                 next_page=url,
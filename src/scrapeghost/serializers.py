@@ -0,0 +1,188 @@
+"""
+Serializers turn preprocessed nodes into the text sent to the model.
+
+Markup is often more than half of the tokens in a page, so the more
+compact serializers can substantially reduce cost.
+"""
+import re
+import html as _html
+import lxml.html
+from typing import Callable
+
+from .utils import _tostr
+
+Serializer = Callable[[lxml.html.HtmlElement], str]
+
+_BLOCK_TAGS = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "body",
+    "br",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "footer",
+    "form",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "hr",
+    "li",
+    "main",
+    "nav",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "tr",
+    "ul",
+}
+_VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+# attributes that usually hold data rather than presentation
+_KEEP_ATTRIBUTES = ("href", "src")
+_spaces_re = re.compile(r"[ \t\r\f\v]+")
+
+
+def html(node: lxml.html.HtmlElement) -> str:
+    """
+    Full HTML markup, the default.
+    """
+    return _tostr(node)
+
+
+def minimal_html(node: lxml.html.HtmlElement) -> str:
+    """
+    HTML with tag names only, keeping just the href and src attributes.
+    """
+    parts: list[str] = []
+    _walk_minimal(node, parts)
+    return "".join(parts)
+
+
+def _walk_minimal(el: lxml.html.HtmlElement, parts: list[str]) -> None:
+    if not isinstance(el.tag, str):
+        # comments and processing instructions
+        return
+    attrs = "".join(
+        f' {name}="{_html.escape(el.get(name))}"'
+        for name in _KEEP_ATTRIBUTES
+        if el.get(name)
+    )
+    parts.append(f"<{el.tag}{attrs}>")
+    parts.append(_html.escape(el.text or "", quote=False))
+    for child in el:
+        _walk_minimal(child, parts)
+        parts.append(_html.escape(child.tail or "", quote=False))
+    if el.tag not in _VOID_TAGS:
+        parts.append(f"</{el.tag}>")
+
+
+def text(node: lxml.html.HtmlElement) -> str:
+    """
+    Visible text, one line per block element, with link targets
+    given in angle brackets after the link text.
+    """
+    return _render(node, markdown=False)
+
+
+def markdown(node: lxml.html.HtmlElement) -> str:
+    """
+    Markdown: headings, list items, [links](url) and tables.
+    """
+    return _render(node, markdown=True)
+
+
+def _render(node: lxml.html.HtmlElement, markdown: bool) -> str:
+    parts: list[str] = []
+    _walk_text(node, parts, markdown)
+    lines = (_spaces_re.sub(" ", line).strip() for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def _walk_text(el: lxml.html.HtmlElement, parts: list[str], markdown: bool) -> None:
+    tag = el.tag
+    if not isinstance(tag, str):
+        return
+    if markdown and tag == "table":
+        parts.append("\n" + _markdown_table(el) + "\n")
+        return
+    if tag in _BLOCK_TAGS:
+        parts.append("\n")
+    if markdown and tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+        parts.append("#" * int(tag[1]) + " ")
+    elif tag == "li":
+        parts.append("- ")
+    elif tag in ("td", "th") and not markdown:
+        parts.append(" | ")
+    elif tag == "img" and el.get("alt"):
+        alt = el.get("alt")
+        parts.append(f"![{alt}]({el.get('src', '')})" if markdown else alt)
+
+    start = len(parts)
+    parts.append(el.text or "")
+    for child in el:
+        _walk_text(child, parts, markdown)
+        parts.append(child.tail or "")
+
+    href = el.get("href") if tag == "a" else None
+    if href:
+        if markdown:
+            parts.insert(start, "[")
+            parts.append(f"]({href})")
+        else:
+            parts.append(f" <{href}>")
+    if tag in _BLOCK_TAGS:
+        parts.append("\n")
+
+
+def _markdown_table(table: lxml.html.HtmlElement) -> str:
+    rows = []
+    for tr in table.iter("tr"):
+        rows.append(
+            [
+                _render(cell, markdown=True).replace("\n", " ").replace("|", "\\|")
+                for cell in tr
+                if cell.tag in ("td", "th")
+            ]
+        )
+    rows = [row for row in rows if row]
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    lines = []
+    for i, row in enumerate(rows):
+        row += [""] * (width - len(row))
+        lines.append("| " + " | ".join(row) + " |")
+        if i == 0:
+            lines.append("|" + " --- |" * width)
+    return "\n".join(lines)
+
+
+SERIALIZERS: dict[str, Serializer] = {
+    "html": html,
+    "minimal": minimal_html,
+    "text": text,
+    "markdown": markdown,
+}
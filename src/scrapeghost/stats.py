@@ -0,0 +1,267 @@
+"""
+Aggregate statistics about API usage.
+
+Everything is kept as running totals and fixed-bucket histograms, so
+memory use doesn't grow with the number of requests.  Statistics can
+also be served over HTTP in the Prometheus text format.
+"""
+import math
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300, math.inf)
+
+
+class Histogram:
+    """
+    Counts of observations in fixed buckets, used to estimate percentiles.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float | None:
+        """
+        Estimate the pth percentile, interpolating within its bucket.
+        """
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0
+                upper = min(self.buckets[i], self.max)
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return self.max  # pragma: no cover
+
+
+class StatsCollector:
+    """
+    Thread-safe collector of API usage statistics.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latency = Histogram()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.retries = 0
+        self.nudges = 0
+        self.hedged_requests = 0
+        self.escalations = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # model -> [requests, prompt tokens, completion tokens, cost]
+        self._by_model: dict[str, list] = {}
+        # finish reason -> [requests, cost]
+        self._by_finish_reason: dict[str, list] = {}
+
+    def record_request(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        api_time: float | None,
+        finish_reason: str | None,
+    ) -> None:
+        """
+        Record a completed API request.
+
+        api_time is None for requests whose response wasn't waited for
+        (e.g. hedged requests that lost), which are left out of latency.
+        """
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+            if api_time is not None:
+                self.latency.observe(api_time)
+            by_model = self._by_model.setdefault(model, [0, 0, 0, 0.0])
+            by_model[0] += 1
+            by_model[1] += prompt_tokens
+            by_model[2] += completion_tokens
+            by_model[3] += cost
+            by_reason = self._by_finish_reason.setdefault(str(finish_reason), [0, 0.0])
+            by_reason[0] += 1
+            by_reason[1] += cost
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_nudge(self) -> None:
+        with self._lock:
+            self.nudges += 1
+
+    def record_hedge(self) -> None:
+        with self._lock:
+            self.hedged_requests += 1
+
+    def record_escalation(self) -> None:
+        with self._lock:
+            self.escalations += 1
+
+    def record_cache(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def snapshot(self) -> dict:
+        """
+        Return a consistent copy of the statistics.
+        """
+        with self._lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "total_prompt_tokens": self.prompt_tokens,
+                "total_completion_tokens": self.completion_tokens,
+                "total_cost": self.cost,
+                "requests": self.requests,
+                "api_time": self.latency.sum,
+                "latency": {f"p{p}": self.latency.percentile(p) for p in (50, 95, 99)},
+                "tokens_per_second": (
+                    self.completion_tokens / self.latency.sum
+                    if self.latency.sum
+                    else None
+                ),
+                "retries": self.retries,
+                "nudges": self.nudges,
+                "hedged_requests": self.hedged_requests,
+                "escalations": self.escalations,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_rate": self.cache_hits / lookups if lookups else None,
+                "by_model": {
+                    model: {
+                        "requests": v[0],
+                        "prompt_tokens": v[1],
+                        "completion_tokens": v[2],
+                        "cost": v[3],
+                    }
+                    for model, v in self._by_model.items()
+                },
+                "by_finish_reason": {
+                    reason: {"requests": v[0], "cost": v[1]}
+                    for reason, v in self._by_finish_reason.items()
+                },
+            }
+
+    def prometheus(self, prefix: str = "scrapeghost") -> str:
+        """
+        Return the statistics in the Prometheus text exposition format.
+        """
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, help: str, samples: list) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                label_str = "{" + label_str + "}" if label_str else ""
+                lines.append(f"{prefix}_{name}{suffix}{label_str} {value}")
+
+        with self._lock:
+            by_model = {m: list(v) for m, v in self._by_model.items()}
+            by_reason = {r: list(v) for r, v in self._by_finish_reason.items()}
+            counts = list(self.latency.counts)
+            latency_sum, latency_count = self.latency.sum, self.latency.count
+            counters = {
+                "retries_total": (self.retries, "Requests retried"),
+                "nudges_total": (self.nudges, "Requests to fix invalid JSON"),
+                "hedged_requests_total": (self.hedged_requests, "Requests hedged"),
+                "escalations_total": (
+                    self.escalations,
+                    "Responses that failed postprocessing, retried with the next model",
+                ),
+                "cache_hits_total": (self.cache_hits, "Cache hits"),
+                "cache_misses_total": (self.cache_misses, "Cache misses"),
+            }
+
+        for i, (name, help) in enumerate(
+            (
+                ("requests_total", "API requests"),
+                ("prompt_tokens_total", "Prompt tokens"),
+                ("completion_tokens_total", "Completion tokens"),
+                ("cost_dollars_total", "Cost in dollars"),
+            )
+        ):
+            metric(
+                name,
+                "counter",
+                help,
+                [("", {"model": m}, v[i]) for m, v in sorted(by_model.items())],
+            )
+        metric(
+            "finish_reason_total",
+            "counter",
+            "API requests by finish reason",
+            [("", {"finish_reason": r}, v[0]) for r, v in sorted(by_reason.items())],
+        )
+        for name, (value, help) in counters.items():
+            metric(name, "counter", help, [("", {}, value)])
+
+        buckets = []
+        cumulative = 0
+        for bound, count in zip(self.latency.buckets, counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else str(bound)
+            buckets.append(("_bucket", {"le": le}, cumulative))
+        metric(
+            "api_latency_seconds",
+            "histogram",
+            "API response time",
+            buckets + [("_sum", {}, latency_sum), ("_count", {}, latency_count)],
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def serve_metrics(
+    collector: StatsCollector, port: int = 9100, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """
+    Serve the collector's statistics in the Prometheus text format
+    from a background thread.
+
+    Call shutdown() on the returned server to stop it.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = collector.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            # don't write a line to stderr for every scrape
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
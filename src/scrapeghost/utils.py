@@ -1,3 +1,6 @@
+import math
+import functools
+import threading
 import lxml.html
 import structlog
 import tiktoken
@@ -5,6 +8,16 @@ from .models import _model_dict
 
 logger = structlog.get_logger("scrapeghost")
 
+# characters per token assumed until calibrated, low so that
+# token counts are overestimated rather than underestimated
+DEFAULT_CHARS_PER_TOKEN = 3.0
+# estimates within this fraction of a limit are replaced by exact counts,
+# widened when estimates have been seen to undercount by more
+TOKEN_MARGIN = 0.2
+# calibration samples are clamped to this range, from dense scripts
+# such as Chinese (about one character per token) to English text
+CHARS_PER_TOKEN_RANGE = (0.5, 6.0)
+
 
 def _tostr(obj: lxml.html.HtmlElement) -> str:
     """
@@ -13,9 +26,95 @@ def _tostr(obj: lxml.html.HtmlElement) -> str:
     return lxml.html.tostring(obj, encoding="unicode")
 
 
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model)
+
+
 def _tokens(model: str, html: str) -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(html))
+    return len(_encoding(model).encode(html))
+
+
+class TokenEstimator:
+    """
+    Estimate token counts from the length of text, using a ratio of
+    characters per token calibrated from the usage the API reports.
+    """
+
+    def __init__(self, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+        self.samples = 0
+        # recent fraction by which estimates fell short of the API's count
+        self.error = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def margin(self) -> float:
+        """
+        The fraction of a limit within which estimates are replaced
+        by exact counts: TOKEN_MARGIN, or the observed error if larger.
+        """
+        return max(TOKEN_MARGIN, self.error)
+
+    def estimate(self, text: str) -> int:
+        return self.estimate_length(len(text))
+
+    def estimate_length(self, chars: int) -> int:
+        return math.ceil(chars / self.chars_per_token)
+
+    def calibrate(self, chars: int, tokens: int) -> None:
+        """
+        Update the ratio from a request of chars characters
+        that the API counted as tokens tokens.
+        """
+        if chars <= 0 or tokens <= 0:
+            return
+        low, high = CHARS_PER_TOKEN_RANGE
+        ratio = min(max(chars / tokens, low), high)
+        with self._lock:
+            # raised at once by an undercount, and eased back like the ratio
+            error = 1 - self.estimate_length(chars) / tokens
+            if error >= self.error:
+                self.error = error
+            else:
+                self.error += 0.1 * (error - self.error)
+            self.samples += 1
+            # the mean of the first samples, then a moving average
+            weight = max(1 / self.samples, 0.1)
+            self.chars_per_token += weight * (ratio - self.chars_per_token)
+
+
+def _count_tokens(
+    model: str,
+    html: str,
+    limit: int,
+    estimator: TokenEstimator | None,
+    known: int | None = None,
+) -> int:
+    """
+    Return an estimated token count for html if the estimate is clearly
+    under limit (by more than the estimator's margin), otherwise the
+    exact count.
+
+    known is a count already made from the parts of html, which is
+    used as the estimate (with or without an estimator).
+
+    Exact counts require a full encode of the text, which is only
+    worth doing when the answer affects whether the limit is exceeded.
+    A page is never rejected (or its model upgraded) on an estimate.
+    """
+    # counts from the parts are close, so only need the usual margin
+    margin = TOKEN_MARGIN
+    if known is not None:
+        estimate = known
+    elif estimator is None:
+        return _tokens(model, html)
+    else:
+        estimate = estimator.estimate(html)
+        margin = estimator.margin
+    if estimate <= limit * (1 - margin):
+        return estimate
+    return _tokens(model, html)
 
 
 def cost_estimate(html: str, model: str = "gpt-4") -> float:
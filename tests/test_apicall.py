@@ -1,6 +1,9 @@
+import threading
 import pytest
-from scrapeghost.apicall import OpenAiCall, RetryRule
+from scrapeghost import SchemaScraper, utils
+from scrapeghost.apicall import OpenAiCall, RetryRule, HedgeRule
 from scrapeghost.errors import MaxCostExceeded, TooManyTokens
+from scrapeghost.responses import Response, ApiUsage
 import openai
 from testutils import _mock_response, _timeout, patch_create
 
@@ -65,6 +68,24 @@ def test_model_fallback_token_limit_still_too_big():
         api_call.request(_make_n_tokens(20000))
 
 
+def test_known_tokens_reused(monkeypatch):
+    api_call = OpenAiCall(models=["gpt-3.5-turbo"])
+    encoding = utils._encoding("gpt-3.5-turbo").name
+    calls = []
+    monkeypatch.setattr(utils, "_tokens", lambda model, html: calls.append(html) or 7)
+    with patch_create() as create:
+        create.side_effect = _mock_response
+        # well under the limit, the chunk isn't encoded again
+        api_call._api_request("<p>x</p>" * 10, tokens={encoding: 50})
+        assert calls == []
+        # close to it, it is
+        api_call._api_request("<p>x</p>" * 10, tokens={encoding: 16000})
+        assert len(calls) == 1
+        # and counts in other encodings are ignored
+        api_call._api_request("<p>x</p>" * 10, tokens={"other": 16000})
+        assert len(calls) == 1
+
+
 def test_normal_retry():
     api_call = OpenAiCall(
         models=["gpt-3.5-turbo"],
@@ -122,8 +143,169 @@ def test_stats():
         for _ in range(20):
             api_call.request("<html>")
 
-    assert api_call.stats() == {
-        "total_cost": pytest.approx(0.042),
-        "total_prompt_tokens": 20000,
-        "total_completion_tokens": 2000,
-    }
+    stats = api_call.stats()
+    assert stats["total_cost"] == pytest.approx(0.042)
+    assert stats["total_prompt_tokens"] == 20000
+    assert stats["total_completion_tokens"] == 2000
+    assert stats["requests"] == 20
+    assert stats["by_model"]["gpt-3.5-turbo"]["requests"] == 20
+    assert stats["by_finish_reason"]["stop"]["cost"] == pytest.approx(0.042)
+    assert stats["latency"]["p50"] <= stats["latency"]["p99"]
+
+
+def test_stats_retries_and_nudges():
+    api_call = SchemaScraper({"name": "str"}, retry=RetryRule(2, 0))
+    with patch_create() as create:
+        create.side_effect = [
+            openai.APITimeoutError(request=None),
+            _mock_response(content="not json", finish_reason="stop"),
+            _mock_response(content='{"name": "Moltar"}'),
+        ]
+        api_call.scrape("<html>Moltar</html>")
+    stats = api_call.stats()
+    assert stats["retries"] == 1
+    assert stats["nudges"] == 1
+    assert stats["requests"] == 2
+
+
+def test_keep_api_responses_usage():
+    api_call = OpenAiCall(keep_api_responses="usage")
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            prompt_tokens=1000, completion_tokens=100
+        )
+        response = api_call._raw_api_request("gpt-4", [], Response())
+    (usage,) = response.api_responses
+    assert isinstance(usage, ApiUsage)
+    assert usage.model == "gpt-4"
+    assert usage.prompt_tokens == 1000
+    assert usage.completion_tokens == 100
+    assert usage.finish_reason == "stop"
+    assert usage.cost == response.total_cost
+
+
+def test_keep_api_responses_none():
+    api_call = OpenAiCall(keep_api_responses="none")
+    with patch_create() as create:
+        create.side_effect = _mock_response
+        response = api_call._raw_api_request("gpt-4", [], Response())
+    assert response.api_responses == []
+    assert response.total_prompt_tokens == 1
+    assert response.data == "hello world"
+
+
+def test_keep_api_responses_invalid():
+    with pytest.raises(ValueError):
+        OpenAiCall(keep_api_responses="some")
+
+
+def test_response_format():
+    api_call = OpenAiCall()
+    api_call.response_schema = {"type": "object"}
+    with patch_create() as create:
+        create.side_effect = _mock_response
+        api_call._raw_api_request("gpt-4o-mini", [], Response())
+        assert create.call_args.kwargs["response_format"] == {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "scrape",
+                "strict": True,
+                "schema": {"type": "object"},
+            },
+        }
+        api_call._raw_api_request("gpt-3.5-turbo-1106", [], Response())
+        assert create.call_args.kwargs["response_format"] == {"type": "json_object"}
+        api_call._raw_api_request("gpt-4", [], Response())
+        assert "response_format" not in create.call_args.kwargs
+
+
+def test_hedge_not_until_enough_samples():
+    api_call = OpenAiCall(hedge=HedgeRule(min_samples=3))
+    with patch_create() as create:
+        create.side_effect = _mock_response
+        api_call.request("<html>")
+        api_call.request("<html>")
+    assert api_call._hedge_delay() is None
+    api_call._api_times.append(0.5)
+    assert api_call._hedge_delay() == 0.5
+
+
+def test_hedged_request():
+    api_call = OpenAiCall(
+        models=["gpt-4", "gpt-3.5-turbo"],
+        hedge=HedgeRule(min_samples=2, model="gpt-3.5-turbo"),
+    )
+    api_call._api_times.extend([0.01, 0.01])
+    release = threading.Event()
+
+    def slow_primary(**kwargs):
+        if kwargs["model"] == "gpt-4":
+            release.wait(5)
+            return _mock_response(content="slow", prompt_tokens=1000)
+        return _mock_response(content="fast", prompt_tokens=1000)
+
+    with patch_create() as create:
+        create.side_effect = slow_primary
+        response = api_call.request("<html>")
+        assert response.data == "fast"
+        assert api_call.hedged_requests == 1
+        assert response.total_prompt_tokens == 1000
+        assert len(response.pending) == 1
+        # the slow request is still accounted once it finishes
+        release.set()
+        response.settle(5)
+    assert response.pending == []
+    assert response.total_prompt_tokens == 2000
+    assert api_call.total_prompt_tokens == 2000
+    assert api_call.total_cost == response.total_cost
+
+
+def test_hedged_scrape():
+    scraper = SchemaScraper(
+        {"name": "str"},
+        models=["gpt-4", "gpt-3.5-turbo"],
+        hedge=HedgeRule(min_samples=2, model="gpt-3.5-turbo"),
+    )
+    scraper._api_times.extend([0.01, 0.01])
+    release = threading.Event()
+
+    def slow_primary(**kwargs):
+        if kwargs["model"] == "gpt-4":
+            release.wait(5)
+            return _mock_response(content='{"name": "slow"}', prompt_tokens=1000)
+        return _mock_response(content='{"name": "fast"}', prompt_tokens=1000)
+
+    with patch_create() as create:
+        create.side_effect = slow_primary
+        sr = scraper.scrape("<html><p>fast</p></html>")
+        assert sr.data == {"name": "fast"}
+        assert len(sr.pending) == 1
+        assert sr.total_prompt_tokens == 1000
+        release.set()
+        sr.settle(5)
+    assert sr.total_prompt_tokens == 2000
+    assert sr.total_cost == pytest.approx(scraper.total_cost)
+
+
+def test_hedged_request_primary_wins():
+    api_call = OpenAiCall(models=["gpt-4"], hedge=HedgeRule(min_samples=1))
+    api_call._api_times.append(10)
+    with patch_create() as create:
+        create.side_effect = _mock_response
+        response = api_call.request("<html>")
+    assert create.call_count == 1
+    assert api_call.hedged_requests == 0
+    assert response.data == "hello world"
+
+
+def test_hedge_model_must_be_in_models():
+    with pytest.raises(ValueError):
+        OpenAiCall(models=["gpt-4"], hedge=HedgeRule(model="gpt-3.5-turbo"))
+
+
+def test_token_estimator_calibrated_from_usage():
+    api_call = OpenAiCall(models=["gpt-3.5-turbo"])
+    with patch_create() as create:
+        create.side_effect = [_mock_response(prompt_tokens=1000 + 4)]
+        api_call.request("x" * 4000)
+    assert api_call.token_estimator("gpt-3.5-turbo").chars_per_token == 4
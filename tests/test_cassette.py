@@ -0,0 +1,100 @@
+import json
+import pytest
+from scrapeghost import SchemaScraper, Cassette
+from scrapeghost.apicall import OpenAiCall
+from scrapeghost.errors import CassetteMiss
+from testutils import _mock_response, patch_create
+
+
+def _record(path):
+    api_call = OpenAiCall(models=["gpt-3.5-turbo"], cassette=Cassette(path, "record"))
+    with patch_create() as create:
+        create.side_effect = [
+            _mock_response(content="first", prompt_tokens=10),
+            _mock_response(content="second", prompt_tokens=10),
+        ]
+        api_call.request("<html>a</html>")
+        api_call.request("<html>b</html>")
+    return api_call
+
+
+def test_record(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    _record(path)
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(entries) == 2
+    assert entries[0]["request"]["model"] == "gpt-3.5-turbo"
+    assert entries[0]["request"]["messages"][-1]["content"] == "<html>a</html>"
+    assert entries[1]["response"]["choices"][0]["message"]["content"] == "second"
+    assert entries[0]["elapsed"] >= 0
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorded = _record(path)
+
+    api_call = OpenAiCall(models=["gpt-3.5-turbo"], cassette=Cassette(path))
+    with patch_create() as create:
+        # served out of order, since requests are matched by content
+        second = api_call.request("<html>b</html>")
+        first = api_call.request("<html>a</html>")
+    assert create.call_count == 0
+    assert first.data == "first"
+    assert second.data == "second"
+    for key in ("total_cost", "total_prompt_tokens", "total_completion_tokens"):
+        assert api_call.stats()[key] == recorded.stats()[key]
+
+
+def test_replay_repeats_and_misses(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    _record(path)
+
+    api_call = OpenAiCall(models=["gpt-3.5-turbo"], cassette=Cassette(path))
+    assert api_call.request("<html>a</html>").data == "first"
+    assert api_call.request("<html>a</html>").data == "first"
+    with pytest.raises(CassetteMiss):
+        api_call.request("<html>c</html>")
+
+
+def test_replay_latency(tmp_path, monkeypatch):
+    path = tmp_path / "cassette.jsonl"
+    path.write_text(
+        json.dumps(
+            {
+                "request": {
+                    "model": "gpt-3.5-turbo",
+                    "messages": [{"role": "user", "content": "<html>"}],
+                    "temperature": 0,
+                },
+                "response": _mock_response().model_dump(),
+                "elapsed": 2.0,
+            }
+        )
+        + "\n"
+    )
+    sleeps = []
+    monkeypatch.setattr("scrapeghost.cassette.time.sleep", sleeps.append)
+    api_call = OpenAiCall(
+        models=["gpt-3.5-turbo"], cassette=Cassette(path, latency=0.5)
+    )
+    api_call.request("<html>")
+    assert sleeps == [1.0]
+
+
+def test_scraper_replay(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    html = "<html><body><p>Ahsoka</p></body></html>"
+    scraper = SchemaScraper({"name": "str"}, cassette=Cassette(path, "record"))
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='{"name": "Ahsoka"}'
+        )
+        scraper(html)
+
+    scraper = SchemaScraper({"name": "str"}, cassette=Cassette(path))
+    assert scraper(html).data == {"name": "Ahsoka"}
+
+
+def test_bad_mode(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette(tmp_path / "cassette.jsonl", "rewind")
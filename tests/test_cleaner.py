@@ -0,0 +1,111 @@
+import copy
+import lxml.html
+import pytest
+from scrapeghost.cleaner import Cleaner
+from scrapeghost.utils import _tostr
+import test_pagination
+
+PAGE = """
+<html><head><title>T</title><style>p { color: red; }</style>
+<style type="text/javascript">alert(1)</style>
+<link rel="stylesheet" href="a.css"><meta charset="utf-8"></head>
+<body onload="go()" style="background: url('javascript:alert(1)')">
+<!-- comment --><!--[if IE]><p>ie</p><![endif]-->
+<a href="javascript:alert(1)" title="x" data-id="1">link</a>
+<a href=" j a v a%73cript:alert(1)">sneaky</a>
+<a href="/people/1">safe</a>
+<img src="data:image/png;base64,AAAA"><image src="x.png"></image>
+<p style="color: expression(alert(1))">styled</p>
+<form action="/q"><input name="q"><button>go</button>after</form>
+<object data="javascript:x" src="javascript:y"><param name="a">obj</object>
+<iframe src="f.html">frame</iframe><marquee>hi</marquee><custom>kept</custom>
+<iframe src="https://video.example.com/v">video</iframe>
+<embed src="http://a.example.com/e">
+<a href="#top">top</a><a href="/x" rel="external">x</a><a href="/y" rel="nofollow">y</a>
+<script>alert(1)</script>tail
+</body></html>
+"""
+
+
+def _clean(html, **kwargs):
+    doc = lxml.html.fromstring(html)
+    Cleaner(**kwargs)(doc)
+    return _tostr(doc)
+
+
+def test_cleaner_defaults():
+    html = _clean(PAGE)
+    assert "<script" not in html and "alert" not in html
+    assert "<!--" not in html and "ie</p>" not in html
+    assert "<form" not in html and "<input" not in html and "after" in html
+    assert "<object" not in html and "<iframe" not in html and "frame" in html
+    assert "<custom>kept</custom>" in html
+    assert 'href=""' in html
+    assert 'href="/people/1"' in html
+    assert "data-id" not in html and "onload" not in html
+    assert '<img src="x.png">' in html
+    assert "tail" in html
+
+
+def test_cleaner_style():
+    assert "<style" not in _clean(PAGE, style=True)
+    assert "style=" not in _clean(PAGE, style=True)
+    kept = _clean(PAGE, style=False, inline_style=False, safe_attrs_only=False)
+    assert "p { color: red; }" in kept
+    assert "expression" not in kept
+
+
+def test_cleaner_options():
+    html = _clean(PAGE, comments=False, forms=False, kill_tags={"custom"})
+    assert "<!-- comment -->" in html
+    # conditional comments are always removed
+    assert "ie</p>" not in html
+    assert "<form" in html and "<input" in html
+    assert "kept" not in html
+
+
+def test_cleaner_lxml_options():
+    html = _clean(PAGE, remove_unknown_tags=True)
+    assert "<custom>" not in html and "kept" in html
+    html = _clean(PAGE, allow_tags={"body", "a"})
+    assert "<p" not in html and "styled" in html and "<a" in html
+    html = _clean(PAGE, add_nofollow=True)
+    assert '<a href="/people/1" rel="nofollow">' in html
+    assert '<a href="#top">' in html
+    assert 'rel="external nofollow"' in html and 'rel="nofollow nofollow"' not in html
+    html = _clean(PAGE, host_whitelist={"video.example.com"})
+    assert '<iframe src="https://video.example.com/v">' in html
+    assert "<embed" not in html
+    with pytest.raises(ValueError):
+        Cleaner(allow_tags={"p"}, remove_unknown_tags=True)
+
+
+def test_cleaner_root():
+    assert _clean("<form><p>a</p></form>") == "<div><p>a</p></div>"
+    assert _clean("<script>a</script>") == "<div></div>"
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"style": True},
+        {"javascript": False, "safe_attrs_only": False},
+        {"comments": False, "links": False, "page_structure": False},
+        {"kill_tags": {"nav", "table"}, "remove_tags": {"a", "custom"}},
+        {"remove_unknown_tags": True},
+        {"allow_tags": {"html", "body", "div", "a", "p"}, "comments": False},
+        {"add_nofollow": True},
+        {"host_whitelist": {"video.example.com", "a.example.com"}},
+        {"host_whitelist": {"a.example.com"}, "whitelist_tags": None},
+    ],
+)
+def test_cleaner_matches_lxml(kwargs):
+    clean = pytest.importorskip("lxml.html.clean")
+    pages = [test_pagination.page1, test_pagination.page2, PAGE]
+    for page in pages:
+        expected = lxml.html.fromstring(page)
+        actual = copy.deepcopy(expected)
+        clean.Cleaner(**{"remove_unknown_tags": False, **kwargs})(expected)
+        Cleaner(**kwargs)(actual)
+        assert _tostr(actual) == _tostr(expected)
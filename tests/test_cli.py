@@ -0,0 +1,101 @@
+import json
+import threading
+import typer
+from typer.testing import CliRunner
+from scrapeghost import SchemaScraper
+from scrapeghost.cli import scrape, _scrape_many
+from testutils import _html, _mock_response, _respond, patch_create
+
+runner = CliRunner()
+app = typer.Typer()
+app.command()(scrape)
+
+SCHEMA = ["--schema", '{"name": "str"}']
+
+
+def _records(output):
+    return sorted(
+        (json.loads(line) for line in output.splitlines()), key=lambda r: r["url"]
+    )
+
+
+def test_cli_single():
+    with patch_create() as create:
+        create.side_effect = _respond
+        result = runner.invoke(app, SCHEMA + [_html("Ahsoka")])
+    assert result.exit_code == 0
+    assert json.loads(result.stdout) == {"name": "Ahsoka"}
+
+
+def test_cli_no_url():
+    result = runner.invoke(app, SCHEMA)
+    assert result.exit_code == 2
+
+
+def test_cli_batch_stdin():
+    stdin = "\n".join(_html(name) for name in ("Ahsoka", "Rex", "broken")) + "\n"
+    with patch_create() as create:
+        create.side_effect = _respond
+        result = runner.invoke(app, SCHEMA + ["--concurrency", "2", "-"], input=stdin)
+    assert result.exit_code == 0
+    ahsoka, rex, broken = _records(result.stdout)
+    assert ahsoka["data"] == {"name": "Ahsoka"}
+    assert ahsoka["prompt_tokens"] == 1000
+    assert ahsoka["cost"] > 0
+    assert rex["data"] == {"name": "Rex"}
+    assert broken["error"].startswith("InvalidJSON")
+
+
+def test_cli_batch_url_file(tmp_path):
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text(_html("Ahsoka") + "\n\n" + _html("Rex") + "\n")
+    with patch_create() as create:
+        create.side_effect = _respond
+        result = runner.invoke(app, SCHEMA + ["--url-file", str(url_file)])
+    assert result.exit_code == 0
+    assert [r["data"]["name"] for r in _records(result.stdout)] == ["Ahsoka", "Rex"]
+
+
+def test_cli_cache_dir(tmp_path):
+    args = SCHEMA + ["--cache-dir", str(tmp_path), _html("Ahsoka"), _html("Rex")]
+    with patch_create() as create:
+        create.side_effect = _respond
+        first = runner.invoke(app, args)
+        second = runner.invoke(app, args)
+    assert create.call_count == 2
+    assert [r.get("cached") for r in _records(first.stdout)] == [None, None]
+    assert [r["cached"] for r in _records(second.stdout)] == [True, True]
+    assert [r["data"] for r in _records(second.stdout)] == [
+        r["data"] for r in _records(first.stdout)
+    ]
+
+
+def test_cli_max_cost():
+    stdin = "\n".join(_html(f"name{i}") for i in range(5)) + "\n"
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='{"name": "x"}', prompt_tokens=100000
+        )
+        result = runner.invoke(app, SCHEMA + ["--max-cost", "0.1", "-"], input=stdin)
+    assert result.exit_code == 0
+    # each page costs 0.15, so the second page is never started
+    assert create.call_count == 1
+    assert len(result.stdout.splitlines()) == 1
+
+
+def test_scrape_many_writes_before_next_url():
+    written = threading.Event()
+
+    def urls():
+        yield _html("Ahsoka")
+        # like stdin, the next URL only arrives once the first page is written
+        assert written.wait(5)
+        yield _html("Rex")
+
+    scraper = SchemaScraper({"name": "str"})
+    with patch_create() as create:
+        create.side_effect = _respond
+        records = _scrape_many(scraper, urls(), 2, None, [])
+        assert next(records)["data"] == {"name": "Ahsoka"}
+        written.set()
+        assert [r["data"] for r in records] == [{"name": "Rex"}]
@@ -0,0 +1,51 @@
+import lxml.html
+from scrapeghost import document
+from scrapeghost.document import Document
+
+
+def _doc(*html):
+    return Document([lxml.html.fromstring(h) for h in html])
+
+
+def test_document_text():
+    doc = _doc("<li>one</li>", "<li>two</li>", "<li>three</li>")
+    assert doc.text == "<li>one</li>\n<li>two</li>\n<li>three</li>"
+    assert len(doc) == 3
+    assert doc.nodes == range(3)
+    assert doc.html == ["<li>one</li>", "<li>two</li>", "<li>three</li>"]
+
+
+def test_document_serializer():
+    doc = Document([lxml.html.fromstring("<p>hi <b>there</b></p>")], lambda el: "x")
+    assert doc.text == "x"
+
+
+def test_document_join():
+    doc = _doc("<li>1</li>", "<li>2</li>", "<li>3</li>")
+    one, two, three = doc.nodes
+    assert doc.join([one, two]) == "<li>1</li>\n<li>2</li>"
+    assert doc.join([one, three]) == "<li>1</li>\n<li>3</li>"
+    assert doc.join(doc.nodes) == doc.text
+
+
+def test_document_tokens_counted_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        document, "_tokens", lambda model, html: calls.append(html) or 7
+    )
+    doc = _doc("<li>1</li>", "<li>2</li>")
+    assert doc.tokens(0, "gpt-4") == 7
+    assert doc.tokens(0, "gpt-4") == 7
+    assert calls == ["<li>1</li>"]
+
+
+def test_document_known_tokens(monkeypatch):
+    monkeypatch.setattr(document, "_tokens", lambda model, html: 7)
+    doc = _doc("<li>1</li>", "<li>2</li>", "<li>3</li>")
+    assert doc.known_tokens(range(2)) == {}
+    doc.tokens(0, "gpt-4")
+    # the second node hasn't been counted
+    assert doc.known_tokens(range(2)) == {}
+    doc.tokens(1, "gpt-4")
+    # and a token for the newline between them
+    assert doc.known_tokens(range(2)) == {doc.encoding: 15}
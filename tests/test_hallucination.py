@@ -43,3 +43,57 @@ def test_hallucination_checker_list():
     # hallucination
     with pytest.raises(PostprocessingError):
         hpp(response, None)
+
+
+def test_hallucination_checker_normalizes_whitespace():
+    response = ScrapeResponse(
+        parsed_html=lxml.html.fromstring(
+            "<div><p>Space   Ghost\n  <b>Coast</b> to Coast</p>"
+            "<p>Zorak &amp; Moltar</p></div>"
+        ),
+        data={"show": "Space Ghost Coast to Coast", "crew": "Zorak & Moltar"},
+    )
+    HallucinationChecker()(response, None)
+
+
+def test_hallucination_checker_ignores_markup():
+    response = ScrapeResponse(
+        parsed_html=lxml.html.fromstring("<div><p class='Brak'>Moltar</p></div>"),
+        data={"name": "p class"},
+    )
+    with pytest.raises(PostprocessingError):
+        HallucinationChecker()(response, None)
+
+
+def test_hallucination_checker_min_similarity():
+    response = ScrapeResponse(
+        parsed_html=lxml.html.fromstring("<div><p>Chad Ghostal, Space Ghost</p></div>"),
+        data={"name": "space ghost (chad ghostal)"},
+    )
+    with pytest.raises(PostprocessingError):
+        HallucinationChecker()(response, None)
+    HallucinationChecker(min_similarity=0.5)(response, None)
+
+
+def test_hallucination_checker_similarity_ignores_punctuation():
+    response = ScrapeResponse(
+        parsed_html=lxml.html.fromstring("<p>Zorak, Moltar and Brak</p>"),
+        data={"crew": "Zorak (Moltar)"},
+    )
+    HallucinationChecker(min_similarity=1.0)(response, None)
+
+
+def test_hallucination_checker_reuses_index():
+    doc = lxml.html.fromstring("<div><p>Moltar</p><p>Brak</p></div>")
+    other = lxml.html.fromstring("<p>Zorak</p>")
+    hpp = HallucinationChecker()
+    hpp(ScrapeResponse(parsed_html=doc, data=["Moltar"]), None)
+    index = hpp._indexes[doc]
+    # checking another page in between (as another thread would) keeps it
+    hpp(ScrapeResponse(parsed_html=other, data=["Zorak"]), None)
+    hpp(ScrapeResponse(parsed_html=doc, data=["Brak"]), None)
+    assert hpp._indexes[doc] is index
+    assert hpp._indexes[other] is not index
+
+    del other
+    assert len(hpp._indexes) == 1
@@ -0,0 +1,164 @@
+import threading
+import pytest
+from scrapeghost.jobs import MemoryQueue, SQLiteQueue, Worker
+from testutils import _html, _mock_response, _respond, patch_create
+
+CONFIG = {"schema": {"name": "str"}, "models": ["gpt-3.5-turbo"]}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path):
+    if request.param == "memory":
+        return MemoryQueue()
+    return SQLiteQueue(tmp_path / "jobs.db")
+
+
+def test_worker_runs_jobs(queue):
+    for name in ("Ahsoka", "Rex", "broken"):
+        queue.push(_html(name), CONFIG)
+
+    with patch_create() as create:
+        create.side_effect = _respond
+        assert Worker(queue, name="w1").run() == 3
+
+    done = queue.jobs("done")
+    assert [job.data for job in done] == [{"name": "Ahsoka"}, {"name": "Rex"}]
+    assert all(job.worker == "w1" for job in done)
+    assert done[0].prompt_tokens == 1000
+    assert done[0].cost == pytest.approx(0.00201)
+    (failed,) = queue.jobs("failed")
+    assert failed.error.startswith("InvalidJSON")
+    # failed jobs still count towards the total
+    assert failed.cost > 0
+    assert queue.total_cost() == pytest.approx(sum(j.cost for j in queue.jobs()))
+
+
+def test_worker_reuses_scrapers(queue):
+    queue.push(_html("Ahsoka"), CONFIG)
+    queue.push(_html("Rex"), CONFIG)
+    worker = Worker(queue)
+    with patch_create() as create:
+        create.side_effect = _respond
+        worker.run()
+    assert len(worker._scrapers) == 1
+
+
+def test_worker_limit(queue):
+    for name in ("Ahsoka", "Rex"):
+        queue.push(_html(name), CONFIG)
+    with patch_create() as create:
+        create.side_effect = _respond
+        assert Worker(queue).run(limit=1) == 1
+    assert len(queue.jobs("pending")) == 1
+
+
+def test_max_cost_across_workers(queue):
+    for name in ("Ahsoka", "Rex", "Cody", "Echo"):
+        queue.push(_html(name), CONFIG)
+    with patch_create() as create:
+        create.side_effect = _respond
+        # each job costs about 0.002
+        assert Worker(queue, max_cost=0.003).run() == 2
+        # a second worker sees the cost of the first worker's jobs
+        assert Worker(queue, max_cost=0.003).run() == 0
+    assert len(queue.jobs("pending")) == 2
+
+
+def test_max_cost_reserves_running_jobs(queue):
+    for name in ("Ahsoka", "Rex", "Cody", "Echo"):
+        queue.push(_html(name), CONFIG)
+    # two running jobs reserve the whole budget
+    first = queue.claim("w1", budget=0.002, max_cost=0.004)
+    second = queue.claim("w2", budget=0.002, max_cost=0.004)
+    assert first.budget == second.budget == 0.002
+    assert queue.claim("w3", budget=0.002, max_cost=0.004) is None
+    # once one finishes, what it didn't spend can be reserved again
+    first.status = "done"
+    first.cost = 0.001
+    queue.finish(first)
+    third = queue.claim("w3", budget=0.002, max_cost=0.004)
+    assert third.budget == pytest.approx(0.001)
+
+
+def test_job_over_budget_fails_alone(queue):
+    for name in ("broken", "Rex"):
+        queue.push(_html(name), CONFIG)
+
+    def respond(**kwargs):
+        if "broken" in kwargs["messages"][-1]["content"]:
+            # expensive enough that the nudge request would go over budget
+            return _mock_response(content="not json", prompt_tokens=1000)
+        return _respond(**kwargs)
+
+    with patch_create() as create:
+        create.side_effect = respond
+        assert Worker(queue, job_budget=0.001).run() == 2
+    (failed,) = queue.jobs("failed")
+    assert failed.error.startswith("MaxCostExceeded")
+    # the next job still ran
+    assert [job.data for job in queue.jobs("done")] == [{"name": "Rex"}]
+
+
+def test_max_cost_across_concurrent_workers(queue):
+    for i in range(10):
+        queue.push(_html(f"name{i}"), CONFIG)
+    barrier = threading.Barrier(3, timeout=5)
+
+    def respond(**kwargs):
+        # all workers have claimed a job before any finishes
+        if "<p>" in kwargs["messages"][-1]["content"]:
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+        return _respond(**kwargs)
+
+    with patch_create() as create:
+        create.side_effect = respond
+        workers = [
+            Worker(queue, max_cost=0.006, job_budget=0.002, name=f"w{i}")
+            for i in range(4)
+        ]
+        for worker in workers:
+            worker.claim_wait = 0.01
+        threads = [threading.Thread(target=w.run) for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    # only three jobs fit in max_cost at once, however many workers run
+    assert len(queue.jobs("done")) == 3
+    assert queue.total_cost() == pytest.approx(0.00603)
+
+
+def test_abandoned_jobs_are_reclaimed(queue):
+    queue.push(_html("Ahsoka"), CONFIG)
+    job = queue.claim("dead")
+    assert queue.claim("w1") is None
+    # the first worker's lease runs out
+    queue.lease = 0
+    reclaimed = queue.claim("w1")
+    assert reclaimed.id == job.id
+    assert reclaimed.worker == "w1"
+    assert queue.jobs("running")[0].worker == "w1"
+
+
+def test_concurrent_workers_claim_each_job_once(queue):
+    for i in range(20):
+        queue.push(_html(f"name{i}"), CONFIG)
+
+    with patch_create() as create:
+        create.side_effect = _respond
+        workers = [Worker(queue, name=f"w{i}") for i in range(4)]
+        threads = [threading.Thread(target=w.run) for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    done = queue.jobs("done")
+    assert len(done) == 20
+    assert sorted(job.data["name"] for job in done) == sorted(
+        f"name{i}" for i in range(20)
+    )
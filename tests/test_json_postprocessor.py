@@ -3,6 +3,7 @@ from scrapeghost import SchemaScraper
 from scrapeghost.postprocessors import JSONPostprocessor
 from scrapeghost.responses import Response
 from scrapeghost.errors import InvalidJSON, PostprocessingError
+from scrapeghost.jsonrepair import repair_json
 from testutils import patch_create, _mock_response
 
 
@@ -17,7 +18,7 @@ def test_json_already_processed():
 def test_json_no_nudge():
     # single quotes, trailing commas
     bad_json = "{'name': 'phil', }"
-    jpp = JSONPostprocessor(nudge=False)
+    jpp = JSONPostprocessor(nudge=False, repair=False)
     r = Response(data=bad_json)
     with pytest.raises(InvalidJSON):
         jpp(r, scraper=SchemaScraper({"name": "string"}))
@@ -27,7 +28,7 @@ def test_json_no_nudge():
 def test_json_nudge():
     # single quotes, trailing commas
     bad_json = "{'name': 'phil', }"
-    jpp = JSONPostprocessor(nudge=True)
+    jpp = JSONPostprocessor(nudge=True, repair=False)
     r = Response(data=bad_json)
     with patch_create() as create:
         create.side_effect = lambda **kwargs: _mock_response(content='{"name": "phil"}')
@@ -39,7 +40,7 @@ def test_json_nudge():
 def test_nudge_fails():
     # single quotes, trailing commas
     bad_json = "{'name': 'phil', }"
-    jpp = JSONPostprocessor(nudge=True)
+    jpp = JSONPostprocessor(nudge=True, repair=False)
     r = Response(data=bad_json)
     with pytest.raises(InvalidJSON):
         with patch_create() as create:
@@ -47,3 +48,56 @@ def test_nudge_fails():
                 content='{"name": "phil'
             )
             jpp(r, scraper=SchemaScraper({"name": "string"}))
+
+
+@pytest.mark.parametrize(
+    "bad_json,expected",
+    [
+        ("{'name': 'phil', }", {"name": "phil"}),
+        ('```json\n{"name": "phil"}\n```', {"name": "phil"}),
+        ("Here is the JSON: [1, 2, 3,]. Enjoy!", [1, 2, 3]),
+        ("{'active': True, 'age': None}", {"active": True, "age": None}),
+        ("{'quote': 'it\\'s', \"u\": \"\\u00e9\"}", {"quote": "it's", "u": "\u00e9"}),
+    ],
+)
+def test_repair_json(bad_json, expected):
+    assert repair_json(bad_json) == (expected, False)
+
+
+def test_repair_json_truncated_list():
+    data, salvaged = repair_json('[{"name": "a", "tags": ["x"]}, {"name": "b", "ta')
+    assert data == [{"name": "a", "tags": ["x"]}]
+    assert salvaged
+
+    data, salvaged = repair_json('{"next_page": "/2", "results": [{"n": 1}, {"n"')
+    assert data == {"next_page": "/2", "results": [{"n": 1}]}
+    assert salvaged
+
+
+def test_repair_json_truncated_nested_list():
+    # an incomplete list inside a list is dropped, not kept with partial contents
+    data, salvaged = repair_json('[["name", "phone"], ["A", "1"], ["B", "2')
+    assert data == [["name", "phone"], ["A", "1"]]
+    assert salvaged
+
+    data, salvaged = repair_json('[{"tags": ["x"]}, {"tags": ["y", "z')
+    assert data == [{"tags": ["x"]}]
+    assert salvaged
+
+
+def test_repair_json_unrepairable():
+    with pytest.raises(InvalidJSON):
+        repair_json("no json here")
+    with pytest.raises(InvalidJSON):
+        repair_json('{"name": "phi')
+
+
+def test_json_repair_avoids_nudge():
+    jpp = JSONPostprocessor(nudge=True)
+    r = Response(data="{'name': 'phil', }")
+    with patch_create() as create:
+        repaired = jpp(r, scraper=SchemaScraper({"name": "string"}))
+    assert create.call_count == 0
+    assert repaired.data == {"name": "phil"}
+    assert jpp.repaired == 1
+    assert jpp.nudged == 0
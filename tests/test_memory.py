@@ -0,0 +1,26 @@
+import sys
+import json
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "benchmarks"))
+
+import memory  # noqa: E402
+
+
+def test_synthetic_page_size():
+    page = memory.synthetic_page(100_000)
+    assert 100_000 <= len(page) < 101_000
+
+
+def test_memory_regressions():
+    baseline = json.loads(memory.BASELINE_PATH.read_text())
+    results = memory.profile(2**19)
+    assert set(results) == set(memory.STAGES)
+    assert memory.regressions(0.5, results, baseline) == []
+
+
+def test_regressions_detected():
+    baseline = {"1": {"parse": 1_000_000}}
+    results = {"parse": {"peak": 2_000_000, "rss_growth": 0}}
+    (problem,) = memory.regressions(1, results, baseline)
+    assert problem.startswith("1MB parse")
@@ -1,5 +1,11 @@
 import lxml.html
-from scrapeghost.preprocessors import CleanHTML, XPath, CSS
+from scrapeghost.preprocessors import (
+    CleanHTML,
+    XPath,
+    CSS,
+    RelevancePruner,
+    _fuse_selectors,
+)
 from scrapeghost.utils import _tostr
 
 
@@ -28,3 +34,75 @@ def test_select_tags_xpath():
     )
     tags = XPath("//p")(doc)
     assert len(tags) == 3
+
+
+def test_css_matches_cssselect():
+    doc = lxml.html.fromstring(
+        "<html><body><p class='a b'>one</p><p class='b'>two</p>"
+        "<div><p>three</p></div></body></html>"
+    )
+    for selector in ("p.b", "div p, p.a", "body > p:first-child"):
+        assert CSS(selector)(doc) == doc.cssselect(selector)
+
+
+def test_fused_css():
+    doc = lxml.html.fromstring(
+        "<html><body><table class='x'><tr><td>1</td></tr><tr><td>2</td></tr>"
+        "</table><table><tr><td>3</td></tr></table></body></html>"
+    )
+    steps = [CSS("table.x"), CSS("tr"), CSS("td")]
+    (fused,) = _fuse_selectors(steps)
+    assert str(fused) == "CSS(table.x >> tr >> td)"
+
+    nodes = [doc]
+    for step in steps:
+        nodes = [n for node in nodes for n in step(node)]
+    assert fused(doc) == nodes
+    assert [n.text for n in nodes] == ["1", "2"]
+
+
+def test_fuse_selectors_only_css():
+    steps = [CleanHTML(), CSS("table"), XPath(".//tr"), CSS("td"), CSS("a")]
+    fused = _fuse_selectors(steps)
+    assert [str(p) for p in fused] == [
+        "CleanHTML",
+        "CSS(table)",
+        "XPath(.//tr)",
+        "CSS(td >> a)",
+    ]
+
+
+PRUNE_PAGE = (
+    "<html><body>"
+    "<nav class='menu'>"
+    + "".join(f"<a href='/{i}'>Section number {i}</a>" for i in range(30))
+    + "</nav>"
+    "<div class='promo'><p>Subscribe to our newsletter for weekly deals and more "
+    "great content delivered directly to your inbox.</p></div>"
+    "<ul class='staff'>"
+    + "".join(
+        f"<li class='person'><b>Name: Person {i}</b> Phone: 555-010{i} "
+        f"Office: Room {i}</li>"
+        for i in range(8)
+    )
+    + "</ul>"
+    "<footer><p>Copyright, privacy policy, terms of service, contact us.</p></footer>"
+    "</body></html>"
+)
+
+
+def test_relevance_pruner():
+    doc = lxml.html.fromstring(PRUNE_PAGE)
+    pruner = RelevancePruner(["name", "phone", "office"], max_tokens=200, repeated=True)
+    nodes = pruner(doc)
+    assert [n.get("class") for n in nodes] == ["staff"]
+
+
+def test_relevance_pruner_small_page():
+    doc = lxml.html.fromstring("<div><p>Name: Zorak</p></div>")
+    assert RelevancePruner(["name"], max_tokens=200)(doc) == [doc]
+
+
+def test_relevance_pruner_keywords():
+    pruner = RelevancePruner(["home_planet", "firstName", "x"], max_tokens=1)
+    assert pruner.keywords == {"home", "planet", "first", "name"}
@@ -1,9 +1,16 @@
+import json
 import pytest
 from pydantic import BaseModel, ValidationError
-from scrapeghost.scrapers import SchemaScraper, _pydantic_to_simple_schema
+from scrapeghost.scrapers import (
+    SchemaScraper,
+    _pydantic_to_simple_schema,
+    _simple_to_json_schema,
+    _strict_json_schema,
+)
 from scrapeghost.errors import PostprocessingError
 from scrapeghost.responses import Response
-from scrapeghost.postprocessors import PydanticPostprocessor
+from scrapeghost.postprocessors import PydanticPostprocessor, JSONPostprocessor
+from testutils import patch_create, _mock_response
 
 
 class CrewMember(BaseModel):
@@ -120,3 +127,163 @@ def test_pydantic_non_dict():
     with pytest.raises(PostprocessingError):
         pdp = PydanticPostprocessor(CrewMember)
         resp = pdp(resp, None)
+
+
+def test_strict_json_schema_from_pydantic():
+    schema = _strict_json_schema(CrewMemberExtended.model_json_schema())
+    assert schema["additionalProperties"] is False
+    assert schema["required"] == [
+        "name",
+        "role",
+        "home_planet",
+        "age",
+        "friends",
+        "captain",
+    ]
+    assert "default" not in schema["properties"]["age"]
+    assert schema["$defs"]["CrewMember"]["additionalProperties"] is False
+
+
+def test_simple_to_json_schema():
+    assert _strict_json_schema(
+        _simple_to_json_schema({"name": "str", "age": "int", "tags": ["url"]})
+    ) == {
+        "type": "object",
+        "properties": {
+            "name": {"type": ["string", "null"]},
+            "age": {"type": ["integer", "null"]},
+            "tags": {"type": "array", "items": {"type": ["string", "null"]}},
+        },
+        "additionalProperties": False,
+        "required": ["name", "age", "tags"],
+    }
+
+
+def test_structured_output_scraper():
+    scraper = SchemaScraper(CrewMember, models=["gpt-4o-mini"], structured_output=True)
+    assert scraper.response_schema["required"] == [
+        "name",
+        "role",
+        "home_planet",
+        "age",
+    ]
+    # JSON is validated directly by pydantic, no nudging needed
+    assert len(scraper.postprocessors) == 1
+    assert scraper.postprocessors[0].from_json
+    assert not scraper.postprocessors[0].json_fallback.nudge
+
+    # a fallback model without structured outputs still nudges
+    scraper = SchemaScraper(
+        CrewMember, models=["gpt-4o-mini", "gpt-4"], structured_output=True
+    )
+    assert scraper.postprocessors[0].json_fallback.nudge
+
+
+def test_structured_output_requires_object_schema():
+    with pytest.raises(ValueError):
+        SchemaScraper(["str"], structured_output=True)
+    with pytest.raises(ValueError):
+        SchemaScraper({"name": "str"}, auto_split_length=100, structured_output=True)
+
+
+def test_structured_output_requires_supporting_model():
+    # neither default model supports structured outputs
+    with pytest.raises(ValueError, match="gpt-4o-mini"):
+        SchemaScraper({"name": "str"}, structured_output=True)
+
+
+class Ship(BaseModel):
+    name: str
+    crew: dict[str, str]
+
+
+def test_structured_output_rejects_arbitrary_keys():
+    models = ["gpt-4o-mini"]
+    with pytest.raises(ValueError, match="arbitrary keys"):
+        SchemaScraper(Ship, models=models, structured_output=True)
+    with pytest.raises(ValueError, match="arbitrary keys"):
+        SchemaScraper(
+            {"name": "str", "meta": {}}, models=models, structured_output=True
+        )
+
+
+def test_pydantic_postprocessor_from_json():
+    resp = Response(
+        data='{"name": "Zorak", "role": "Band Leader", "home_planet": "Dokar"}'
+    )
+    resp = PydanticPostprocessor(CrewMember, from_json=True)(resp, None)
+    assert resp.data == CrewMember(
+        name="Zorak", role="Band Leader", home_planet="Dokar"
+    )
+
+    with pytest.raises(ValidationError):
+        PydanticPostprocessor(CrewMember, from_json=True)(
+            Response(data='{"name": "Zorak"}'), None
+        )
+
+
+def test_pydantic_postprocessor_many():
+    pdp = PydanticPostprocessor(CrewMember, many=True)
+    resp = pdp(
+        Response(
+            data=[
+                {"name": "Zorak", "role": "Band Leader", "home_planet": "Dokar"},
+                {"name": "Moltar", "role": "Producer", "home_planet": "Tyr"},
+            ]
+        ),
+        None,
+    )
+    assert [c.name for c in resp.data] == ["Zorak", "Moltar"]
+
+    with pytest.raises(PostprocessingError):
+        pdp(Response(data={"name": "Zorak"}), None)
+
+
+def test_pydantic_postprocessor_many_from_json():
+    pdp = PydanticPostprocessor(CrewMember, from_json=True, many=True)
+    resp = pdp(
+        Response(
+            data='[{"name": "Zorak", "role": "Band Leader", "home_planet": "Dokar"}]'
+        ),
+        None,
+    )
+    assert resp.data == [
+        CrewMember(name="Zorak", role="Band Leader", home_planet="Dokar")
+    ]
+
+
+def test_pydantic_postprocessor_json_fallback():
+    bad_json = "{'name': 'Zorak', 'role': 'Band Leader', 'home_planet': 'Dokar',}"
+    pdp = PydanticPostprocessor(CrewMember, from_json=True)
+    with pytest.raises(ValidationError):
+        pdp(Response(data=bad_json), None)
+
+    fallback = JSONPostprocessor(nudge=False)
+    pdp = PydanticPostprocessor(CrewMember, from_json=True, json_fallback=fallback)
+    resp = pdp(Response(data=bad_json), None)
+    assert resp.data.name == "Zorak"
+    assert fallback.repaired == 1
+
+
+def test_pydantic_schema_scrape_auto_split():
+    scraper = SchemaScraper(CrewMember, auto_split_length=1000)
+    (pdp,) = scraper.postprocessors
+    assert pdp.many
+    assert not pdp.json_fallback.nudge
+
+
+def test_pydantic_schema_groups():
+    def respond(**kwargs):
+        schema = json.loads(kwargs["messages"][0]["content"].split("schema: ")[1])
+        crew = {"name": "Moltar", "role": "producer", "home_planet": "Ghost Planet"}
+        data = {key: crew.get(key, 7) for key in schema}
+        return _mock_response(content=json.dumps(data))
+
+    scraper = SchemaScraper(CrewMember, schema_groups=2)
+    with patch_create() as create:
+        create.side_effect = respond
+        result = scraper.scrape("<html><p>Moltar</p></html>")
+    assert create.call_count == 2
+    assert result.data == CrewMember(
+        name="Moltar", role="producer", home_planet="Ghost Planet", age=7
+    )
@@ -0,0 +1,192 @@
+import json
+import pytest
+from pydantic import BaseModel
+from scrapeghost import SchemaScraper, CSS, RowCache
+from testutils import _mock_response, patch_create
+
+
+def _page(*names):
+    rows = "".join(f"<li>{name}</li>" for name in names)
+    return f"<html><body><ul>{rows}</ul></body></html>"
+
+
+def _respond(**kwargs):
+    html = kwargs["messages"][-1]["content"]
+    names = [part.split("</li>")[0] for part in html.split("<li>")[1:]]
+    return _mock_response(
+        content=json.dumps(
+            [{"name": name, "_row": n} for n, name in enumerate(names, 1)]
+        )
+    )
+
+
+def _scraper(cache, schema=None, auto_split_length=1000):
+    return SchemaScraper(
+        schema or {"name": "str"},
+        [CSS("li")],
+        auto_split_length=auto_split_length,
+        row_cache=cache,
+    )
+
+
+def test_only_new_rows_scraped():
+    scraper = _scraper(RowCache())
+    with patch_create() as create:
+        create.side_effect = _respond
+        first = scraper.scrape(_page("Ahsoka", "Rex"))
+        second = scraper.scrape(_page("Ahsoka", "Cody", "Rex"))
+    assert first.data == [{"name": "Ahsoka"}, {"name": "Rex"}]
+    # both rows were sent in one chunk, and cached separately
+    assert create.call_count == 2
+    assert (
+        create.call_args.kwargs["messages"][-1]["content"] == "[row 1]\n<li>Cody</li>"
+    )
+    # cached items are merged back in document order
+    assert second.data == [{"name": "Ahsoka"}, {"name": "Cody"}, {"name": "Rex"}]
+    assert scraper.stats()["cache_hits"] == 2
+    assert scraper.stats()["cache_misses"] == 3
+
+
+def test_all_rows_cached():
+    scraper = _scraper(RowCache())
+    with patch_create() as create:
+        create.side_effect = _respond
+        scraper.scrape(_page("Ahsoka"))
+        result = scraper.scrape(_page("Ahsoka"))
+    assert create.call_count == 1
+    assert result.data == [{"name": "Ahsoka"}]
+    assert result.total_cost == 0
+
+
+def test_persisted(tmp_path):
+    path = tmp_path / "rows.jsonl"
+    with patch_create() as create:
+        create.side_effect = _respond
+        _scraper(RowCache(path)).scrape(_page("Ahsoka", "Rex"))
+        result = _scraper(RowCache(path)).scrape(_page("Ahsoka", "Rex"))
+    assert create.call_count == 1
+    assert result.data == [{"name": "Ahsoka"}, {"name": "Rex"}]
+
+
+def test_schema_change_not_reused():
+    cache = RowCache()
+    with patch_create() as create:
+        create.side_effect = _respond
+        _scraper(cache).scrape(_page("Ahsoka"))
+        _scraper(cache, {"name": "str", "rank": "str"}).scrape(_page("Ahsoka"))
+    assert create.call_count == 2
+
+
+def test_items_cached_by_row():
+    cache = RowCache()
+    scraper = _scraper(cache)
+    with patch_create() as create:
+        # out of order, and with two items from one row and none from another
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[{"name": "Rex", "_row": 3}, {"name": "Ahsoka", "_row": 1}, '
+            '{"name": "Fives", "_row": 3}]'
+        )
+        result = scraper.scrape(_page("Ahsoka", "Cody", "Rex"))
+        again = scraper.scrape(_page("Ahsoka", "Cody", "Rex"))
+    assert create.call_count == 1
+    expected = [{"name": "Ahsoka"}, {"name": "Rex"}, {"name": "Fives"}]
+    assert result.data == again.data == expected
+    assert len(cache) == 3
+
+
+def test_unattributable_items_not_cached():
+    cache = RowCache()
+    scraper = _scraper(cache)
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[{"name": "Ahsoka, Rex", "_row": 1}, {"name": "Cody"}]'
+        )
+        result = scraper.scrape(_page("Ahsoka", "Rex"))
+    # row numbers are removed even when the items can't be cached
+    assert result.data == [{"name": "Ahsoka, Rex"}, {"name": "Cody"}]
+    assert len(cache) == 0
+
+
+def test_unknown_row_not_cached():
+    cache = RowCache()
+    scraper = _scraper(cache)
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[{"name": "Ahsoka", "_row": 1}, {"name": "Rex", "_row": 5}]'
+        )
+        result = scraper.scrape(_page("Ahsoka", "Rex"))
+    assert result.data == [{"name": "Ahsoka"}, {"name": "Rex"}]
+    assert len(cache) == 0
+
+
+def test_object_not_cached():
+    cache = RowCache()
+    scraper = _scraper(cache)
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='{"name": "Ahsoka"}'
+        )
+        result = scraper.scrape(_page("Ahsoka", "Rex"))
+    # a single object is kept whole, not turned into a list of its keys
+    assert result.data == [{"name": "Ahsoka"}]
+    assert len(cache) == 0
+
+
+def test_truncated_not_cached():
+    cache = RowCache()
+    scraper = _scraper(cache)
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[{"name": "Ahsoka", "_row": 1}, {"name": "Re'
+        )
+        result = scraper.scrape(_page("Ahsoka", "Rex"))
+    assert result.data == [{"name": "Ahsoka"}]
+    assert len(cache) == 0
+
+
+def test_single_row_without_number_cached():
+    cache = RowCache()
+    scraper = _scraper(cache, auto_split_length=1)
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[{"name": "Ahsoka"}]'
+        )
+        scraper.scrape(_page("Ahsoka"))
+    assert len(cache) == 1
+
+
+def test_columnar_rows():
+    cache = RowCache()
+    scraper = SchemaScraper(
+        {"name": "str"},
+        [CSS("li")],
+        auto_split_length=1000,
+        columnar=True,
+        row_cache=cache,
+    )
+    assert '["name", "_row"]' in scraper.system_messages[2]
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[["name", "_row"], ["Rex", 2], ["Ahsoka", 1]]'
+        )
+        result = scraper.scrape(_page("Ahsoka", "Rex"))
+    assert result.data == [{"name": "Ahsoka"}, {"name": "Rex"}]
+    assert len(cache) == 2
+
+
+class Trooper(BaseModel):
+    name: str
+
+
+def test_pydantic_items():
+    scraper = _scraper(RowCache(), Trooper)
+    with patch_create() as create:
+        create.side_effect = _respond
+        scraper.scrape(_page("Rex"))
+        result = scraper.scrape(_page("Rex", "Cody"))
+    assert result.data == [Trooper(name="Rex"), Trooper(name="Cody")]
+
+
+def test_requires_auto_split():
+    with pytest.raises(ValueError):
+        SchemaScraper({"name": "str"}, row_cache=RowCache())
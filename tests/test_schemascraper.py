@@ -1,6 +1,16 @@
+import json
+import threading
+import pytest
 import lxml.html
-from scrapeghost import SchemaScraper, CSS
+from scrapeghost import SchemaScraper, CSS, RelevancePruner
+from scrapeghost.apicall import RetryRule
+from scrapeghost.document import Document
+from scrapeghost.errors import InvalidJSON, PostprocessingError
+from scrapeghost.postprocessors import JSONPostprocessor, HallucinationChecker
+from scrapeghost.responses import ScrapeResponse
+from scrapeghost.scrapers import _partition_schema, _expand_columns
 from scrapeghost.utils import _tostr
+from testutils import patch_create, _mock_response
 
 
 def test_apply_preprocessors_default():
@@ -40,3 +50,398 @@ def test_apply_preprocessors_extra():
     nodes = schema._apply_preprocessors(html, [CSS("span")])
     assert len(nodes) == 3
     assert _tostr(nodes[0]) == "<span>1</span>"
+
+
+def test_keep_parsed_html():
+    html = "<html><body><span>1</span></body></html>"
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(content='{"n": "1"}')
+        kept = SchemaScraper({"n": "str"}).scrape(html)
+        released = SchemaScraper({"n": "str"}, keep_parsed_html=False).scrape(html)
+    assert kept.parsed_html is not None
+    assert released.parsed_html is None
+    assert released.data == {"n": "1"}
+
+
+LIST_HTML = "<html><body><ul><li>1</li><li>2</li><li>3</li></ul></body></html>"
+
+
+def _chunk_scraper(**kwargs):
+    # auto_split_length=1 puts each <li> in its own chunk,
+    # requested one at a time so they get the mocked responses in order
+    kwargs.setdefault("chunk_concurrency", 1)
+    return SchemaScraper(
+        {"n": "str"}, [CSS("li")], auto_split_length=1, retry=RetryRule(0, 0), **kwargs
+    )
+
+
+def _respond_li(**kwargs):
+    # echo the number in each <li>, or invalid JSON for 2
+    n = kwargs["messages"][-1]["content"].split("<li>")[1].split("</li>")[0]
+    content = "not json" if n == "2" else '[{"n": "%s"}]' % n
+    return _mock_response(content=content)
+
+
+def test_auto_split_chunks_concurrent():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def respond(**kwargs):
+        # only returns once all three chunks have been requested
+        barrier.wait()
+        return _respond_li(**kwargs)
+
+    with patch_create() as create:
+        create.side_effect = respond
+        resp = _chunk_scraper(chunk_concurrency=3, allow_partial=True).scrape(LIST_HTML)
+    assert resp.data == [{"n": "1"}, {"n": "3"}]
+    assert resp.errors[0].chunk == 1
+
+
+def test_auto_split_failure_keeps_successful_cost():
+    with patch_create() as create:
+        create.side_effect = _respond_li
+        with pytest.raises(InvalidJSON) as excinfo:
+            _chunk_scraper(chunk_concurrency=3).scrape(LIST_HTML)
+    # every chunk was paid for, including those that succeeded
+    responses = excinfo.value.failed_responses
+    assert sum(r.total_prompt_tokens for r in responses) == create.call_count
+
+
+def test_auto_split_chunk_failure_raises():
+    with patch_create() as create:
+        create.side_effect = [
+            _mock_response(content='[{"n": "1"}]'),
+            _mock_response(content="not json"),
+        ]
+        with pytest.raises(InvalidJSON):
+            _chunk_scraper().scrape(LIST_HTML)
+
+
+def test_auto_split_allow_partial():
+    with patch_create() as create:
+        create.side_effect = [
+            _mock_response(content='[{"n": "1"}]'),
+            _mock_response(content="not json"),
+            _mock_response(content='[{"n": "3"}]'),
+        ]
+        resp = _chunk_scraper(allow_partial=True).scrape(LIST_HTML)
+    assert resp.data == [{"n": "1"}, {"n": "3"}]
+    assert len(resp.errors) == 1
+    assert resp.errors[0].chunk == 1
+    assert isinstance(resp.errors[0].error, InvalidJSON)
+    assert resp.total_prompt_tokens == create.call_count
+
+
+def test_auto_split_chunk_retries():
+    with patch_create() as create:
+        create.side_effect = [
+            _mock_response(content='[{"n": "1"}]'),
+            _mock_response(content="not json"),
+            _mock_response(content='[{"n": "3"}]'),
+            _mock_response(content='[{"n": "2"}]'),
+        ]
+        resp = _chunk_scraper(chunk_retries=1).scrape(LIST_HTML)
+    # retried chunk is returned in document order
+    assert resp.data == [{"n": "1"}, {"n": "2"}, {"n": "3"}]
+    assert resp.errors == []
+    assert create.call_count == 4
+    # including the failed attempt
+    assert resp.total_prompt_tokens == 4
+
+
+def test_auto_split_split_failed_chunks():
+    scraper = _chunk_scraper(chunk_retries=1, split_failed_chunks=True)
+    doc = lxml.html.fromstring(LIST_HTML)
+    page = Document(doc.xpath("//li"))
+    with patch_create() as create:
+        create.side_effect = [
+            _mock_response(content="not json"),
+            _mock_response(content='[{"n": "1"}]'),
+            _mock_response(content='[{"n": "2"}, {"n": "3"}]'),
+        ]
+        sr = scraper._scrape_chunks(ScrapeResponse(parsed_html=doc), page, [page.nodes])
+    assert sr.data == [{"n": "1"}, {"n": "2"}, {"n": "3"}]
+    # the failed attempt is still paid for
+    assert sr.total_prompt_tokens == create.call_count == 3
+    assert len(sr.api_responses) == 3
+    assert create.call_args_list[1].kwargs["messages"][-1]["content"] == "<li>1</li>"
+
+
+def test_adaptive_split_bisects_on_bad_stop():
+    scraper = _chunk_scraper(adaptive_split=True)
+    doc = lxml.html.fromstring(LIST_HTML)
+    page = Document(doc.xpath("//li"))
+    with patch_create() as create:
+        create.side_effect = [
+            _mock_response(finish_reason="length"),
+            _mock_response(content='[{"n": "1"}]'),
+            _mock_response(finish_reason="length"),
+            _mock_response(content='[{"n": "2"}]'),
+            _mock_response(content='[{"n": "3"}]'),
+        ]
+        sr = scraper._scrape_chunks(ScrapeResponse(parsed_html=doc), page, [page.nodes])
+    assert sr.data == [{"n": "1"}, {"n": "2"}, {"n": "3"}]
+    # including the truncated responses
+    assert sr.total_prompt_tokens == create.call_count == 5
+    # never retried the same input or upgraded the model
+    assert all(
+        call.kwargs["model"] == "gpt-3.5-turbo" for call in create.call_args_list
+    )
+
+
+def test_adaptive_split_chunk_length():
+    scraper = SchemaScraper(
+        {"n": "str"},
+        auto_split_length=2000,
+        adaptive_split=True,
+        models=["gpt-4"],
+        model_params={"max_tokens": 1000},
+    )
+    assert scraper._chunk_length() == 2000
+
+    scraper._learn_output_ratio(
+        ScrapeResponse(total_prompt_tokens=1000, total_completion_tokens=1000)
+    )
+    assert scraper.output_ratio == 1
+    assert scraper._chunk_length() == 750
+
+    scraper._learn_output_ratio(
+        ScrapeResponse(total_prompt_tokens=1000, total_completion_tokens=0)
+    )
+    assert scraper.output_ratio == pytest.approx(0.7)
+    assert scraper._chunk_length() == 1071
+
+
+def test_apply_preprocessors_fused():
+    html = lxml.html.fromstring(
+        "<html><body><section><span>1</span><span>2</span></section>"
+        "<span>3</span></body></html>"
+    )
+    scraper = SchemaScraper({}, [CSS("section"), CSS("span")], fuse_selectors=True)
+    nodes = scraper._apply_preprocessors(html, [])
+    assert [_tostr(n) for n in nodes] == ["<span>1</span>", "<span>2</span>"]
+    assert len(scraper._fused[1]) == 2
+
+
+def test_stream_selector_validated():
+    assert SchemaScraper({}, stream_selector="table.results").streaming
+    with pytest.raises(ValueError):
+        SchemaScraper({}, stream_selector="div > table")
+
+
+def test_prune_tokens():
+    scraper = SchemaScraper({"name": "str", "phones": ["str"]}, prune_tokens=500)
+    pruner = scraper.preprocessors[-1]
+    assert isinstance(pruner, RelevancePruner)
+    assert pruner.keywords == {"name", "phones"}
+    assert pruner.repeated
+    # class default is not modified
+    assert len(SchemaScraper._default_preprocessors) == 1
+
+
+def test_scraper_does_not_modify_arguments():
+    model_params = {"top_p": 0.5}
+    postprocessors = []
+    extra = [CSS("p")]
+    scraper = SchemaScraper(
+        {}, extra, model_params=model_params, postprocessors=postprocessors
+    )
+    scraper.preprocessors.append(CSS("span"))
+    scraper.postprocessors.append(lambda r, s: r)
+    assert model_params == {"top_p": 0.5}
+    assert scraper.model_params == {"temperature": 0, "top_p": 0.5}
+    assert postprocessors == []
+    assert extra == [extra[0]]
+    assert len(SchemaScraper._default_preprocessors) == 1
+    assert len(SchemaScraper({}).preprocessors) == 1
+
+
+def test_shared_scraper_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def respond(**kwargs):
+        name = kwargs["messages"][-1]["content"].split("<p>")[1].split("<")[0]
+        return _mock_response(
+            content='{"name": "%s"}' % name, prompt_tokens=10, completion_tokens=2
+        )
+
+    scraper = SchemaScraper({"name": "str"}, models=["gpt-3.5-turbo"])
+    pages = [f"<html><body><p>page{i}</p></body></html>" for i in range(50)]
+    with patch_create() as create:
+        create.side_effect = respond
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(scraper.scrape, pages))
+
+    assert [r.data["name"] for r in results] == [f"page{i}" for i in range(50)]
+    stats = scraper.stats()
+    assert stats["total_prompt_tokens"] == 500
+    assert stats["total_completion_tokens"] == 100
+    assert stats["total_cost"] == pytest.approx(sum(r.total_cost for r in results))
+
+
+def _by_model(responses):
+    def respond(**kwargs):
+        return _mock_response(
+            content=responses[kwargs["model"]], prompt_tokens=100, completion_tokens=10
+        )
+
+    return respond
+
+
+def test_cascade_escalates_on_failed_postprocessing():
+    scraper = SchemaScraper(
+        {"name": "str"},
+        models=["gpt-3.5-turbo", "gpt-4"],
+        postprocessors=[JSONPostprocessor(nudge=False), HallucinationChecker()],
+        cascade=True,
+    )
+    with patch_create() as create:
+        create.side_effect = _by_model(
+            {"gpt-3.5-turbo": '{"name": "Zorak"}', "gpt-4": '{"name": "Moltar"}'}
+        )
+        result = scraper.scrape("<html><p>Moltar</p></html>")
+    assert create.call_count == 2
+    assert result.data == {"name": "Moltar"}
+    assert result.model == "gpt-4"
+    # includes the cost of the rejected response
+    assert result.total_prompt_tokens == 200
+    assert result.total_cost == pytest.approx(scraper.stats()["total_cost"])
+    assert scraper.stats()["escalations"] == 1
+
+
+def test_cascade_cheap_model_passes():
+    scraper = SchemaScraper(
+        {"name": "str"}, models=["gpt-3.5-turbo", "gpt-4"], cascade=True
+    )
+    with patch_create() as create:
+        create.side_effect = _by_model({"gpt-3.5-turbo": '{"name": "Moltar"}'})
+        result = scraper.scrape("<html><p>Moltar</p></html>")
+    assert create.call_count == 1
+    assert result.model == "gpt-3.5-turbo"
+
+
+def test_cascade_last_model_fails():
+    scraper = SchemaScraper(
+        {"name": "str"},
+        models=["gpt-3.5-turbo", "gpt-4"],
+        postprocessors=[JSONPostprocessor(nudge=False)],
+        cascade=True,
+    )
+    with patch_create() as create:
+        create.side_effect = _by_model({"gpt-3.5-turbo": "bad", "gpt-4": "worse"})
+        with pytest.raises(InvalidJSON):
+            scraper.scrape("<html><p>Moltar</p></html>")
+    assert create.call_count == 2
+
+
+def test_no_cascade_by_default():
+    scraper = SchemaScraper(
+        {"name": "str"},
+        models=["gpt-3.5-turbo", "gpt-4"],
+        postprocessors=[JSONPostprocessor(nudge=False)],
+    )
+    with patch_create() as create:
+        create.side_effect = _by_model({"gpt-3.5-turbo": "bad", "gpt-4": "{}"})
+        with pytest.raises(InvalidJSON):
+            scraper.scrape("<html><p>Moltar</p></html>")
+    assert create.call_count == 1
+
+
+def test_partition_schema():
+    schema = {"a": "str", "b": ["str"], "c": {"x": "int", "y": "int"}, "d": "int"}
+    groups = _partition_schema(schema, 2)
+    assert len(groups) == 2
+    assert sorted(k for g in groups for k in g) == ["a", "b", "c", "d"]
+    # field order is kept within each group
+    for group in groups:
+        assert list(group) == [k for k in schema if k in group]
+    # never more groups than fields
+    assert len(_partition_schema({"a": "str"}, 4)) == 1
+
+
+def test_schema_groups():
+    def respond(**kwargs):
+        schema = json.loads(kwargs["messages"][0]["content"].split("schema: ")[1])
+        # the second group's output needs repair
+        content = json.dumps({k: k.upper() for k in schema})
+        return _mock_response(content=content.replace("}", ",}"), prompt_tokens=100)
+
+    scraper = SchemaScraper(
+        {"name": "str", "email": "str", "phone": "str", "tags": ["str"]},
+        schema_groups=2,
+    )
+    with patch_create() as create:
+        create.side_effect = respond
+        result = scraper.scrape("<html><p>Moltar</p></html>")
+    assert create.call_count == 2
+    # merged in schema order
+    assert list(result.data) == ["name", "email", "phone", "tags"]
+    assert result.data["phone"] == "PHONE"
+    assert result.total_prompt_tokens == 200
+    assert len(result.api_responses) == 2
+
+
+def test_schema_groups_invalid():
+    with pytest.raises(ValueError):
+        SchemaScraper(["str"], schema_groups=2)
+    with pytest.raises(ValueError):
+        SchemaScraper({"name": "str"}, schema_groups=2, auto_split_length=1000)
+
+
+def test_expand_columns():
+    columns = {"n": "name", "p": "phone"}
+    assert json.loads(
+        _expand_columns('[["p", "n"], ["1", "A"], ["2", "B"]]', columns)
+    ) == [
+        {"phone": "1", "name": "A"},
+        {"phone": "2", "name": "B"},
+    ]
+    # truncated output is repaired
+    assert json.loads(_expand_columns('[["n"], ["A"], ["B', columns)) == [{"name": "A"}]
+    # objects are passed through
+    assert json.loads(_expand_columns('[{"name": "A"}]', columns)) == [{"name": "A"}]
+    with pytest.raises(PostprocessingError):
+        _expand_columns('[["A", "1"]]', columns)
+    # a truncated row is dropped whole, not kept with some of its fields
+    assert json.loads(
+        _expand_columns('[["n", "p"], ["A", "1"], ["B", "2', columns)
+    ) == [{"name": "A", "phone": "1"}]
+    # rows that don't match the header are rejected
+    with pytest.raises(PostprocessingError):
+        _expand_columns('[["n", "p"], ["A", "1"], ["B"]]', columns)
+
+
+def test_columnar():
+    scraper = SchemaScraper(
+        [{"name": "str", "phone": "str"}], columnar={"name": "n", "phone": "p"}
+    )
+    assert '["n", "p"]' in scraper.system_messages[-1]
+    assert "n=name" in scraper.system_messages[-1]
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[["n", "p"], ["Moltar", "555-1234"], ["Zorak", "555-4321"]]'
+        )
+        result = scraper.scrape("<html><p>Moltar</p></html>")
+    assert result.data == [
+        {"name": "Moltar", "phone": "555-1234"},
+        {"name": "Zorak", "phone": "555-4321"},
+    ]
+
+
+def test_columnar_auto_split():
+    scraper = SchemaScraper(
+        {"name": "str"}, [CSS("p")], columnar=True, auto_split_length=1000
+    )
+    with patch_create() as create:
+        create.side_effect = lambda **kwargs: _mock_response(
+            content='[["name"], ["Moltar"]]'
+        )
+        result = scraper.scrape("<html><p>Moltar</p></html>")
+    assert result.data == [{"name": "Moltar"}]
+
+
+def test_columnar_invalid():
+    with pytest.raises(ValueError):
+        SchemaScraper({"name": "str"}, columnar=True)
+    with pytest.raises(ValueError):
+        SchemaScraper([{"name": "str", "id": "int"}], columnar={"name": "x", "id": "x"})
@@ -1,5 +1,7 @@
+import pytest
 import lxml.html
-from scrapeghost import scrapers
+from scrapeghost import document, scrapers, utils
+from scrapeghost.errors import PreprocessorError
 
 
 def test_tostr():
@@ -37,3 +39,100 @@ def test_parse_url():
     url = "https://www.example.com"
     doc = scrapers._parse_url_or_html(url)
     assert doc.tag == "html"
+
+
+def test_stream_html():
+    html = "<html><body><p>  spaced\t out  <b>bold</b>   tail</p></body></html>"
+    doc = scrapers._stream_url_or_html(html)
+    assert (
+        scrapers._tostr(doc)
+        == "<html><body><p> spaced out <b>bold</b> tail</p></body></html>"
+    )
+
+
+def test_stream_html_selector(monkeypatch):
+    monkeypatch.setattr(scrapers, "STREAM_CHUNK_SIZE", 10)
+    html = (
+        "<html><head><title>t</title></head><body><nav><a href='/'>home</a></nav>"
+        "<div><table class='results'><tr><td>1</td></tr></table></div>"
+        "<table><tr><td>ads</td></tr></table>"
+        "<table class='results'><tr><td>2</td></tr></table></body></html>"
+    )
+    doc = scrapers._stream_url_or_html(html, "table.results")
+    assert scrapers._tostr(doc) == (
+        '<html><body><div><table class="results"><tr><td>1</td></tr></table></div>'
+        '<table class="results"><tr><td>2</td></tr></table></body></html>'
+    )
+
+
+def test_stream_html_selector_errors():
+    with pytest.raises(ValueError):
+        scrapers._stream_url_or_html("<p>hi</p>", "div p")
+    with pytest.raises(PreprocessorError):
+        scrapers._stream_url_or_html("<p>hi</p>", "table")
+
+
+@pytest.mark.parametrize(
+    "selector",
+    [
+        "li:nth-child(odd)",
+        "li:nth-of-type(2n)",
+        "li:last-child",
+        "li:first-child",
+        "li:only-child",
+        "li:not(:last-child)",
+        "p:empty",
+        "p:contains('hi')",
+        "div:has(p)",
+    ],
+)
+def test_stream_html_selector_sibling_or_content(selector):
+    # earlier siblings are discarded, and content isn't parsed, when tested
+    with pytest.raises(ValueError):
+        scrapers._stream_url_or_html("<ul><li>1</li><li>2</li></ul>", selector)
+
+
+def test_stream_url_closes_response(monkeypatch):
+    class FakeResponse:
+        headers = {"content-type": "text/html"}
+        closed = False
+
+        def iter_content(self, size):
+            return iter([b"<html><body><p>hi</p></body></html>"])
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.closed = True
+
+    resp = FakeResponse()
+    monkeypatch.setattr(scrapers.requests, "get", lambda url, stream: resp)
+    doc = scrapers._stream_url_or_html("https://example.com")
+    assert doc.xpath("//p")[0].text == "hi"
+    assert resp.closed
+
+
+def test_tag_chunks_estimated(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        document, "_tokens", lambda model, html: calls.append(html) or 5
+    )
+    doc_tags = [lxml.html.fromstring(f"<li>{i:08d}</li>") for i in range(10)]
+    doc = document.Document(doc_tags)
+    # each tag is estimated at 5 tokens, exact counts are only needed
+    # once a chunk is near its limit
+    chunks = scrapers._tag_chunks(
+        doc, doc.nodes, 30, "gpt-4", estimator=utils.TokenEstimator(4)
+    )
+    assert [len(nodes) for nodes in chunks] == [6, 4]
+    assert len(calls) == 3
+
+    # with a wider margin, exact counts start earlier in each chunk
+    calls.clear()
+    doc = document.Document(doc_tags)
+    estimator = utils.TokenEstimator(4)
+    estimator.error = 0.5
+    chunks = scrapers._tag_chunks(doc, doc.nodes, 30, "gpt-4", estimator=estimator)
+    assert [len(nodes) for nodes in chunks] == [6, 4]
+    assert len(calls) == 5
@@ -0,0 +1,59 @@
+import pytest
+import lxml.html
+from scrapeghost import SchemaScraper, serializers
+
+PAGE = lxml.html.fromstring(
+    "<div class='page'><h2 id='t'>Crew</h2>"
+    "<p style='color: red'>The <a href='/moltar'>Moltar</a>  page.</p>"
+    "<ul><li>Zorak</li><li>Brak</li></ul>"
+    "<table><tr><th>Name</th><th>Role</th></tr>"
+    "<tr><td><a href='/zorak'>Zorak</a></td><td>Band | Leader</td></tr>"
+    "<tr><td>Brak</td></tr></table></div>"
+)
+
+
+def test_minimal_html():
+    assert serializers.minimal_html(PAGE) == (
+        '<div><h2>Crew</h2><p>The <a href="/moltar">Moltar</a>  page.</p>'
+        "<ul><li>Zorak</li><li>Brak</li></ul>"
+        "<table><tr><th>Name</th><th>Role</th></tr>"
+        '<tr><td><a href="/zorak">Zorak</a></td><td>Band | Leader</td></tr>'
+        "<tr><td>Brak</td></tr></table></div>"
+    )
+
+
+def test_text():
+    assert serializers.text(PAGE) == (
+        "Crew\n"
+        "The Moltar </moltar> page.\n"
+        "- Zorak\n"
+        "- Brak\n"
+        "| Name | Role\n"
+        "| Zorak </zorak> | Band | Leader\n"
+        "| Brak"
+    )
+
+
+def test_markdown():
+    assert serializers.markdown(PAGE) == (
+        "## Crew\n"
+        "The [Moltar](/moltar) page.\n"
+        "- Zorak\n"
+        "- Brak\n"
+        "| Name | Role |\n"
+        "| --- | --- |\n"
+        "| [Zorak](/zorak) | Band \\| Leader |\n"
+        "| Brak | |"
+    )
+
+
+def test_scraper_serializer():
+    scraper = SchemaScraper({"name": "str"}, serializer="markdown")
+    assert scraper.serialize is serializers.markdown
+    assert scraper.system_messages[0].startswith("For the given text,")
+
+    scraper = SchemaScraper({"name": "str"}, serializer=str)
+    assert scraper.serialize is str
+
+    with pytest.raises(ValueError):
+        SchemaScraper({"name": "str"}, serializer="yaml")
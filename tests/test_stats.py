@@ -0,0 +1,73 @@
+import urllib.request
+import pytest
+from scrapeghost.stats import Histogram, StatsCollector, serve_metrics
+
+
+def test_histogram_percentiles():
+    h = Histogram((1, 2, 4, float("inf")))
+    assert h.percentile(50) is None
+    for value in [0.5] * 50 + [1.5] * 45 + [3] * 4 + [10]:
+        h.observe(value)
+    assert h.count == 100
+    assert h.percentile(50) == pytest.approx(1)
+    assert 1 < h.percentile(95) <= 2
+    assert 2 < h.percentile(99) <= 4
+    # the top bucket is capped at the largest value seen
+    assert h.percentile(100) == 10
+
+
+def test_collector_snapshot():
+    stats = StatsCollector()
+    stats.record_request("gpt-4", 100, 10, 0.5, 2.0, "stop")
+    stats.record_request("gpt-4", 100, 30, 0.5, 2.0, "length")
+    stats.record_request("gpt-3.5-turbo", 100, 10, 0.1, None, "stop")
+    stats.record_cache(True)
+    stats.record_cache(False)
+    stats.record_cache(False)
+    stats.record_retry()
+
+    snapshot = stats.snapshot()
+    assert snapshot["requests"] == 3
+    assert snapshot["total_cost"] == pytest.approx(1.1)
+    assert snapshot["api_time"] == 4.0
+    assert snapshot["tokens_per_second"] == 12.5
+    assert snapshot["retries"] == 1
+    assert snapshot["cache_hit_rate"] == pytest.approx(1 / 3)
+    assert snapshot["by_model"]["gpt-4"] == {
+        "requests": 2,
+        "prompt_tokens": 200,
+        "completion_tokens": 40,
+        "cost": 1.0,
+    }
+    assert snapshot["by_finish_reason"]["stop"] == {"requests": 2, "cost": 0.6}
+    assert snapshot["by_finish_reason"]["length"]["requests"] == 1
+
+
+def test_prometheus_format():
+    stats = StatsCollector()
+    stats.record_request("gpt-4", 100, 10, 0.5, 0.3, "stop")
+    stats.record_request("gpt-4", 100, 10, 0.5, 5, "stop")
+    text = stats.prometheus()
+    lines = text.splitlines()
+    assert "# TYPE scrapeghost_requests_total counter" in lines
+    assert 'scrapeghost_requests_total{model="gpt-4"} 2' in lines
+    assert 'scrapeghost_finish_reason_total{finish_reason="stop"} 2' in lines
+    assert "scrapeghost_retries_total 0" in lines
+    assert "# TYPE scrapeghost_api_latency_seconds histogram" in lines
+    assert 'scrapeghost_api_latency_seconds_bucket{le="0.25"} 0' in lines
+    assert 'scrapeghost_api_latency_seconds_bucket{le="0.5"} 1' in lines
+    assert 'scrapeghost_api_latency_seconds_bucket{le="+Inf"} 2' in lines
+    assert "scrapeghost_api_latency_seconds_count 2" in lines
+
+
+def test_serve_metrics():
+    stats = StatsCollector()
+    stats.record_request("gpt-4", 100, 10, 0.5, 1.0, "stop")
+    server = serve_metrics(stats, port=0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            body = resp.read().decode()
+    finally:
+        server.shutdown()
+    assert body == stats.prometheus()
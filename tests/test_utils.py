@@ -1,3 +1,4 @@
+import math
 import pytest
 from scrapeghost import utils, models
 
@@ -19,3 +20,52 @@ def test_cost_calc(model, pt, ct, total):
 def test_cost_estimate():
     assert utils.cost_estimate("hello" * 1000, "gpt-3.5-turbo") == pytest.approx(0.002)
     assert utils.cost_estimate("hello" * 1000, "gpt-4") == pytest.approx(0.06)
+
+
+def test_token_estimator_calibrate():
+    estimator = utils.TokenEstimator()
+    assert estimator.estimate("x" * 300) == 100
+    estimator.calibrate(4000, 1000)
+    assert estimator.chars_per_token == 4
+    estimator.calibrate(2000, 1000)
+    assert estimator.chars_per_token == 3
+    # implausible samples (e.g. from mocked usage) are clamped
+    estimator.calibrate(100000, 1)
+    assert estimator.chars_per_token <= 6
+    estimator.calibrate(100, 0)
+
+
+def test_token_estimator_margin():
+    estimator = utils.TokenEstimator(4)
+    assert estimator.margin == utils.TOKEN_MARGIN
+    # dense text, e.g. Chinese, at one character per token
+    estimator.calibrate(1000, 1000)
+    assert estimator.margin == 0.75
+    assert estimator.chars_per_token < 4
+    # accurate estimates narrow it again, gradually
+    for _ in range(5):
+        estimator.calibrate(4000, math.ceil(4000 / estimator.chars_per_token))
+    assert utils.TOKEN_MARGIN < estimator.margin < 0.75
+
+
+def test_count_tokens_wider_margin(monkeypatch):
+    monkeypatch.setattr(utils, "_tokens", lambda model, html: 2000)
+    estimator = utils.TokenEstimator(4)
+    estimator.calibrate(1000, 1000)
+    # 500 tokens estimated is under 1000, but not by the observed error
+    assert utils._count_tokens("gpt-4", "x" * 2000, 1000, estimator) == 2000
+
+
+def test_count_tokens_exact_near_limit(monkeypatch):
+    calls = []
+    monkeypatch.setattr(utils, "_tokens", lambda model, html: calls.append(html) or 7)
+    estimator = utils.TokenEstimator(4)
+    # well under the limit, the estimate is used
+    assert utils._count_tokens("gpt-4", "x" * 400, 1000, estimator) == 100
+    assert calls == []
+    # close to it, tokens are counted
+    assert utils._count_tokens("gpt-4", "x" * 3800, 1000, estimator) == 7
+    # over it, tokens are counted rather than rejecting on the estimate
+    assert utils._count_tokens("gpt-4", "x" * 40000, 1000, estimator) == 7
+    assert utils._count_tokens("gpt-4", "x", 1000, None) == 7
+    assert len(calls) == 3
@@ -41,3 +41,22 @@ def _timeout(**kwargs):
 def patch_create():
     p = patch("scrapeghost.apicall.client.chat.completions.create")
     return p
+
+
+def _html(name):
+    return f"<html><body><p>{name}</p></body></html>"
+
+
+def _respond(**kwargs):
+    """
+    Mock create that returns the name in a page from _html,
+    or invalid JSON for pages named "broken".
+    """
+    content = kwargs["messages"][-1]["content"]
+    # nudge requests don't include the page
+    if "<p>" not in content or "broken" in content:
+        return _mock_response(content="not json")
+    name = content.split("<p>")[1].split("</p>")[0]
+    return _mock_response(
+        content='{"name": "%s"}' % name, prompt_tokens=1000, completion_tokens=10
+    )